@@ -0,0 +1,183 @@
+import argparse
+import asyncio
+import contextlib
+import json
+import sys
+import time
+
+import cassette
+import events
+import metrics
+import model_client
+from main import (get_workflow, get_relevance_engine, get_response_cache, get_run_history, build_initial_state,
+                  discard_speculation, use_cassette, add_budget_arguments, budget_from_args, APPROVAL_POLICIES)
+
+
+def read_jobs(path, session_prefix="batch-", default_policy="auto_approve"):
+    """Reads draft jobs from a JSONL file, or from stdin when the path is '-'.
+
+    Each job's session id is derived from its id, draft and approval policy, so re-running the
+    same input resumes it while an edited job starts over.
+    """
+    from checkpoints import draft_session_id
+
+    handle = sys.stdin if path == "-" else open(path, encoding="utf-8")
+    try:
+        jobs = []
+        for line_number, line in enumerate(handle, 1):
+            line = line.strip()
+            if not line:
+                continue
+            job = json.loads(line)
+            if isinstance(job, str):  # A bare JSON string is just a draft
+                job = {"draft": job}
+            job.setdefault("id", str(line_number))
+            if "session_id" not in job:
+                job["session_id"] = draft_session_id(f"{session_prefix}{job['id']}-", job.get("draft"),
+                                                     job.get("approval_policy", default_policy))
+            jobs.append(job)
+        return jobs
+    finally:
+        if handle is not sys.stdin:
+            handle.close()
+
+
+def summarize_result(job, result, elapsed):
+    """Turns a finished session state into the JSON record written for a batch job."""
+    return {
+        "id": job["id"],
+        "session_id": job["session_id"],
+        "status": result["status"],
+        "draft": result["draft"],
+        "character_count": result["character_count"],
+        "content_type": result["content_type"],
+        "iteration_count": result["iteration_count"],
+        "exit_reason": result.get("exit_reason") or "",
+        "best_score": result.get("best_score", 0),
+        "usage": result.get("usage") or {},
+        "versions": result["versions"],
+        "draft_count": result.get("draft_count") or len(result["versions"]) - 1,
+        "editor_feedback": result.get("editor_feedback", ""),
+        "elapsed_seconds": round(elapsed, 3),
+    }
+
+
+def job_initial_state(job, default_policy, default_budget=None, default_persona=None):
+    """Builds the initial session state for a draft job.
+
+    A job's "persona" is either the id of a registered persona or a persona of its own.
+    Raises KeyError for an unknown persona id and ValueError for an invalid persona or budget.
+    """
+    persona = job.get("persona")
+    if persona is not None and not isinstance(persona, (dict, str)):
+        raise ValueError("A job's 'persona' must be a persona id or a persona object")
+    if not isinstance(job.get("budget", {}), dict):
+        raise ValueError("A job's 'budget' must be an object")
+    return build_initial_state(
+        draft=job["draft"],
+        persona=persona if isinstance(persona, dict) else None,
+        persona_id=job.get("persona_id") or (persona if isinstance(persona, str) else default_persona),
+        approval_policy=job.get("approval_policy", default_policy),
+        budget=dict(default_budget or {}, **job.get("budget", {})),
+    )
+
+
+async def run_session(app, job, default_policy, recursion_limit=None, default_budget=None, on_event=None,
+                      default_persona=None):
+    """Runs one draft through the graph without user interaction, resuming it if it was interrupted."""
+    from checkpoints import run_or_resume
+
+    start = time.perf_counter()
+    try:
+        initial_state = job_initial_state(job, default_policy, default_budget, default_persona)
+        result = await run_or_resume(app, initial_state, job["session_id"], recursion_limit, on_event,
+                                     history=get_run_history())
+    except Exception as e:
+        return {"id": job["id"], "session_id": job["session_id"], "status": "error",
+                "error": f"{type(e).__name__}: {e}", "elapsed_seconds": round(time.perf_counter() - start, 3)}
+    finally:
+        discard_speculation(job["session_id"])  # A session that failed mid-review may have left one running
+    return summarize_result(job, result, time.perf_counter() - start)
+
+
+async def run_batch(jobs, output, concurrency=4, default_policy="auto_approve", checkpoint_path=None,
+                    default_budget=None, on_event=None, default_persona=None):
+    """Runs all jobs concurrently and writes each result as a JSON line as soon as it finishes.
+
+    Sessions are checkpointed after every node, so re-running an interrupted batch picks up
+    each job where it stopped and returns finished jobs without calling the model again.
+    """
+    from checkpoints import checkpointed_app
+
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async with checkpointed_app(get_workflow(), checkpoint_path) as app:
+        async def bounded(job):
+            async with semaphore:
+                return await run_session(app, job, default_policy, default_budget=default_budget, on_event=on_event,
+                                         default_persona=default_persona)
+
+        tasks = [asyncio.create_task(bounded(job)) for job in jobs]
+        counts = {}
+        for finished in asyncio.as_completed(tasks):
+            record = await finished
+            counts[record["status"]] = counts.get(record["status"], 0) + 1
+            output.write(json.dumps(record) + "\n")
+            output.flush()
+    return counts
+
+
+def add_arguments(parser):
+    """Adds the batch mode options to an argument parser."""
+    parser.add_argument("input", help="JSONL file with one draft job per line, or '-' for stdin")
+    parser.add_argument("-o", "--output", default="-", help="Where to write JSONL results (default: stdout)")
+    parser.add_argument("-c", "--concurrency", type=int, default=4, help="Number of sessions to run at once")
+    parser.add_argument("--policy", default="auto_approve", choices=sorted(APPROVAL_POLICIES),
+                        help="Approval policy used in place of the user's final approval")
+    parser.add_argument("--session-prefix", default="batch-",
+                        help="Prefix for the checkpoint session id of each job (default: batch-)")
+    parser.add_argument("--persona", metavar="ID", help="Persona for jobs that don't name one (default: the built-in persona)")
+    add_budget_arguments(parser)
+    metrics.add_arguments(parser)
+    model_client.add_arguments(parser)
+    cassette.add_arguments(parser)
+    events.add_arguments(parser)
+
+
+def run(args):
+    """Runs a batch from parsed command line arguments."""
+    jobs = read_jobs(args.input, args.session_prefix, args.policy)
+    # Learn relevance IDF weights once from the whole batch; every session then shares them.
+    get_relevance_engine().fit([job["draft"] for job in jobs])
+    output = sys.stdout if args.output == "-" else open(args.output, "w", encoding="utf-8")
+    metrics.configure(args)
+    model_client.configure(args)
+    recorder = use_cassette(args)
+    sink = events.JsonlSink(args.events) if args.events else None
+    try:
+        # Node progress messages go to stderr so stdout stays valid JSONL.
+        with contextlib.redirect_stdout(sys.stderr):
+            counts = asyncio.run(run_batch(jobs, output, args.concurrency, args.policy,
+                                           default_budget=budget_from_args(args), on_event=sink,
+                                           default_persona=args.persona))
+    finally:
+        metrics.finish(args)
+        get_run_history().close()
+        if recorder is not None:
+            recorder.close()
+        if sink is not None:
+            sink.close()
+        if output is not sys.stdout:
+            output.close()
+    print(f"Processed {len(jobs)} drafts: {counts}", file=sys.stderr)
+    print(f"Response cache: {get_response_cache().stats()}", file=sys.stderr)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Run many status update drafts through the workflow unattended.")
+    add_arguments(parser)
+    run(parser.parse_args(argv))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,381 @@
+import argparse
+import asyncio
+import contextlib
+import io
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+import tracemalloc
+
+import metrics
+import model_client
+from main import (get_relevance_engine, set_client, set_response_cache, set_content_classifier, set_run_history,
+                  add_budget_arguments, budget_from_args, APPROVAL_POLICIES)
+from batch import read_jobs, run_batch
+from cassette import ReplayClient
+from fake_backend import FakeModel, FILLER_WORDS, fake_client
+from response_cache import ResponseCache
+from run_history import RunHistory
+
+# Openings that turn a synthetic draft into a first-person, personal one.
+PERSONAL_OPENERS = ("I spent my weekend on", "My team and I keep arguing about", "I finally tried",
+                    "Honestly, I think my take on")
+
+NODES = ("user", "content_classifier", "writer", "relevance_assessor", "editor", "review", "finalize")
+
+
+def percentile(values, fraction):
+    """Returns the nearest-rank percentile of a list of numbers, or 0.0 for an empty list."""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = max(0, min(len(ordered) - 1, int(round(fraction * len(ordered) + 0.5)) - 1))
+    return ordered[index]
+
+
+def synthetic_jobs(count, seed=0, personal_rate=0.2):
+    """Builds draft jobs of filler text, the same for a given count and seed.
+
+    A personal_rate fraction of them start in the first person, which the fake model classifies as personal.
+    """
+    rng = random.Random(seed)
+    personal_rng = random.Random(f"{seed}:personal")
+    jobs = []
+    for i in range(1, count + 1):
+        words = [rng.choice(FILLER_WORDS) for _ in range(rng.randint(30, 60))]
+        draft = " ".join(words).capitalize() + "."
+        if personal_rng.random() < personal_rate:
+            draft = f"{personal_rng.choice(PERSONAL_OPENERS)} {draft[0].lower()}{draft[1:]}"
+        jobs.append({"id": str(i), "session_id": f"bench-{i}", "draft": draft})
+    return jobs
+
+
+def parse_weights(text):
+    """Parses "3:0.4,4:0.6" into {3: 0.4, 4: 0.6}."""
+    weights = {}
+    for pair in text.split(","):
+        score, weight = pair.split(":")
+        weights[int(score)] = float(weight)
+    return weights
+
+
+def build_client(args):
+    """Builds the model client for one benchmark level: a cassette replay, or the fake model."""
+    if args.replay:
+        return ReplayClient(args.replay)
+    return fake_client(build_model(args))
+
+
+def build_model(args):
+    """Builds the fake model described by the benchmark options."""
+    script = None
+    if args.script:
+        with open(args.script, encoding="utf-8") as handle:
+            script = json.load(handle)
+    return FakeModel(
+        seed=args.seed,
+        latency=args.latency,
+        latency_jitter=args.latency_jitter,
+        rate_limit_rate=args.rate_limit_rate,
+        malformed_rate=args.malformed_rate,
+        error_rate=args.error_rate,
+        slow_rate=args.slow_rate,
+        slow_latency=args.slow_latency,
+        editor_scores=parse_weights(args.editor_scores) if args.editor_scores else None,
+        script=script,
+    )
+
+
+def deep_size(value, seen=None):
+    """Returns the bytes held by an object and everything it references, counting shared objects once."""
+    seen = set() if seen is None else seen
+    if id(value) in seen:
+        return 0
+    seen.add(id(value))
+    size = sys.getsizeof(value)
+    if isinstance(value, dict):
+        size += sum(deep_size(key, seen) + deep_size(item, seen) for key, item in value.items())
+    elif isinstance(value, (list, tuple, set, frozenset)):
+        size += sum(deep_size(item, seen) for item in value)
+    elif hasattr(value, "__dict__"):
+        size += deep_size(vars(value), seen)
+    return size
+
+
+async def measure_states(checkpoint_path, session_ids):
+    """Returns the mean in-memory size of the sessions' final states, as loaded from their checkpoints."""
+    from checkpoints import checkpointed_app, session_config
+    from main import get_workflow
+
+    async with checkpointed_app(get_workflow(), checkpoint_path) as app:
+        sizes = [deep_size((await app.aget_state(session_config(session_id))).values) for session_id in session_ids]
+    return sum(sizes) / max(1, len(sizes))
+
+
+async def measure_memory(jobs, checkpoint_path, concurrency, peak, single_peak):
+    """Builds the memory report for one level: peak in-flight memory, final state size and checkpoint size.
+
+    The traced peak of a run includes overhead that doesn't grow with the sessions in flight
+    (the event loop, the graph, the model client), so the per-session peak is the slope
+    between a run of one session (single_peak) and this level's run. It is None at concurrency
+    1. The final state and checkpoint sizes are averaged over all sessions.
+    """
+    checkpoint_bytes = sum(os.path.getsize(path) for path in (checkpoint_path, checkpoint_path + "-wal")
+                           if os.path.exists(path))
+    in_flight = min(concurrency, len(jobs))
+    return {
+        "peak_bytes_per_session": round((peak - single_peak) / (in_flight - 1)) if in_flight > 1 else None,
+        "peak_bytes_single_session": round(single_peak),
+        "state_bytes_per_session": round(await measure_states(checkpoint_path, [job["session_id"] for job in jobs])),
+        "checkpoint_bytes_per_session": round(checkpoint_bytes / len(jobs)),
+    }
+
+
+async def run_level(jobs, client, concurrency, policy, checkpoint_path, budget=None):
+    """Runs every job once at the given concurrency and returns the batch records and wall time."""
+    set_client(client)
+    output = io.StringIO()
+    started = time.perf_counter()
+    await run_batch(jobs, output, concurrency, policy, checkpoint_path=checkpoint_path, default_budget=budget)
+    wall = time.perf_counter() - started
+    return [json.loads(line) for line in output.getvalue().splitlines()], wall
+
+
+def summarize_level(concurrency, records, wall):
+    """Builds the report for one concurrency level from its batch records and the metrics registry."""
+    outcomes = {}
+    for record in records:
+        outcomes[record["status"]] = outcomes.get(record["status"], 0) + 1
+    exit_reasons = {}
+    for record in records:
+        if record.get("exit_reason"):
+            exit_reasons[record["exit_reason"]] = exit_reasons.get(record["exit_reason"], 0) + 1
+    errors = {}
+    for record in records:
+        if record["status"] == "error":
+            kind = record["error"].split(":", 1)[0]
+            errors[kind] = errors.get(kind, 0) + 1
+    latencies = [record["elapsed_seconds"] for record in records]
+    drafts = [record["draft_count"] for record in records if record["status"] == "approved"]
+
+    node_time = {}
+    for labels, total, count in metrics.histogram_totals("threads_node_duration_seconds"):
+        node_time[labels["node"]] = {"seconds": round(total, 6), "runs": count}
+    for node, entry in node_time.items():
+        entry["model_calls"] = metrics.counter_total("threads_api_calls_total", node=node, outcome="ok")
+        entry["prompt_tokens"] = metrics.counter_total("threads_api_tokens_total", node=node, kind="prompt")
+        entry["response_tokens"] = metrics.counter_total("threads_api_tokens_total", node=node, kind="response")
+    node_runs = [(total, count) for _, total, count in metrics.histogram_totals("threads_session_node_runs")]
+
+    return {
+        "concurrency": concurrency,
+        "sessions": len(records),
+        "wall_seconds": round(wall, 3),
+        "sessions_per_second": round(len(records) / wall, 3) if wall else 0.0,
+        "outcomes": outcomes,
+        "exit_reasons": exit_reasons,
+        "errors": errors,
+        "latency_seconds": {
+            "p50": percentile(latencies, 0.50),
+            "p90": percentile(latencies, 0.90),
+            "p99": percentile(latencies, 0.99),
+            "max": max(latencies, default=0.0),
+        },
+        "drafts_to_approval": {
+            "mean": round(sum(drafts) / len(drafts), 3) if drafts else 0.0,
+            "p50": percentile(drafts, 0.50),
+            "p90": percentile(drafts, 0.90),
+            "max": max(drafts, default=0),
+        },
+        "node_runs_per_session": round(sum(t for t, _ in node_runs) / max(1, sum(c for _, c in node_runs)), 3),
+        "node_time": node_time,
+        "model_calls": metrics.counter_total("threads_api_calls_total", outcome="ok"),
+        "cache_hits": metrics.counter_total("threads_api_calls_total", outcome="cache_hit"),
+        "retries": metrics.counter_total("threads_api_retries_total"),
+        "failures": metrics.counter_totals("threads_api_failures_total", "error"),
+        "hedges": metrics.counter_totals("threads_api_hedges_total", "outcome"),
+        "circuit_opens": metrics.counter_total("threads_circuit_opened_total"),
+        "json_repairs": metrics.counter_total("threads_json_repairs_total"),
+        "classified_locally": metrics.counter_total("threads_classifier_decisions_total", source="local"),
+        "classified_by_llm": metrics.counter_total("threads_classifier_decisions_total", source="llm"),
+        "json_parse_failures": metrics.counter_total("threads_events_total", kind="json_parse_failure"),
+        "speculations": metrics.counter_totals("threads_speculations_total", "outcome"),
+    }
+
+
+def format_level(report):
+    """Formats one concurrency level's report for the terminal."""
+    latency = report["latency_seconds"]
+    drafts = report["drafts_to_approval"]
+    outcomes = ", ".join(f"{status}={count}" for status, count in sorted(report["outcomes"].items()))
+    lines = [
+        f"Concurrency {report['concurrency']}: {report['sessions']} sessions in {report['wall_seconds']:.2f}s "
+        f"({report['sessions_per_second']:.1f} sessions/s)",
+        f"  outcomes: {outcomes}",
+        f"  session latency: p50 {latency['p50']:.3f}s  p90 {latency['p90']:.3f}s  "
+        f"p99 {latency['p99']:.3f}s  max {latency['max']:.3f}s",
+        f"  drafts to approval: mean {drafts['mean']:.2f}  p50 {drafts['p50']}  p90 {drafts['p90']}  max {drafts['max']}",
+        f"  node runs per session: {report['node_runs_per_session']:.1f}",
+    ]
+    if "memory" in report:
+        memory = report["memory"]
+        peak = memory["peak_bytes_per_session"]
+        lines.append(f"  memory per session: peak {'-' if peak is None else f'{peak / 1024:.1f}'} KiB "
+                     f"per extra session in flight ({memory['peak_bytes_single_session'] / 1024:.1f} KiB for one), "
+                     f"final state {memory['state_bytes_per_session'] / 1024:.1f} KiB, "
+                     f"checkpoints {memory['checkpoint_bytes_per_session'] / 1024:.1f} KiB")
+    lines += [
+        f"  model calls: {report['model_calls']} ({report['retries']} retries, {report['cache_hits']} cache hits, "
+        f"{report['json_repairs']} JSON repairs, {report['json_parse_failures']} JSON parse failures)",
+        f"  content classified: {report['classified_locally']} locally, {report['classified_by_llm']} by the LLM",
+    ]
+    if report["failures"] or report["hedges"]:
+        lines.append("  failed attempts: " + (", ".join(f"{kind}={count}" for kind, count in sorted(report["failures"].items()))
+                                              or "none")
+                     + f"; circuit opened {report['circuit_opens']} times; hedges: "
+                     + (", ".join(f"{outcome}={count}" for outcome, count in sorted(report["hedges"].items())) or "none"))
+    if report["speculations"]:
+        speculations = report["speculations"]
+        lines.append(f"  speculative revisions: {speculations.get('started', 0)} started, {speculations.get('used', 0)} used, "
+                     f"{speculations.get('discarded', 0)} discarded, {speculations.get('skipped', 0)} skipped for quota, "
+                     f"{speculations.get('failed', 0)} failed")
+    if report["exit_reasons"]:
+        lines.append("  stopped early: " + ", ".join(f"{reason}={count}"
+                                                   for reason, count in sorted(report["exit_reasons"].items())))
+    if report["errors"]:
+        lines.append("  errors: " + ", ".join(f"{kind}={count}" for kind, count in sorted(report["errors"].items())))
+    total = sum(entry["seconds"] for entry in report["node_time"].values()) or 1.0
+    for node in NODES:
+        entry = report["node_time"].get(node)
+        if entry:
+            line = (f"  {node:<20} {entry['seconds']:8.3f}s {100 * entry['seconds'] / total:5.1f}%  "
+                    f"{entry['runs']} runs, {entry['seconds'] / entry['runs'] * 1000:.1f}ms each")
+            if entry.get("model_calls"):
+                line += (f", {entry['model_calls']} calls, {entry['prompt_tokens']} prompt + "
+                         f"{entry['response_tokens']} response tokens")
+            lines.append(line)
+    return "\n".join(lines)
+
+
+def reset_level(args):
+    """Starts a benchmark run from fresh metrics, an empty response cache and an untrained classifier."""
+    from classifier import ContentClassifier  # Loads scikit-learn, so not for the other subcommands
+
+    metrics.reset()
+    set_response_cache(ResponseCache(":memory:"))
+    classifier = ContentClassifier(path=None)  # Every level starts without labels
+    classifier.enabled = not args.replay  # A replay has to make exactly the recorded calls
+    set_content_classifier(classifier)
+    set_run_history(RunHistory(":memory:"))  # Benchmark sessions stay out of the real run history
+
+
+async def traced_run(jobs, args, concurrency, checkpoint_path):
+    """Runs a level with allocation tracing. Returns (records, wall time, peak bytes).
+
+    What is still allocated at the end (modules imported on first use, cached responses)
+    isn't held by the sessions in flight, so the peak is counted above it.
+    """
+    client = build_client(args)
+    tracemalloc.start()
+    try:
+        records, wall = await run_level(jobs, client, concurrency, args.policy, checkpoint_path,
+                                        budget_from_args(args))
+        current, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return records, wall, peak - current
+
+
+async def run_benchmark(jobs, args):
+    """Runs the jobs at every requested concurrency level and returns one report per level.
+
+    Every level starts from fresh metrics, an empty response cache and new checkpoints, and
+    the fake model's responses depend only on the seed, session and node, so all levels see
+    the same drafts and scores and differ only in how the sessions overlap. With --memory,
+    allocations are traced during each level, and each level first runs its first job alone
+    as the one-session baseline, which slows it down.
+    """
+    reports = []
+    with tempfile.TemporaryDirectory() as scratch:
+        for level in args.concurrency:
+            checkpoint_path = os.path.join(scratch, f"checkpoints-{level}.sqlite3")
+            with contextlib.redirect_stdout(io.StringIO()):  # Node progress messages are not part of the report
+                if args.memory:
+                    reset_level(args)
+                    _, _, single_peak = await traced_run(jobs[:1], args, 1,
+                                                         os.path.join(scratch, f"baseline-{level}.sqlite3"))
+                    reset_level(args)
+                    records, wall, peak = await traced_run(jobs, args, level, checkpoint_path)
+                else:
+                    reset_level(args)
+                    records, wall = await run_level(jobs, build_client(args), level, args.policy, checkpoint_path,
+                                                    budget_from_args(args))
+            report = summarize_level(level, records, wall)
+            if args.memory:
+                report["memory"] = await measure_memory(jobs, checkpoint_path, level, peak, single_peak)
+            reports.append(report)
+    return reports
+
+
+def add_arguments(parser):
+    """Adds the benchmark options to an argument parser."""
+    parser.add_argument("-n", "--sessions", type=int, default=50, help="Number of synthetic drafts to run (default: 50)")
+    parser.add_argument("--drafts", metavar="PATH", help="JSONL draft jobs to run instead of synthetic drafts")
+    parser.add_argument("--replay", metavar="CASSETTE",
+                        help="answer model calls from a cassette recorded with 'batch --record' on the same --drafts")
+    parser.add_argument("-c", "--concurrency", type=lambda text: [int(level) for level in text.split(",")],
+                        default=[1, 4, 16], help="Comma-separated concurrency levels (default: 1,4,16)")
+    parser.add_argument("--policy", default="auto_approve", choices=sorted(APPROVAL_POLICIES),
+                        help="Approval policy used in place of the user's final approval")
+    parser.add_argument("--seed", type=int, default=0, help="Seed for the drafts and the fake model's responses")
+    parser.add_argument("--latency", type=float, default=0.05, help="Mean fake model latency in seconds (default: 0.05)")
+    parser.add_argument("--latency-jitter", type=float, default=0.0, help="Standard deviation of the fake latency")
+    parser.add_argument("--rate-limit-rate", type=float, default=0.0, help="Fraction of calls that report a rate limit")
+    parser.add_argument("--malformed-rate", type=float, default=0.0, help="Fraction of responses with broken JSON")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Fraction of calls that fail with a server error")
+    parser.add_argument("--slow-rate", type=float, default=0.0,
+                        help="Fraction of calls stuck in the backend's tail for --slow-latency seconds")
+    parser.add_argument("--slow-latency", type=float, default=2.0, help="Latency of a slow call (default: 2.0)")
+    parser.add_argument("--editor-scores", metavar="WEIGHTS",
+                        help='Editor score distribution, e.g. "2:0.1,3:0.4,4:0.35,5:0.15"')
+    parser.add_argument("--script", metavar="PATH",
+                        help="JSON file mapping node names to the responses the fake model returns in order")
+    parser.add_argument("--memory", action="store_true",
+                        help="Also report memory per session: traced peak, final state and checkpoint size")
+    parser.add_argument("--json", metavar="PATH", help="Also write the report as JSON to PATH")
+    add_budget_arguments(parser)
+    model_client.add_arguments(parser)
+
+
+def run(args):
+    """Runs the benchmark from parsed command line arguments and prints the report."""
+    model_client.configure(args)
+    jobs = read_jobs(args.drafts, default_policy=args.policy) if args.drafts else synthetic_jobs(args.sessions, args.seed)
+    # Fitting also loads scikit-learn up front, so its import time doesn't land in the first session.
+    get_relevance_engine().fit([job["draft"] for job in jobs])
+    if args.replay:
+        print(f"Benchmarking {len(jobs)} sessions replayed from {args.replay}\n")
+    else:
+        print(f"Benchmarking {len(jobs)} sessions against the fake model (latency {args.latency}s, "
+              f"rate limits {args.rate_limit_rate:.0%}, server errors {args.error_rate:.0%}, "
+              f"slow calls {args.slow_rate:.0%}, malformed JSON {args.malformed_rate:.0%})\n")
+    reports = asyncio.run(run_benchmark(jobs, args))
+    for report in reports:
+        print(format_level(report) + "\n")
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as handle:
+            json.dump({"settings": vars(args),
+                       "levels": reports}, handle, indent=2)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the workflow offline against a fake model.")
+    add_arguments(parser)
+    run(parser.parse_args(argv))
+
+
+if __name__ == "__main__":
+    main()
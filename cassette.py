@@ -0,0 +1,202 @@
+import difflib
+import hashlib
+import json
+import os
+import threading
+import time
+
+import metrics
+from model_client import estimate_tokens, call_deadline, CallFailed, DeadlineExceeded
+
+CASSETTE_VERSION = 1
+
+
+class PromptDriftError(RuntimeError):
+    """A replayed session sent a prompt the cassette doesn't have a response for."""
+
+
+def _hash(text):
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+class RecordingClient:
+    """Wraps a model client and appends every prompt, response and latency to a cassette file.
+
+    Calls are numbered per session and node, so a cassette recorded from concurrent sessions
+    replays the same way however they interleave. Recording into an existing cassette continues
+    its numbering, so resumed sessions keep adding to it. Calls that ran out of time or retries
+    are recorded with their error, which replay raises again, since the nodes carry on from
+    them; any other error ends the session and isn't recorded.
+    """
+
+    def __init__(self, client, path):
+        self.client = client
+        self.path = path
+        self.counts = {}  # (session, node) -> calls recorded so far
+        self.prefixes = set()
+        self._lock = threading.Lock()
+        new = not os.path.exists(path) or os.path.getsize(path) == 0
+        if not new:
+            for entry in read_cassette(path):
+                if entry["type"] == "prefix":
+                    self.prefixes.add(entry["sha256"])
+                elif entry["type"] == "call":
+                    key = (entry["session"], entry["node"])
+                    self.counts[key] = max(self.counts.get(key, 0), entry["seq"] + 1)
+        self._file = open(path, "a", encoding="utf-8")
+        if new:
+            self._write({"type": "cassette", "version": CASSETTE_VERSION, "created": time.time()})
+
+    def _write(self, entry):
+        with self._lock:
+            self._file.write(json.dumps(entry) + "\n")
+            self._file.flush()
+
+    async def generate(self, prompt, prefix="", on_text=None, schema=None, settings=None, speculative=False):
+        started = time.perf_counter()
+        call = {"prompt": prompt, "model": (settings or {}).get("model", "")}
+        try:
+            response, usage = await self.client.generate(prompt, prefix=prefix, on_text=on_text, schema=schema,
+                                                         settings=settings, speculative=speculative)
+        except (DeadlineExceeded, CallFailed) as e:
+            call.update(error="deadline" if isinstance(e, DeadlineExceeded) else "failed", message=str(e))
+            self._record(prefix, call, started)
+            raise
+        call.update(response=response, usage=usage)
+        self._record(prefix, call, started)
+        return response, usage
+
+    def _record(self, prefix, call, started):
+        """Writes a finished call, numbering it only now so calls that end the session leave no gap."""
+        latency = time.perf_counter() - started
+        key = (metrics.current_session.get(), metrics.current_node.get())
+        seq = self.counts.get(key, 0)
+        self.counts[key] = seq + 1
+        prefix_hash = _hash(prefix)
+        if prefix and prefix_hash not in self.prefixes:
+            self.prefixes.add(prefix_hash)
+            self._write({"type": "prefix", "sha256": prefix_hash, "text": prefix})
+        self._write(dict({"type": "call", "session": key[0], "node": key[1], "seq": seq, "prefix": prefix_hash,
+                          "latency": round(latency, 6)}, **call))
+
+    def close(self):
+        self._file.close()
+
+
+class ReplayClient:
+    """Serves responses from a cassette without calling the model, at full local speed.
+
+    A live session is matched to the recorded session with the same id, or else to the next
+    recorded session that hasn't been claimed yet, in recording order; this lets an interactive
+    run, which gets a new session id each time, replay its recording. Any prompt that differs
+    from the recorded one raises PromptDriftError with a diff of the two.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.calls = {}  # (recorded session, node, seq) -> entry
+        self.prefixes = {}  # sha256 -> prefix text
+        self.sessions = []  # Recorded session ids in recording order
+        for entry in read_cassette(path):
+            if entry["type"] == "prefix":
+                self.prefixes[entry["sha256"]] = entry["text"]
+            elif entry["type"] == "call":
+                self.calls[(entry["session"], entry["node"], entry["seq"])] = entry
+                if entry["session"] not in self.sessions:
+                    self.sessions.append(entry["session"])
+        self.session_map = {}  # live session -> recorded session
+        self.counts = {}  # (live session, node) -> calls replayed so far
+        self.recorded_latency = 0.0
+
+    def _recorded_session(self, session):
+        if session not in self.session_map:
+            claimed = set(self.session_map.values())
+            if session in self.sessions and session not in claimed:
+                self.session_map[session] = session
+            else:
+                unclaimed = [recorded for recorded in self.sessions if recorded not in claimed]
+                if not unclaimed:
+                    raise PromptDriftError(f"The cassette {self.path} has no recorded session left for '{session}'")
+                self.session_map[session] = unclaimed[0]
+        return self.session_map[session]
+
+    async def generate(self, prompt, prefix="", on_text=None, schema=None, settings=None, speculative=False):
+        session, node = metrics.current_session.get(), metrics.current_node.get()
+        seq = self.counts.get((session, node), 0)
+        self.counts[(session, node)] = seq + 1
+        recorded = self._recorded_session(session)
+        entry = self.calls.get((recorded, node, seq))
+        if entry is None:
+            raise PromptDriftError(
+                f"The cassette {self.path} has no call {seq + 1} from node '{node}' in session '{recorded}'. "
+                "The workflow made more calls than when it was recorded."
+            )
+        if entry["prefix"] != _hash(prefix):
+            raise PromptDriftError(
+                f"The prompt prefix of call {seq + 1} from node '{node}' in session '{recorded}' differs from "
+                f"the recording in {self.path}:\n{_diff(self.prefixes.get(entry['prefix'], ''), prefix)}"
+            )
+        if entry["prompt"] != prompt:
+            raise PromptDriftError(
+                f"The prompt of call {seq + 1} from node '{node}' in session '{recorded}' differs from "
+                f"the recording in {self.path}:\n{_diff(entry['prompt'], prompt)}"
+            )
+        self.recorded_latency += entry["latency"]
+        if entry.get("error") == "deadline":
+            deadline = call_deadline.get()
+            raise deadline.expire() if deadline is not None else DeadlineExceeded(entry["message"])
+        if entry.get("error"):
+            raise CallFailed(entry["message"])
+        response = entry["response"]
+        if on_text is not None:
+            on_text(response)
+        # Cassettes recorded before usage was stored get estimates.
+        usage = entry.get("usage") or {"prompt_tokens": estimate_tokens(prefix + prompt),
+                                       "response_tokens": estimate_tokens(response)}
+        metrics.record_api_call(0.0, 0.0, usage["prompt_tokens"], usage["response_tokens"], 1,
+                                model=entry.get("model", ""))
+        if usage.get("queue_seconds"):
+            usage = dict(usage, queue_seconds=0.0)  # Replay never waits for the rate limiter
+        return response, usage
+
+    def close(self):
+        pass
+
+
+def _diff(recorded, replayed, max_lines=40):
+    lines = list(difflib.unified_diff(recorded.splitlines(), replayed.splitlines(),
+                                      "recorded", "replayed", lineterm="", n=1))
+    if len(lines) > max_lines:
+        lines = lines[:max_lines] + [f"... ({len(lines) - max_lines} more diff lines)"]
+    return "\n".join(lines)
+
+
+def read_cassette(path):
+    """Reads the entries of a cassette file."""
+    with open(path, encoding="utf-8") as handle:
+        entries = [json.loads(line) for line in handle if line.strip()]
+    if entries and entries[0].get("type") == "cassette" and entries[0].get("version") != CASSETTE_VERSION:
+        raise ValueError(f"{path} is a version {entries[0].get('version')} cassette; "
+                         f"this version reads version {CASSETTE_VERSION}")
+    return entries
+
+
+def add_arguments(parser):
+    """Adds the record and replay options to an argument parser."""
+    group = parser.add_mutually_exclusive_group()
+    group.add_argument("--record", metavar="CASSETTE",
+                       help="record every model call (prompt, response, latency) to a cassette file")
+    group.add_argument("--replay", metavar="CASSETTE",
+                       help="answer model calls from a cassette instead of Gemini; fails if a prompt differs")
+
+
+def client_from_args(args, live_client):
+    """Returns the recording or replaying client requested on the command line, or None.
+
+    live_client is called to get the real model client only when recording.
+    """
+    if getattr(args, "record", None):
+        return RecordingClient(live_client(), args.record)
+    if getattr(args, "replay", None):
+        return ReplayClient(args.replay)
+    return None
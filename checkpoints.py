@@ -0,0 +1,135 @@
+import contextlib
+import hashlib
+import json
+import os
+import time
+import uuid
+
+from langgraph.checkpoint.sqlite.aio import AsyncSqliteSaver
+
+import metrics
+
+# Every session is checkpointed here after each node, keyed by its session id.
+CHECKPOINT_PATH = os.environ.get("THREADS_CHECKPOINT_PATH", "checkpoints.sqlite3")
+
+
+def new_session_id():
+    """Returns a short random id for a new session."""
+    return uuid.uuid4().hex[:12]
+
+
+def draft_session_id(prefix, draft, approval_policy):
+    """Returns the session id for running a draft under an approval policy.
+
+    The id ends with a hash of the draft and policy, so re-running the same job resumes its
+    session while a job whose draft or policy changed starts a session of its own.
+    """
+    digest = hashlib.sha256(json.dumps([draft, approval_policy]).encode("utf-8")).hexdigest()
+    return f"{prefix}{digest[:12]}"
+
+
+def session_config(session_id, recursion_limit=None):
+    """Returns the graph config that ties a run to a session's checkpoints."""
+    config = {"configurable": {"thread_id": session_id}}
+    if recursion_limit is not None:
+        config["recursion_limit"] = recursion_limit
+    return config
+
+
+@contextlib.asynccontextmanager
+async def checkpointed_app(workflow, path=None):
+    """Compiles the workflow with an SQLite checkpointer that stays open for the block."""
+    async with AsyncSqliteSaver.from_conn_string(path or CHECKPOINT_PATH) as saver:
+        yield workflow.compile(checkpointer=saver)
+
+
+async def stream_session(app, initial_state, session_id, recursion_limit=None, resume=None, history=None):
+    """Runs or resumes a session like run_or_resume(), yielding its events as they happen.
+
+    Yields node_started and node_finished events and the text the writer and editor stream
+    (see events.py). The last event is session_finished, carrying the final state, or
+    approval_requested, carrying the state and the approval request when the session paused
+    for an external approval. `resume` is the decision a paused session continues with. A
+    session that finishes is added to `history` (a run_history.RunHistory), if given. The
+    recursion limit defaults to one derived from the session's iteration budget (see
+    main.session_recursion_limit).
+
+    Raises ValueError when the session's checkpoint belongs to a different draft than
+    initial_state, so a reused session id never returns or continues another draft's run.
+    """
+    import events
+    from langgraph.types import Command
+
+    snapshot = await app.aget_state(session_config(session_id))
+    if snapshot.values and initial_state is not None and initial_state["draft"] \
+            and snapshot.values["versions"][0] != initial_state["draft"]:
+        raise ValueError(f"Session '{session_id}' holds a checkpoint of a different draft")
+    if snapshot.values and not snapshot.next:
+        print(f"Session {session_id} has already finished.")
+        yield {"event": "session_finished", "session": session_id, "state": snapshot.values}
+        return
+    if not snapshot.values and initial_state is None:
+        raise KeyError(f"No checkpoint found for session '{session_id}'")
+
+    if recursion_limit is None:
+        from main import session_recursion_limit
+        recursion_limit = session_recursion_limit(snapshot.values or initial_state)
+    config = session_config(session_id, recursion_limit)
+    metrics.current_session.set(session_id)
+    started = time.perf_counter()
+    result = snapshot.values
+    request = None
+    if resume is not None:
+        graph_input = Command(resume=resume)
+    else:
+        graph_input = None if snapshot.values else initial_state
+    try:
+        if snapshot.values:
+            print(f"Resuming session {session_id} at node(s): {', '.join(snapshot.next)}")
+        stream = app.astream(graph_input, config, stream_mode=["custom", "updates", "values"])
+        async for mode, chunk in stream:
+            if mode == "custom":
+                yield chunk
+            elif mode == "updates":
+                for node, update in chunk.items():
+                    if node == "__interrupt__":
+                        request = update[0].value
+                    else:
+                        yield events.node_finished(node, update)
+            else:
+                result = chunk
+    except Exception as e:
+        metrics.record_session(session_id, None, time.perf_counter() - started, reason=f"error_{type(e).__name__}")
+        raise
+    if request is not None:
+        yield {"event": "approval_requested", "session": session_id, "state": result, "request": request}
+        return
+    elapsed = time.perf_counter() - started
+    metrics.record_session(session_id, result, elapsed)
+    if history is not None:
+        history.add(session_id, result, elapsed)
+    yield {"event": "session_finished", "session": session_id, "state": result}
+
+
+async def run_or_resume(app, initial_state, session_id, recursion_limit=None, on_event=None, resume=None,
+                        history=None):
+    """Runs a session, continuing from its last completed node if it has checkpoints.
+
+    A session that already finished returns its final state without running anything.
+    Pass initial_state=None to require an existing session. on_event, if given, is called
+    with every event of the session as it happens. A session paused for an external approval
+    returns its state at that point (status "user_approval"); run it again with the decision
+    as `resume` to continue. A finished session is added to `history`, if given.
+    """
+    result = None
+    async for event in stream_session(app, initial_state, session_id, recursion_limit, resume, history):
+        if event["event"] == "session_finished":
+            result = event["state"]
+            event = {"event": "session_finished", "session": session_id, "status": result.get("status"),
+                     "exit_reason": metrics.exit_reason(result)}
+        elif event["event"] == "approval_requested":
+            result = event["state"]
+            event = {"event": "approval_requested", "session": session_id, "request": event["request"]}
+        if on_event is not None:
+            on_event(event)
+    return result
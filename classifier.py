@@ -0,0 +1,100 @@
+import json
+import os
+import threading
+from collections import deque
+
+import numpy as np
+from sklearn.feature_extraction.text import HashingVectorizer, TfidfTransformer
+from sklearn.linear_model import LogisticRegression
+
+# Labels the LLM gave drafts are appended here, one JSON line each, and the model is trained from them.
+LABELS_PATH = os.environ.get("THREADS_CLASSIFIER_PATH", "classifier_labels.jsonl")
+
+# The local prediction is used when its probability reaches this; otherwise the LLM is asked.
+CONFIDENCE_THRESHOLD = 0.9
+
+MIN_EXAMPLES_PER_LABEL = 10  # The model isn't trusted until every label has this many examples
+RETRAIN_EVERY = 10  # New labels that trigger retraining
+MAX_EXAMPLES = 5000  # Only the most recent labels are trained on
+
+
+class ContentClassifier:
+    """Classifies drafts as industry_news or personal locally, learning from the LLM's labels.
+
+    Features are hashed word unigrams and bigrams (stop words kept, since "I" and "my" are
+    what give personal posts away) weighted by TF-IDF, and the model is a logistic regression.
+    Every label the LLM produces is saved to the labels file and, every RETRAIN_EVERY labels,
+    the model is refit on the latest MAX_EXAMPLES of them, so sessions need the LLM less as
+    labels accumulate. A path of None keeps the labels in memory only.
+    """
+
+    def __init__(self, path=LABELS_PATH, threshold=CONFIDENCE_THRESHOLD, min_examples=MIN_EXAMPLES_PER_LABEL,
+                 retrain_every=RETRAIN_EVERY, max_examples=MAX_EXAMPLES):
+        self.path = path
+        self.threshold = threshold
+        self.min_examples = min_examples
+        self.retrain_every = retrain_every
+        self.enabled = True  # Off when calls are recorded or replayed, so they match the cassette
+        self.vectorizer = HashingVectorizer(ngram_range=(1, 2), token_pattern=r"(?u)\b\w+\b", lowercase=True,
+                                            alternate_sign=False, norm=None)
+        self.examples = deque(maxlen=max_examples)  # (text, label), oldest first
+        self.model = None  # (TfidfTransformer, LogisticRegression) once trained
+        self.pending = 0  # Labels added since the model was last trained
+        self._lock = threading.Lock()
+        if path and os.path.exists(path):
+            with open(path, encoding="utf-8") as handle:
+                for line in handle:
+                    if line.strip():
+                        entry = json.loads(line)
+                        self.examples.append((entry["text"], entry["label"]))
+            self.pending = len(self.examples)
+
+    def _ready(self):
+        counts = {}
+        for _, label in self.examples:
+            counts[label] = counts.get(label, 0) + 1
+        return len(counts) > 1 and min(counts.values()) >= self.min_examples
+
+    def train(self):
+        """Refits the model on the stored labels, if there are enough of each."""
+        with self._lock:
+            examples = list(self.examples)
+            self.pending = 0
+        if not self._ready():
+            return False
+        texts, labels = zip(*examples)
+        features = self.vectorizer.transform(texts)
+        idf = TfidfTransformer(sublinear_tf=True).fit(features)
+        model = LogisticRegression(C=10.0, class_weight="balanced", max_iter=1000).fit(idf.transform(features), labels)
+        self.model = (idf, model)
+        return True
+
+    def needs_training(self):
+        """Returns whether labels loaded or learned since the last fit should be trained on before predicting."""
+        return self.enabled and self.model is None and self.pending > 0
+
+    def predict(self, text, threshold=None):
+        """Returns (label, probability), or (None, probability) when the LLM should decide.
+
+        The label is only returned with a probability of at least threshold (self.threshold
+        by default). Call train() first when needs_training() says so; predict() never fits
+        the model itself.
+        """
+        if not self.enabled or self.model is None:
+            return None, 0.0
+        idf, model = self.model
+        probabilities = model.predict_proba(idf.transform(self.vectorizer.transform([text])))[0]
+        best = int(np.argmax(probabilities))
+        probability = float(probabilities[best])
+        threshold = self.threshold if threshold is None else threshold
+        return (model.classes_[best] if probability >= threshold else None), probability
+
+    def learn(self, text, label):
+        """Records a label from the LLM. Returns True when enough have arrived to retrain."""
+        with self._lock:
+            self.examples.append((text, label))
+            self.pending += 1
+            if self.path:
+                with open(self.path, "a", encoding="utf-8") as handle:
+                    handle.write(json.dumps({"text": text, "label": label}) + "\n")
+            return self.pending >= self.retrain_every
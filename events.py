@@ -0,0 +1,158 @@
+import contextvars
+import json
+import re
+import sys
+import time
+
+import metrics
+
+# Fields of a node's state update that are included in its node_finished event.
+UPDATE_FIELDS = ("status", "draft", "character_count", "content_type", "relevance_score", "editor_score",
+                 "best_score", "exit_reason")
+
+# Called directly with every published event, in order with the node's own output (see ConsoleRenderer).
+console = contextvars.ContextVar("console", default=None)
+
+
+def publish(kind, **fields):
+    """Sends an event to whoever is streaming the session, if anyone is, and to the console renderer.
+
+    Events are dicts with an "event" kind plus the session and node they came from.
+    """
+    from langgraph.config import get_stream_writer
+
+    event = {"event": kind, "session": metrics.current_session.get(), "node": metrics.current_node.get(), **fields}
+    renderer = console.get()
+    if renderer is not None:
+        renderer(event)
+    try:
+        writer = get_stream_writer()
+    except RuntimeError:
+        return  # Not running inside a graph, e.g. a node called directly
+    writer(event)
+
+
+def partial_json_string(text, key):
+    """Finds the first string under `key` in incomplete JSON text.
+
+    For a list of strings, the first element is used. Returns (value so far, whether the string
+    is complete), or (None, False) if it hasn't started yet. Used to show a draft while it streams.
+    """
+    match = re.search(r'"%s"\s*:\s*\[?\s*"' % re.escape(key), text)
+    if match is None:
+        return None, False
+    value = []
+    escaped = False
+    complete = False
+    for char in text[match.end():]:
+        if escaped:
+            value.append(char)
+            escaped = False
+        elif char == "\\":
+            value.append(char)
+            escaped = True
+        elif char == '"':
+            complete = True
+            break
+        else:
+            value.append(char)
+    raw = "".join(value)
+    while raw:
+        try:
+            return json.loads(f'"{raw}"'), complete
+        except json.JSONDecodeError:
+            raw = raw[:-1]  # Drop a partial escape sequence at the end
+    return "", complete
+
+
+class TextPreview:
+    """Collects streamed response text and publishes the string under `key` as it grows."""
+
+    def __init__(self, key, kind):
+        self.key = key
+        self.kind = kind
+        self.text = ""
+        self.shown = ""
+        self.complete = False
+
+    def __call__(self, chunk):
+        if self.complete:
+            return
+        self.text += chunk
+        value, self.complete = partial_json_string(self.text, self.key)
+        if value is not None and (self.complete or value != self.shown) and value.startswith(self.shown):
+            publish(self.kind, delta=value[len(self.shown):], text=value, complete=self.complete)
+            self.shown = value
+
+    def restart(self):
+        """Starts over when the call is retried, dropping the text streamed so far."""
+        if self.text:
+            self.text = self.shown = ""
+            self.complete = False
+            publish(self.kind, delta="", text="", complete=False, restarted=True)
+
+
+def node_finished(node, update):
+    """Turns a node's state update from the graph stream into a node_finished event."""
+    update = update or {}
+    event = {"event": "node_finished", "session": metrics.current_session.get(), "node": node}
+    event.update({key: update[key] for key in UPDATE_FIELDS if key in update})
+    return event
+
+
+class ConsoleRenderer:
+    """Shows streamed drafts and feedback on the terminal as they arrive.
+
+    Set it as `console` rather than consuming the graph's event stream: the stream is read by
+    another task, so its events can show up after the node's own progress messages.
+    """
+
+    def __init__(self, stream=None):
+        self.stream = stream or sys.stdout
+        self.open_kind = None
+
+    def __call__(self, event):
+        kind = event["event"]
+        if kind in ("draft_preview", "feedback_preview"):
+            if event.get("restarted"):
+                self._close()  # The call is being retried; its text starts again on a new line
+                return
+            if self.open_kind != kind:
+                self._close()
+                label = "Writer (streaming)" if kind == "draft_preview" else "Editor (streaming)"
+                self.stream.write(f"{label}: ")
+                self.open_kind = kind
+            self.stream.write(event["delta"])
+            self.stream.flush()
+            if event.get("complete"):
+                self._close()
+        elif kind == "node_started":
+            self._close()
+
+    def _close(self):
+        if self.open_kind is not None:
+            self.stream.write("\n\n")
+            self.stream.flush()
+            self.open_kind = None
+
+
+class JsonlSink:
+    """Writes every event as a JSON line, for orchestrators that follow a session's progress."""
+
+    def __init__(self, path):
+        self.handle = sys.stderr if path == "-" else open(path, "a", encoding="utf-8")
+
+    def __call__(self, event):
+        self.handle.write(json.dumps(dict(event, ts=round(time.time(), 6)), default=str) + "\n")
+        self.handle.flush()
+
+    def close(self):
+        if self.handle is not sys.stderr:
+            self.handle.close()
+
+
+def add_arguments(parser):
+    """Adds the event stream option to an argument parser."""
+    parser.add_argument("--events", metavar="PATH",
+                        help="stream session events (node started/finished, streamed text, scores) "
+                             "as JSON lines to PATH, or '-' for stderr")
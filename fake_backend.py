@@ -0,0 +1,167 @@
+import asyncio
+import json
+import random
+import re
+
+import metrics
+from model_client import estimate_tokens
+
+FILLER_WORDS = (
+    "developers", "security", "open-source", "tooling", "release", "teams", "shipping", "privacy",
+    "startups", "code", "review", "latency", "cloud", "model", "data", "product", "users", "costs",
+)
+
+# Drafts written in the first person are classified as personal, so the local classifier has something to learn.
+FIRST_PERSON = re.compile(r"\b(I|I'm|I've|my|me)\b")
+
+# Defects the fake backend injects when asked for malformed JSON.
+MALFORMED_KINDS = ("truncated", "code_fence", "trailing_text", "string_score")
+
+
+class FakeUsage:
+    def __init__(self, prompt_tokens, response_tokens):
+        self.prompt_token_count = prompt_tokens
+        self.candidates_token_count = response_tokens
+        self.total_token_count = prompt_tokens + response_tokens
+
+
+class FakeResponse:
+    def __init__(self, text, prompt):
+        self.text = text
+        self.usage_metadata = FakeUsage(estimate_tokens(prompt), estimate_tokens(text))
+
+
+class FakeStream:
+    """Streamed fake response: an async iterator of chunks that also has the usage metadata."""
+
+    def __init__(self, response, chunk_size, delay):
+        self.text = response.text
+        self.usage_metadata = response.usage_metadata
+        self.chunk_size = chunk_size
+        self.delay = delay
+
+    async def __aiter__(self):
+        for start in range(0, len(self.text), self.chunk_size):
+            if self.delay:
+                await asyncio.sleep(self.delay)
+            yield FakeResponse(self.text[start:start + self.chunk_size], "")
+
+
+class FakeModel:
+    """Deterministic stand-in for a Gemini GenerativeModel, for benchmarks and offline runs.
+
+    Responses are either scripted per node (consumed in order, the last one repeating) or drawn
+    from seeded random distributions. Each session and node gets its own random stream, so a
+    session's responses don't depend on how concurrent sessions interleave. Latency and faults
+    (rate limits, server errors, slow calls and malformed JSON) can be injected. Malformed JSON is returned even when a
+    response schema is requested, so the local repair in responses.py gets exercised. Streamed
+    responses arrive in chunks of `stream_chunk` characters, with the latency spread between
+    the first chunk and the rest.
+    """
+
+    def __init__(self, seed=0, latency=0.0, latency_jitter=0.0, rate_limit_rate=0.0, malformed_rate=0.0,
+                 error_rate=0.0, slow_rate=0.0, slow_latency=2.0, editor_scores=None, relevance_scores=None, draft_length=(475, 35),
+                 extra_question_rate=0.1, candidates=3, script=None, stream_chunk=40):
+        self.seed = seed
+        self.latency = latency
+        self.latency_jitter = latency_jitter
+        self.rate_limit_rate = rate_limit_rate
+        self.malformed_rate = malformed_rate
+        self.error_rate = error_rate
+        self.slow_rate = slow_rate
+        self.slow_latency = slow_latency
+        self.editor_scores = editor_scores or {2: 0.1, 3: 0.4, 4: 0.35, 5: 0.15}
+        self.relevance_scores = relevance_scores or {3: 0.3, 4: 0.4, 5: 0.3}
+        self.draft_length = draft_length
+        self.extra_question_rate = extra_question_rate
+        self.candidates = candidates
+        self.script = script or {}
+        self.stream_chunk = stream_chunk
+        self.calls = {}  # (session, node) -> number of calls so far
+
+    def _next_call(self):
+        key = (metrics.current_session.get(), metrics.current_node.get())
+        index = self.calls.get(key, 0)
+        self.calls[key] = index + 1
+        return key, index
+
+    async def generate_content_async(self, prompt, stream=False, generation_config=None):
+        (session, node), index = self._next_call()
+        rng = random.Random(f"{self.seed}:{session}:{node}:{index}")
+        delay = max(0.0, rng.gauss(self.latency, self.latency_jitter)) if self.latency_jitter else self.latency
+        # Faults added after the first release only draw from the stream when enabled, so seeded
+        # runs without them get the same responses as before.
+        if self.slow_rate and rng.random() < self.slow_rate:
+            delay = self.slow_latency  # A call stuck in the backend's tail
+        first_chunk_delay = delay / 4 if stream else delay
+        if first_chunk_delay:
+            await asyncio.sleep(first_chunk_delay)
+        if rng.random() < self.rate_limit_rate:
+            from google.api_core import exceptions as google_exceptions
+            raise google_exceptions.ResourceExhausted("Injected rate limit from the fake backend")
+        if self.error_rate and rng.random() < self.error_rate:
+            from google.api_core import exceptions as google_exceptions
+            raise google_exceptions.ServiceUnavailable("Injected server error from the fake backend")
+
+        if node in self.script:
+            responses = self.script[node]
+            text = responses[min(index, len(responses) - 1)]
+            if not isinstance(text, str):
+                text = json.dumps(text)
+        else:
+            text = json.dumps(self._random_response(node, rng, prompt))
+        if rng.random() < self.malformed_rate:
+            text = self._malform(text, rng)
+        if stream:
+            chunks = max(1, -(-len(text) // self.stream_chunk))
+            return FakeStream(FakeResponse(text, prompt), self.stream_chunk, (delay - first_chunk_delay) / chunks)
+        return FakeResponse(text, prompt)
+
+    def _weighted(self, weights, rng):
+        return rng.choices(list(weights), weights=list(weights.values()))[0]
+
+    def _draft(self, rng):
+        mean, spread = self.draft_length
+        length = max(20, int(rng.gauss(mean, spread)))
+        words = []
+        while sum(len(word) + 1 for word in words) < length:
+            words.append(rng.choice(FILLER_WORDS))
+        draft = " ".join(words)[:length - 1].rstrip() + "."
+        if rng.random() < self.extra_question_rate:
+            draft = draft[:-1] + "? Why? What next?"
+        return draft
+
+    def _random_response(self, node, rng, prompt):
+        if node == "content_classifier":
+            text = prompt.split("Text:", 1)[-1].split("Instructions:", 1)[0]
+            return {"content_type": "personal" if FIRST_PERSON.search(text) else "industry_news"}
+        if node == "writer":
+            return {"drafts": [self._draft(rng) for _ in range(self.candidates)]}
+        if node == "relevance_assessor":
+            return {"relevance_score": self._weighted(self.relevance_scores, rng), "relevance_feedback": ""}
+        if node == "editor":
+            score = self._weighted(self.editor_scores, rng)
+            return {"feedback": f"Fake editor feedback: this draft scores {score}.", "overall_score": score}
+        raise ValueError(f"The fake backend has no response for node '{node}'")
+
+    def _malform(self, text, rng):
+        kind = rng.choice(MALFORMED_KINDS)
+        if kind == "truncated":
+            return text[:max(1, len(text) // 2)]
+        if kind == "code_fence":
+            return f"```json\n{text}\n```"
+        if kind == "trailing_text":
+            return text + "\nLet me know if you need anything else!"
+        data = json.loads(text)
+        for key in ("overall_score", "relevance_score"):
+            if key in data:
+                data[key] = f"{data[key]}/5"
+        return json.dumps(data)
+
+
+def fake_client(model):
+    """Wraps a fake model in a model client whose rate limiter never makes calls wait."""
+    from model_client import GeminiClient, RateLimiter
+
+    # Effectively unlimited quota, so runs measure the workflow rather than the limiter.
+    return GeminiClient(model, RateLimiter(1_000_000, 10 ** 12, request_burst=500_000))
@@ -0,0 +1,73 @@
+import re
+
+from model_client import estimate_tokens
+
+# Rough token budgets for the version history section of the writer prompt.
+HISTORY_TOKEN_BUDGET = 1500  # Recent versions rendered in full
+SUMMARY_TOKEN_BUDGET = 300  # One-line summaries of older rejections
+
+
+def empty_history():
+    """Returns the version history of a session that has no rejected versions yet."""
+    return {"entries": [], "condensed": [], "omitted": 0, "tokens": 0}
+
+
+def short_reason(reason, max_chars=160):
+    """Condenses a rejection reason to its first sentence."""
+    reason = " ".join(reason.split())
+    first_sentence = re.split(r"(?<=[.!?])\s", reason, maxsplit=1)[0]
+    if len(first_sentence) > max_chars:
+        first_sentence = first_sentence[:max_chars - 3].rstrip() + "..."
+    return first_sentence
+
+
+def add_version(history, number, version, reason, source="", budget=HISTORY_TOKEN_BUDGET,
+                summary_budget=SUMMARY_TOKEN_BUDGET):
+    """Returns a new history with a rejected version added.
+
+    Each version is rendered once, when it is added. When the rendered versions exceed the
+    budget, the oldest ones are condensed to a one-line summary of their rejection reason, and
+    the oldest summaries are dropped once those exceed their own budget. The source says who
+    rejected the version (e.g. "editor" or "user"); it is kept with the version, not rendered.
+    """
+    rendered = f"## Version {number}:\n{version}\n**Reason for Rejection:** {reason}\n\n"
+    entries = history["entries"] + [
+        {"version": number, "rendered": rendered, "tokens": estimate_tokens(rendered), "reason": short_reason(reason),
+         "source": source}
+    ]
+    condensed = list(history["condensed"])
+    omitted = history["omitted"]
+    tokens = history["tokens"] + entries[-1]["tokens"]
+
+    while tokens > budget and len(entries) > 1:
+        oldest = entries.pop(0)
+        tokens -= oldest["tokens"]
+        if (condensed and condensed[-1]["reason"] == oldest["reason"]
+                and condensed[-1].get("source") == oldest.get("source")):
+            # Consecutive versions rejected for the same reason share one line
+            condensed[-1] = dict(condensed[-1], last=oldest["version"])
+        else:
+            condensed.append({"first": oldest["version"], "last": oldest["version"], "reason": oldest["reason"],
+                              "source": oldest.get("source", "")})
+    while condensed and sum(estimate_tokens(line["reason"]) + 4 for line in condensed) > summary_budget:
+        dropped = condensed.pop(0)
+        omitted += dropped["last"] - dropped["first"] + 1
+
+    return {"entries": entries, "condensed": condensed, "omitted": omitted, "tokens": tokens}
+
+
+def render_history(history):
+    """Renders the version history for the writer prompt."""
+    parts = []
+    if history["omitted"]:
+        parts.append(f"({history['omitted']} earlier version(s) omitted.)\n")
+    if history["condensed"]:
+        lines = "\n".join(
+            f"- Version {line['first']}: {line['reason']}" if line["first"] == line["last"]
+            else f"- Versions {line['first']}-{line['last']}: {line['reason']}"
+            for line in history["condensed"]
+        )
+        parts.append(f"**Earlier Versions (condensed):**\n{lines}\n\n")
+    parts.extend(entry["rendered"] for entry in history["entries"])
+    return "".join(parts)
+
@@ -0,0 +1,166 @@
+import re
+
+MIN_CHARACTERS = 450
+MAX_CHARACTERS = 500
+MAX_QUESTIONS = 1
+BANNED_PHRASES = ["game-changer", "game changer", "revolutionary", "groundbreaking"]
+
+# Patterns are compiled once, when the module loads.
+SENTENCE_END = re.compile(r"[.?!]")
+HASHTAG = re.compile(r"(?<![\w&#])#[A-Za-z_]\w*")
+# Top-level domains that make a bare name like example.com a link. Only lowercase ones count,
+# so product names such as Node.js, Next.js or ASP.NET aren't mistaken for links.
+LINK_TLDS = ("com", "org", "net", "io", "dev", "ai", "app", "co", "me", "ly", "gg", "xyz", "info", "edu", "gov")
+# Links with a scheme or "www.", and bare domains with a known top-level domain (example.com/post).
+LINK = re.compile(r"\b(?i:https?://|www\.)\S+|\b[\w-]+(?:\.[\w-]+)*\.(?:" + "|".join(LINK_TLDS) + r")\b(?:/\S*)?")
+BANNED = re.compile("|".join(re.escape(phrase) for phrase in BANNED_PHRASES), re.IGNORECASE)
+WORD = re.compile(r"\w")
+# A parenthetical aside, which may follow the closing question: "Is it worth it? (I think so)".
+ASIDE = re.compile(r"\([^()]*\)")
+
+
+class LintRule:
+    """A hard constraint checked locally on every writer candidate.
+
+    check(draft) returns a list with one detail per violation (empty when the draft passes);
+    feedback(draft, detail) turns one of them into a revision instruction for the writer.
+    """
+
+    def __init__(self, name, check, feedback):
+        self.name = name
+        self.check = check
+        self.feedback = feedback
+
+
+# Registered rules, by name, in the order they run. Add more with rule().
+RULES = {}
+
+
+def rule(name, feedback):
+    """Registers the decorated function as the check of a new lint rule."""
+    def register(check):
+        RULES[name] = LintRule(name, check, feedback)
+        return check
+    return register
+
+
+def lint(draft, rules=None):
+    """Returns the rules a draft breaks as a list of (rule, detail) pairs.
+
+    `rules` names the rules to run; all registered rules run by default.
+    """
+    violations = []
+    for name in rules or RULES:
+        violations.extend((name, detail) for detail in RULES[name].check(draft))
+    return violations
+
+
+def lint_feedback(draft, violations):
+    """Turns lint violations into revision instructions for the writer."""
+    return "".join(RULES[name].feedback(draft, detail) for name, detail in violations)
+
+
+def _too_short_feedback(draft, detail):
+    return f"""
+            The draft is {detail} characters too short. The current character count is {len(draft)}. Aim for a length between {MIN_CHARACTERS} and {MAX_CHARACTERS} characters.
+
+            To help you revise: Consider elaborating on these areas:
+            - Provide more context or background information about the topic.
+            - Add details or examples to support your main points.
+            - Expand the call to action to make it more engaging.
+            """
+
+
+@rule("too_short", _too_short_feedback)
+def _too_short(draft):
+    return [MIN_CHARACTERS - len(draft)] if len(draft) < MIN_CHARACTERS else []
+
+
+def _too_long_feedback(draft, detail):
+    return f"""
+            The draft is {detail} characters too long. The current character count is {len(draft)}. Aim for a length between {MIN_CHARACTERS} and {MAX_CHARACTERS} characters.
+
+            To help you revise: Consider condensing these areas:
+            - Shorten phrases or use abbreviations where appropriate.
+            - Remove unnecessary words or redundant information.
+            - Focus on the most critical points and streamline the message.
+            """
+
+
+@rule("too_long", _too_long_feedback)
+def _too_long(draft):
+    return [len(draft) - MAX_CHARACTERS] if len(draft) > MAX_CHARACTERS else []
+
+
+def _too_many_questions_feedback(draft, detail):
+    # Extract and highlight questions
+    sentences = SENTENCE_END.split(draft)
+    question_sentences = [sentence.strip() for sentence in sentences if "?" in sentence]
+    highlighted_questions = "\n".join([f"- **{sentence}**" for sentence in question_sentences])
+    return f"""
+            The draft contains too many question marks ({detail}). You have exceeded the limit of {MAX_QUESTIONS} questions by {detail - MAX_QUESTIONS} question(s).
+
+            The following sentences contain questions:
+
+            {highlighted_questions}
+
+            Remember, a Threads status update should ideally have a maximum of one questions.
+            To help you revise: Consider removing or combining these questions, or rephrasing some as statements.
+            """
+
+
+@rule("too_many_questions", _too_many_questions_feedback)
+def _too_many_questions(draft):
+    count = draft.count("?")
+    return [count] if count > MAX_QUESTIONS else []
+
+
+def _question_not_at_end_feedback(draft, detail):
+    return f"""
+            The question must come at the end of the status update, but the draft continues after it with: "{detail}". End the draft with the question, or rephrase the question as a statement.
+            """
+
+
+@rule("question_not_at_end", _question_not_at_end_feedback)
+def _question_not_at_end(draft):
+    # Asides and emoji after the question don't count; any other words do.
+    tail = draft[draft.rfind("?") + 1:].strip()
+    return [tail] if "?" in draft and WORD.search(ASIDE.sub("", tail)) else []
+
+
+def _hashtag_feedback(draft, detail):
+    return f"""
+            The draft contains the hashtag "{detail}". Status updates must not include hashtags; work the idea into the text instead.
+            """
+
+
+@rule("hashtag", _hashtag_feedback)
+def _hashtag(draft):
+    return HASHTAG.findall(draft)
+
+
+def _link_feedback(draft, detail):
+    return f"""
+            The draft contains the link "{detail}". Status updates must not include links or URLs; describe the source in words instead.
+            """
+
+
+@rule("link", _link_feedback)
+def _link(draft):
+    return LINK.findall(draft)
+
+
+def _banned_phrase_feedback(draft, detail):
+    return f"""
+            The draft uses the promotional phrase "{detail}". Replace it with plain, informative language.
+            """
+
+
+@rule("banned_phrase", _banned_phrase_feedback)
+def _banned_phrase(draft):
+    found = []
+    for match in BANNED.finditer(draft):
+        phrase = match.group(0).lower()
+        if phrase not in found:
+            found.append(phrase)
+    return found
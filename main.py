@@ -1,19 +1,30 @@
+if __name__ == "__main__":
+    # batch, bench and service import this file as `main`. Run the CLI from that module rather
+    # than from this __main__ copy, so the workflow and its shared state are only loaded once.
+    import main
+    raise SystemExit(main.main())
+
 from typing import Annotated, TypedDict, List
 import operator
 import time
+import contextvars
 from datetime import datetime
-from langgraph.graph import StateGraph, END
-from langchain_core.messages import HumanMessage, AIMessage, SystemMessage
-import re
 import os
-import google.generativeai as genai
 import json
-from ratelimit import limits, RateLimitDecorator, RateLimitException
-from sklearn.feature_extraction.text import TfidfVectorizer
-from sklearn.metrics.pairwise import cosine_similarity
-
-# Configure Gemini Flash globally
-genai.configure(api_key=os.environ["GEMINI_API_KEY"])
+import asyncio
+import argparse
+from collections import OrderedDict
+from response_cache import ResponseCache, cache_key
+from history import empty_history, add_version, render_history
+from lint import lint, lint_feedback, MIN_CHARACTERS, MAX_CHARACTERS
+from responses import SCHEMAS, ResponseError, parse_response
+from model_client import estimate_tokens, call_deadline, Deadline, DeadlineExceeded, CallFailed
+import model_client
+import metrics
+import events
+
+# Heavy modules (LangGraph's graph builder, the Gemini SDK, scikit-learn) and the model client
+# are only loaded on first use, so the CLI starts quickly and --help works without an API key.
 
 generation_config = {
     "temperature": 1,
@@ -23,12 +34,122 @@ generation_config = {
     "response_mime_type": "application/json",  # Default mime type is now JSON
 }
 
-model = genai.GenerativeModel(
-    model_name="gemini-1.5-flash-8b-exp-0827",
-    generation_config=generation_config,
-    # safety_settings = Adjust safety settings
-    # See https://ai.google.dev/gemini-api/docs/safety-settings
-)
+MODEL_NAME = "gemini-1.5-flash-8b-exp-0827"
+
+# Model settings per node; they override generation_config for that node's calls. The writer
+# keeps the creative settings, while nodes that answer with a label or a short review get
+# deterministic sampling, a small output limit and a shorter attempt timeout.
+NODE_MODELS = {
+    "content_classifier": {"model": MODEL_NAME, "temperature": 0.0, "max_output_tokens": 32, "timeout": 15.0},
+    "writer": {"model": MODEL_NAME, "temperature": 1.0, "max_output_tokens": 8192, "timeout": 60.0},
+    "relevance_assessor": {"model": MODEL_NAME, "temperature": 0.0, "max_output_tokens": 256, "timeout": 20.0},
+    "editor": {"model": MODEL_NAME, "temperature": 0.2, "max_output_tokens": 1024, "timeout": 30.0},
+}
+
+# Free tier quota for the model. Every session and node shares this limiter.
+REQUESTS_PER_MINUTE = 15
+TOKENS_PER_MINUTE = 1_000_000
+
+_client = None
+
+
+def get_client():
+    """Configures Gemini and builds the shared model client the first time it is needed."""
+    global _client
+    if _client is None:
+        import google.generativeai as genai
+        from model_client import GeminiClient, RateLimiter, ContextCache
+
+        if "GEMINI_API_KEY" not in os.environ:
+            raise RuntimeError("Set the GEMINI_API_KEY environment variable to call Google Gemini.")
+        genai.configure(api_key=os.environ["GEMINI_API_KEY"])
+
+        def build_model(model_name):
+            return genai.GenerativeModel(
+                model_name=model_name,
+                generation_config=generation_config,
+                # safety_settings = Adjust safety settings
+                # See https://ai.google.dev/gemini-api/docs/safety-settings
+            )
+
+        _client = GeminiClient(
+            build_model(MODEL_NAME),
+            RateLimiter(REQUESTS_PER_MINUTE, TOKENS_PER_MINUTE),
+            context_cache=ContextCache(MODEL_NAME, generation_config),
+            model_factory=build_model,
+        )
+    return _client
+
+
+def set_client(client):
+    """Replaces the shared model client, e.g. with one wrapping a fake model for offline runs."""
+    global _client
+    _client = client
+
+
+# Responses are cached on disk so re-running the same prompt doesn't spend quota again.
+RESPONSE_CACHE_PATH = os.environ.get("THREADS_CACHE_PATH", "response_cache.sqlite3")
+response_cache = ResponseCache(RESPONSE_CACHE_PATH)
+
+
+def get_response_cache():
+    """Returns the shared response cache."""
+    return response_cache
+
+
+def set_response_cache(cache):
+    """Replaces the shared response cache, e.g. with an in-memory one for benchmarks."""
+    global response_cache
+    response_cache = cache
+
+_relevance_engine = None
+
+
+def get_relevance_engine():
+    """Returns the relevance engine shared by all sessions, loading scikit-learn on first use.
+
+    See RelevanceEngine.fit() for learning IDF weights from a batch of drafts.
+    """
+    global _relevance_engine
+    if _relevance_engine is None:
+        from relevance import RelevanceEngine
+        _relevance_engine = RelevanceEngine()
+    return _relevance_engine
+
+
+_content_classifier = None
+
+
+def get_content_classifier():
+    """Returns the local content classifier shared by all sessions, loading its labels on first use."""
+    global _content_classifier
+    if _content_classifier is None:
+        from classifier import ContentClassifier
+        _content_classifier = ContentClassifier()
+    return _content_classifier
+
+
+def set_content_classifier(classifier):
+    """Replaces the shared content classifier, e.g. with an in-memory one for benchmarks."""
+    global _content_classifier
+    _content_classifier = classifier
+
+_run_history = None
+
+
+def get_run_history():
+    """Returns the store every finished session is recorded in, see run_history.py."""
+    global _run_history
+    if _run_history is None:
+        from run_history import RunHistory
+        _run_history = RunHistory()
+    return _run_history
+
+
+def set_run_history(history):
+    """Replaces the run history store, e.g. with an in-memory one for benchmarks."""
+    global _run_history
+    _run_history = history
 
 # User Persona (Global Variable)
 USER_PERSONA = {
@@ -61,35 +182,275 @@ USER_PERSONA = {
     "standout_qualities": "Technical knowledge, insightful opinions, engaging writing style"
 }
 
+# USER_PERSONA is registered under this id; personas loaded from PERSONA_DIR are added next to it.
+DEFAULT_PERSONA_ID = "default"
+
+_persona_registry = None
+
+
+def get_persona_registry():
+    """Loads the persona registry on first use: USER_PERSONA plus every persona file in PERSONA_DIR."""
+    global _persona_registry
+    if _persona_registry is None:
+        from personas import PersonaRegistry, PERSONA_DIR
+
+        registry = PersonaRegistry()
+        registry.add(DEFAULT_PERSONA_ID, USER_PERSONA)
+        if os.path.isdir(PERSONA_DIR):
+            registry.load_directory(PERSONA_DIR)
+        _persona_registry = registry
+    return _persona_registry
+
+
+def session_persona(state):
+    """Returns (cache key, persona) for the persona a session writes as.
+
+    Sessions normally refer to a registered persona by id. Sessions started with a persona
+    dict of their own (and checkpoints from before the registry) carry it in the state.
+    """
+    persona_id = state.get("persona_id")
+    if persona_id:
+        registry = get_persona_registry()
+        return (persona_id, registry.fingerprint(persona_id)), registry.get(persona_id)
+    from personas import persona_fingerprint
+
+    persona = state.get("persona") or USER_PERSONA
+    return ("inline", persona_fingerprint(persona)), persona
+
+
+# "seconds" is time spent running nodes, not counting time queued for the rate limiter, which
+# is reported as "queue_seconds".
+USAGE_KEYS = ("calls", "tokens", "prompt_tokens", "response_tokens", "seconds", "queue_seconds")
+NODE_USAGE_KEYS = ("runs", "calls", "prompt_tokens", "response_tokens", "seconds", "queue_seconds")
+
+
+def add_usage(total, delta):
+    """Adds a node's model calls, tokens and run time to the session's usage, in total and per node."""
+    total, delta = total or {}, delta or {}
+    usage = {key: total.get(key, 0) + delta.get(key, 0) for key in USAGE_KEYS}
+    nodes = dict(total.get("nodes") or {})
+    for node, counts in (delta.get("nodes") or {}).items():
+        kept = nodes.get(node) or {}
+        nodes[node] = {key: kept.get(key, 0) + counts.get(key, 0) for key in NODE_USAGE_KEYS}
+    usage["nodes"] = nodes
+    return usage
+
+
+# Drafts a session keeps in `versions`: the initial draft plus the most recent revisions.
+# Older drafts live on, condensed, in version_history; draft_count keeps counting them all.
+MAX_KEPT_VERSIONS = 4
+
+# Editor reviews a session keeps in `editor_history`.
+EDITOR_HISTORY_SIZE = 3
+
+
+def add_versions(kept, new):
+    """Appends new drafts to `versions`, keeping the initial draft and the latest revisions."""
+    versions = (kept or []) + new
+    if len(versions) > MAX_KEPT_VERSIONS:
+        versions = versions[:1] + versions[1 - MAX_KEPT_VERSIONS:]
+    return versions
+
+
+def add_editor_history(kept, new):
+    """Appends new editor reviews to `editor_history`, keeping only the latest ones.
+
+    A review identical to a kept one replaces it rather than being kept twice, so a repeated
+    review doesn't push different ones out.
+    """
+    history = list(kept or [])
+    for review in new:
+        if review in history:
+            history.remove(review)
+        history.append(review)
+    return history[-EDITOR_HISTORY_SIZE:]
+
+
+def add_editor_scores(kept, new):
+    """Appends new editor scores to `editor_scores`, keeping what stop_reason() reads.
+
+    That is the last CONVERGENCE_WINDOW scores, preceded by the best of the earlier ones.
+    """
+    scores = (kept or []) + new
+    if len(scores) > CONVERGENCE_WINDOW + 1:
+        scores = [max(scores[:-CONVERGENCE_WINDOW])] + scores[-CONVERGENCE_WINDOW:]
+    return scores
+
+
+def add_review_seconds(kept, new):
+    """Keeps the longest run time of the nodes reviewing a draft in parallel; None clears it."""
+    return 0.0 if new is None else max(kept or 0.0, new)
+
+
+def add_rejections(kept, new):
+    """Adds rejection counts, keyed by source and then category, to `rejections`."""
+    merged = {source: dict(categories) for source, categories in (kept or {}).items()}
+    for source, categories in (new or {}).items():
+        counts = merged.setdefault(source, {})
+        for category, count in categories.items():
+            counts[category] = counts.get(category, 0) + count
+    return merged
+
+
+def draft_count(state):
+    """Returns how many drafts the writer has produced, including those `versions` no longer keeps."""
+    # Sessions checkpointed before draft_count existed kept every version.
+    return state.get("draft_count") or len(state["versions"]) - 1
+
 
 class StatusUpdateState(TypedDict):
-    messages: Annotated[List[HumanMessage | AIMessage | SystemMessage], operator.add]
+    messages: Annotated[List, operator.add]  # HumanMessage | AIMessage | SystemMessage
     draft: str
     character_count: int
     status: str
-    versions: List[str]
+    versions: Annotated[List[str], add_versions]  # Initial draft and the latest drafts; nodes return only new ones
+    draft_count: Annotated[int, operator.add]  # Drafts the writer has produced; each new draft adds 1
     editor_feedback: str
-    iteration_count: int
-    editor_history: List[str]
+    iteration_count: Annotated[int, operator.add]  # Nodes run so far; each node adds 1
+    editor_history: Annotated[List[str], add_editor_history]  # The editor's latest distinct reviews
     start_time: float
     relevance_score: int
     relevance_feedback: str
     content_type: str # New field for content type
+    persona_id: str  # Registered persona the writer and editor write as, see personas.py
+    persona: dict  # A persona of the session's own, used when persona_id is empty
+    approval_policy: str  # "interactive", EXTERNAL_APPROVAL or one of APPROVAL_POLICIES
+    writer_feedback: str  # Constraint problems found locally in the writer's last candidates
+    version_history: dict  # Rejected versions for the writer prompt, see history.py
+    rejections: Annotated[dict, add_rejections]  # Rejections so far, by source and category, for the run history
+    usage: Annotated[dict, add_usage]  # Model calls, tokens and node seconds spent so far
+    review_seconds: Annotated[float, add_review_seconds]  # Time of the parallel reviews, charged by review
+    budget: dict  # Per-session limits, see DEFAULT_BUDGET
+    editor_score: int  # The editor's score for the current draft, 0 if the review failed
+    editor_scores: Annotated[List[int], add_editor_scores]  # The best earlier score, then the latest scores in order
+    best_draft: str  # The highest scoring draft so far
+    best_score: int
+    exit_reason: str  # Why the session stopped, once it has
+
+
+# Model usage of the node being run, filled in by make_api_call.
+_node_usage = contextvars.ContextVar("node_usage", default=None)
+
+
+def tracked_node(node, count_time=True, parallel=False, join=False):
+    """Wraps a graph node so each run adds to the iteration count and the session's usage.
+
+    The time the user node spends waiting for input is not counted (count_time=False), nor is
+    time queued for the rate limiter. Other nodes get the session's remaining time budget as
+    the deadline for their model calls; a node whose call hits it is charged the whole
+    remaining budget, so the session stops next.
+
+    Nodes that run side by side (parallel=True) each record their own time, but the session is
+    charged once, by the node that joins them (join=True): the longest of their run times.
+    """
+    def start(state):
+        events.publish("node_started")
+        usage = add_usage({}, {})
+        deadline = Deadline(seconds_left(state)) if count_time else None
+        return usage, (_node_usage.set(usage), call_deadline.set(deadline)), deadline, time.perf_counter()
+
+    def finish(state, update, usage, deadline, started):
+        update = dict(update or {}, iteration_count=1, usage=usage)
+        seconds = 0.0
+        if count_time:
+            seconds = max(0.0, time.perf_counter() - started - usage["queue_seconds"])
+            if deadline.expired:
+                seconds = max(seconds, deadline.seconds)
+        node_usage = usage["nodes"].setdefault(metrics.current_node.get(), dict.fromkeys(NODE_USAGE_KEYS, 0))
+        node_usage["runs"] += 1
+        node_usage["seconds"] += seconds
+        if parallel:
+            update["review_seconds"] = seconds
+        else:
+            usage["seconds"] = seconds
+        if join:
+            usage["seconds"] += state.get("review_seconds") or 0.0
+            update["review_seconds"] = None
+        return update
+
+    def reset(tokens):
+        _node_usage.reset(tokens[0])
+        call_deadline.reset(tokens[1])
+
+    if asyncio.iscoroutinefunction(node):
+        async def tracked(state):
+            usage, tokens, deadline, started = start(state)
+            try:
+                return finish(state, await node(state), usage, deadline, started)
+            finally:
+                reset(tokens)
+    else:
+        def tracked(state):
+            usage, tokens, deadline, started = start(state)
+            try:
+                return finish(state, node(state), usage, deadline, started)
+            finally:
+                reset(tokens)
+    return tracked
 
 
-def increment_and_check_iterations(state: StatusUpdateState) -> StatusUpdateState:
-    """Increments the iteration count and checks if the maximum limit is reached."""
-    state["iteration_count"] += 1
-    if state["iteration_count"] > 300:
-        print("Maximum overall iterations reached. Forcing completion.")
-        return {"status": "approved"}
-    return {}
+def record_rejection(state: StatusUpdateState, reason, source, category):
+    """Returns the state update that records the current draft as rejected.
+
+    The draft and the reason go into the version history for the writer. The rejection is
+    also counted by who rejected it (source) and a short, fixed category of why, such as a
+    lint rule name, so the run history can group rejections.
+    """
+    history = state.get("version_history") or empty_history()
+    return {"version_history": add_version(history, draft_count(state), state["draft"], reason, source),
+            "rejections": {source: {category: 1}}}
+
+
+def auto_approve_policy(state: StatusUpdateState):
+    """Approves every draft the editor has signed off on."""
+    return True, "", []
+
+
+# Scores the strict approval policy requires, above the review's APPROVAL_SCORE and MIN_RELEVANCE_SCORE.
+STRICT_MIN_EDITOR_SCORE = 5
+STRICT_MIN_RELEVANCE_SCORE = 4
+
+
+def strict_policy(state: StatusUpdateState):
+    """Approves the draft only if its reviews clear higher bars than the review node's.
+
+    The writer already keeps every draft within the lint rules, so this checks what only the
+    reviews know: the editor's score must reach STRICT_MIN_EDITOR_SCORE and the relevance
+    score, when the draft has one, STRICT_MIN_RELEVANCE_SCORE. The reasons name the checks
+    the draft failed.
+    """
+    reasons, feedback = [], []
+    editor_score = state.get("editor_score", 0)
+    if editor_score < STRICT_MIN_EDITOR_SCORE:
+        reasons.append("editor_score")
+        feedback.append(f"The editor scored the draft {editor_score} out of 5; it needs {STRICT_MIN_EDITOR_SCORE}. "
+                        f"Address the editor's feedback:\n{state.get('editor_feedback', '')}")
+    relevance_score = state.get("relevance_score", 0)
+    if relevance_score and relevance_score < STRICT_MIN_RELEVANCE_SCORE:
+        reasons.append("relevance_score")
+        feedback.append(f"The draft's relevance to the initial draft scored {relevance_score}; it needs "
+                        f"{STRICT_MIN_RELEVANCE_SCORE}. Bring it closer to the initial draft's topic and key points. "
+                        f"{state.get('relevance_feedback', '')}".strip())
+    return not reasons, "\n\n".join(feedback), reasons
+
+
+# Approval policies used in place of the interactive user when running unattended.
+# Each policy takes the state and returns (approved, feedback_for_revision, reasons), where the
+# reasons name the checks a rejected draft failed and become its rejection category.
+APPROVAL_POLICIES = {
+    "auto_approve": auto_approve_policy,
+    "strict": strict_policy,
+}
+
+# Sessions with this policy pause at the final approval until a decision is sent back to them
+# (see service.py). The decision is a dict with "approved" and, for a revision, "feedback".
+EXTERNAL_APPROVAL = "external"
 
 
 def user(state: StatusUpdateState) -> StatusUpdateState:
     """Handles user interaction for providing the initial draft and final approval."""
-    state.update(increment_and_check_iterations(state))
     print(f"User node: Current status - {state['status']}")
+    policy = state.get("approval_policy", "interactive")
 
     def get_multiline_input(prompt):
         print(prompt)
@@ -104,16 +465,48 @@ def user(state: StatusUpdateState) -> StatusUpdateState:
         return "\n".join(lines)
 
     if state["status"] == "initial":
-        initial_draft = get_multiline_input("Please enter your initial draft for the status update:")
+        if policy == "interactive":
+            initial_draft = get_multiline_input("Please enter your initial draft for the status update:")
+        else:
+            # Unattended sessions are seeded with their draft; resubmit it as is.
+            initial_draft = state["versions"][0] or state["draft"]
         print("User has submitted the initial draft. Sending it to the Content Classifier.\n")
 
         # Record the start time using datetime
         state["start_time"] = datetime.now()
         print(f"Start time recorded: {state['start_time'].strftime('%H:%M:%S')}")
 
-        return {"draft": initial_draft, "status": "draft_submitted"}
+        from langgraph.types import Overwrite
+
+        return {"draft": initial_draft, "versions": Overwrite([initial_draft]), "start_time": state["start_time"],
+                "status": "draft_submitted"}
 
     elif state["status"] == "user_approval":
+        if policy == EXTERNAL_APPROVAL:
+            from langgraph.types import interrupt
+
+            # The session is checkpointed here and this node runs again with the decision.
+            decision = interrupt({"draft": state["draft"], "character_count": len(state["draft"]),
+                                  "editor_score": state.get("editor_score", 0),
+                                  "editor_feedback": state.get("editor_feedback", "")})
+            if decision.get("approved"):
+                print("Draft approved externally\n")
+                return {"status": "approved"}
+            feedback = decision.get("feedback") or "Please revise the draft."
+            print(f"Revision requested externally: {feedback}\n")
+            return {"editor_feedback": feedback, "status": "needs_revision",
+                    **record_rejection(state, feedback, "external_approval", "revision_requested")}
+
+        if policy != "interactive":
+            approved, feedback, reasons = APPROVAL_POLICIES[policy](state)
+            if approved:
+                print(f"Draft approved by the '{policy}' policy\n")
+                return {"status": "approved"}
+            print(f"The '{policy}' policy requested revision: {feedback}\n")
+            category = "+".join(sorted(set(reasons))) or "policy"
+            return {"editor_feedback": feedback, "status": "needs_revision",
+                    **record_rejection(state, feedback, f"{policy}_policy", category)}
+
         print("\nThe status update is ready for final approval. Asking the user the following:\n")
         print("\nFinal draft for approval:")
         print(state["draft"])
@@ -129,17 +522,85 @@ def user(state: StatusUpdateState) -> StatusUpdateState:
         else:
             feedback = get_multiline_input("Please provide feedback for revision:")
             print(f"User requested revision: {feedback}\n")
-            return {"editor_feedback": feedback, "status": "needs_revision"}
+            return {"editor_feedback": feedback, "status": "needs_revision",
+                    **record_rejection(state, feedback, "user", "revision_requested")}
 
     return {}
 
 
-@RateLimitDecorator(calls=15, period=60)
-def make_api_call(prompt):
-    """Makes an API call to Google Gemini with rate limiting."""
-    chat_session = model.start_chat(history=[])
-    response = chat_session.send_message(prompt)
-    return response.text
+def parse_json_response(response, schema):
+    """Parses a response against a schema, repairing it locally where possible (see responses.py)."""
+    data, repairs = parse_response(response, schema)
+    if repairs:
+        for repair in repairs:
+            metrics.inc("threads_json_repairs_total", node=metrics.current_node.get(), repair=repair)
+        metrics.emit("json_repair", repairs=repairs)
+    return data
+
+
+async def make_api_call(prompt, use_cache=True, prefix="", on_text=None, schema=None, speculative=False):
+    """Makes an API call to Google Gemini, waiting for the shared rate limiter when needed.
+
+    Responses are served from and saved to the response cache unless use_cache is False,
+    which nodes that rely on sampling a fresh response for the same prompt should pass.
+    A static prefix rendered once per persona is sent ahead of the prompt, from the
+    backend's context cache when possible. When on_text is given the response is streamed
+    to it chunk by chunk (a cached response arrives as a single chunk).
+
+    With a schema (one of responses.SCHEMAS) the model is asked for JSON matching it, and the
+    parsed data is returned instead of the text, after local repair of common defects.
+    ResponseError is raised if the response can't be repaired.
+
+    The call uses the calling node's NODE_MODELS settings, and the prompt and response tokens
+    the backend reports for it are added to the session's usage under that node. A speculative call
+    only uses spare quota and raises model_client.QuotaUnavailable when there is none.
+    """
+    node = metrics.current_node.get()
+    settings = NODE_MODELS.get(node, {})
+    config = dict(generation_config, **{key: settings[key] for key in ("temperature", "max_output_tokens")
+                                        if key in settings})
+    if schema:
+        config["response_schema"] = schema
+    key = cache_key(settings.get("model", MODEL_NAME), config, prefix + prompt)
+    if use_cache:
+        cached = response_cache.get(key, prompt)
+        if cached is not None:
+            metrics.inc("threads_api_calls_total", node=node, outcome="cache_hit")
+            metrics.emit("api_cache_hit")
+            if on_text is not None:
+                on_text(cached)
+            return parse_json_response(cached, schema) if schema else cached
+
+    response, call_usage = await get_client().generate(prompt, prefix=prefix, on_text=on_text, schema=schema,
+                                                       settings=settings, speculative=speculative)
+    usage = _node_usage.get()
+    if usage is not None:
+        prompt_tokens, response_tokens = call_usage["prompt_tokens"], call_usage["response_tokens"]
+        calls = call_usage.get("calls", 1)  # A hedged call sent two requests
+        queue_seconds = call_usage.get("queue_seconds", 0.0)
+        usage["calls"] += calls
+        usage["tokens"] += prompt_tokens + response_tokens
+        usage["prompt_tokens"] += prompt_tokens
+        usage["response_tokens"] += response_tokens
+        usage["queue_seconds"] += queue_seconds
+        node_usage = usage["nodes"].setdefault(node, dict.fromkeys(NODE_USAGE_KEYS, 0))
+        node_usage["calls"] += calls
+        node_usage["prompt_tokens"] += prompt_tokens
+        node_usage["response_tokens"] += response_tokens
+        node_usage["queue_seconds"] += queue_seconds
+
+    if schema:
+        data = parse_json_response(response, schema)
+        if use_cache:
+            response_cache.put(key, json.dumps(data))  # Cache the repaired response
+        return data
+    if use_cache:
+        try:
+            json.loads(response)
+        except json.JSONDecodeError:
+            return response  # Don't cache a malformed response, or every retry would get it back
+        response_cache.put(key, response)
+    return response
 
 
 def extract_key_points(text):
@@ -148,12 +609,225 @@ def extract_key_points(text):
     return ". ".join(sentences[:3]) + "."
 
 
-def content_classifier(state: StatusUpdateState) -> StatusUpdateState:
-    """Classifies the content as industry/general news or personal using a LLM API call."""
-    state.update(increment_and_check_iterations(state))
-    print("The Content Classifier is analyzing the draft using a LLM...\n")
+# Number of candidate drafts the writer asks for in each call.
+WRITER_CANDIDATES = 3
+
+
+def draft_similarity(draft, original):
+    """Returns how closely a draft follows the original draft, from 0 to 1."""
+    return get_relevance_engine().similarity(original, draft)
+
+
+def select_candidate(candidates, original):
+    """Picks the best candidate draft.
+
+    Candidates that pass every lint rule (see lint.py) win, closest to the original draft first.
+    Otherwise the candidate with the fewest violations and the smallest length error is returned.
+    Returns (draft, violations).
+    """
+    def length_error(draft):
+        return max(MIN_CHARACTERS - len(draft), len(draft) - MAX_CHARACTERS, 0)
+
+    scored = [(draft, lint(draft)) for draft in candidates]
+    return min(scored, key=lambda item: (len(item[1]), length_error(item[0]), -draft_similarity(item[0], original)))
+
+
+# Rendered prompt prefixes, keyed by the function that renders them and the persona's cache key.
+# Only the most recently used MAX_PROMPT_PREFIXES are kept, since inline personas add new keys.
+MAX_PROMPT_PREFIXES = 512
+_prompt_prefixes = OrderedDict()
+
+
+def cached_prompt_prefix(render, persona, persona_key):
+    """Returns the static prompt prefix for a persona, rendering it only the first time."""
+    key = (render.__name__, persona_key)
+    prefix = _prompt_prefixes.get(key)
+    if prefix is None:
+        prefix = _prompt_prefixes[key] = render(persona)
+        while len(_prompt_prefixes) > MAX_PROMPT_PREFIXES:
+            _prompt_prefixes.popitem(last=False)
+    else:
+        _prompt_prefixes.move_to_end(key)
+    return prefix
+
+
+def writer_prompt_prefix(persona):
+    """Renders the static persona and instructions part of the industry_news writer prompt."""
+    return f"""
+You are a professional writer crafting a text-only status update for Threads.net, specifically for **{persona['name']}**, whose persona is described below.
+
+**Your Goal:** Craft a compelling and engaging Threads status update that will resonate with {persona['typical_audience']} and spark discussion about the initial draft provided. **Your primary objective is to refine and enhance the existing draft while preserving its original story, context, and key points.** Avoid introducing new information or significantly altering the narrative. 
+
+**Concise User Persona Summary:**
+* **Name:** {persona['name']}
+* **Writing Style:** {persona['writing_style']}
+* **Topics of Interest:** {', '.join(persona['topics_of_interest']['tech'])}
+* **Content Preferences:** Posts about {', '.join(persona['content_preferences']['posts_about'])}
+
+**Instructions:**
+
+1. **Identify Core Themes and Narrative:** Before making any changes, carefully read the original draft to identify its central themes, narrative flow, and key arguments.
+2. **Incorporate Editor Feedback:** Consider the Editor's feedback, but prioritize maintaining the original story, context, and user intent. 
+3. **Avoid Past Mistakes:** Review previous versions and rejection reasons to avoid repeating the same errors.
+4. **Content Adherence Check:** Before submitting your draft, compare it to the initial draft. Ensure your draft closely aligns with the original topic and key points, and you have not deviated significantly from the original content.
+
+**Guidelines for the Perfect Status Update Structure (Tailored for {persona['name']}):
+
+1. Hook (10% of content, aim for 5-10 words):
+    * **Purpose:** Capture the reader's attention immediately. Consider using a surprising statistic, a bold statement, or vivid imagery.
+    * **Example:** Instead of saying "AI is changing the world," try "AI is rewriting the rules of business. Are you ready?"
+    * **Remember {persona['name']}'s interests:** Align the hook with {persona['name']}'s interest in {', '.join(persona['topics_of_interest']['tech'])}.
+
+2. Introduction (15% of content, aim for 8-15 words):
+    * **Purpose:** Briefly set the stage for the main topic. Concisely summarize the core idea or event.
+    * **Example:** If the topic is AI in healthcare, you might say, "AI is revolutionizing healthcare. Here's how."
+    * **Maintain {persona['name']}'s writing style:** Keep the introduction professional yet casual, reflecting {persona['name']}'s preferred style.
+
+3. Main Content (50% of content, aim for 25-40 words):
+    * **Purpose:** Dive deeper, providing details, insights, and analysis. Expand on the key point from the introduction.
+    * **Example:** You could provide a specific example of AI in healthcare, like "AI-powered diagnostics are improving accuracy and speed."
+    * **Showcase Expertise:** Present a unique angle or viewpoint that reflects {persona['name']}'s knowledge of {', '.join(persona['topics_of_interest']['tech'])}.
+
+4. Value Proposition (20% of content, aim for 10-20 words):
+    * **Purpose:** Demonstrate why this topic matters to the reader. Connect it to their interests or concerns.
+    * **Example:** Highlight the potential impact of AI in healthcare: "Faster diagnoses mean quicker treatment and better outcomes."
+    * **Target the Audience:** Consider what resonates with {persona['typical_audience']}.
+
+5. Call to Action (5% of content, aim for 8 words or less):
+    * **Purpose:** Encourage interaction and discussion. Use a question or a statement that prompts a response.
+    * **Example:** "What are your thoughts on AI in healthcare? Share your opinions below!"
+    * **Engage the Audience:** Use {persona['writing_style']} to create a casual and engaging call to action.
+
+**IMPORTANT RULE:** The status update can contain a maximum of **one** question. The question should be placed at the end of the status update and should aim to generate conversation by prompting the reader to think about the content discussed in the status update. 
+
+**Additional Guidelines:**
+
+* **Character Limit:** Ensure the update is between 450 and 500 characters.
+* **Content Type:** Text-only; no images or extraneous elements.
+* **No External References:** Do NOT include hashtags, links, or URLs.
+* **Conciseness:** Use abbreviations where appropriate and avoid jargon.
+* **Opinionated Stance:** Be opinionated and take a clear stance on the topic, reflecting {persona['name']}'s typical style.
+* **Structure:** Write in a single paragraph without subheadings or titles.
+* **Avoid Promotional Language:** Focus on being informative, engaging, and providing value to the reader. **Specifically, avoid overly enthusiastic or promotional language, such as "game-changer," "revolutionary," or "groundbreaking."**
+* **Grammar and Mechanics:** Ensure the draft is completely free of grammatical errors, spelling mistakes, and punctuation issues.
+* **Avoid Puns:** Please refrain from using puns in the status update. 
+
+**IMPORTANT:** Write {WRITER_CANDIDATES} different candidate versions of the status update. Each candidate must follow all of the rules above on its own. Please provide your response in JSON format with the following structure:
+
+```json
+{{
+  "drafts": ["first candidate", "second candidate", "third candidate"]
+}}
+```
+
+"""
+
+
+def editor_prompt_prefix(persona):
+    """Renders the static persona and review criteria part of the editor prompt."""
+    return f"""
+You are a professional editor reviewing a text-only status update for Threads.net, specifically for **{persona['name']}**, whose persona is described below.
+
+**Your Goal:** Collaborate with the writer to improve the draft and ensure it aligns with {persona['name']}'s persona, preferences, and target audience, **while preserving the original story, context, and key points of the initial draft.** Your feedback should focus on refining and enhancing the existing narrative rather than suggesting major rewrites or changes in direction.
+
+**Concise User Persona Summary:**
+* **Name:** {persona['name']}
+* **Writing Style:** {persona['writing_style']}
+* **Topics of Interest:** {', '.join(persona['topics_of_interest']['tech'])}
+* **Content Preferences:** Posts about {', '.join(persona['content_preferences']['posts_about'])}
+* **Target Audience:** {persona['typical_audience']}
+
+**Review the draft based on the following criteria and provide a score from 1 to 5, where 1 indicates "Needs Significant Improvement" and 5 indicates "Excellent."**
+
+**Scoring Guide:**
+
+* **1 - Needs Significant Improvement:** The draft has major issues that need to be addressed before it can be considered for posting.
+* **2 - Needs Improvement:** The draft has several areas that need improvement, but it shows potential.
+* **3 - Good with Room for Improvement:** The draft is generally good, but there are still some areas that could be improved.
+* **4 - Very Good:** The draft is well-written and engaging, with only minor areas for improvement.
+* **5 - Excellent:** The draft is outstanding and meets all the criteria exceptionally well.
+
+**Review Criteria:**
+
+* **Hook:** Does it capture attention with a compelling fact, statistic, or thought-provoking question? Is it relevant to {persona['name']}'s interests?
+* **Introduction:** Does it briefly summarize the key point of the topic? Is it in line with {persona['name']}'s preferred writing style?
+* **Main Content:** Does it expand on the introduction with details, insights, or analysis? Does it reflect {persona['name']}'s knowledge and opinions on the topic?
+* **Value Proposition:** Does it highlight the significance or impact of the topic? Does it resonate with {persona['name']}'s target audience?
+* **Call to Action:** Does it effectively encourage discussion and engagement? Does it avoid sounding promotional or salesy? Does it align with {persona['name']}'s casual and engaging writing style?
+* **Tone:** Is the tone neutral, informative, and engaging? Does it avoid being overly promotional, salesy, or PR-like? Is it consistent with {persona['name']}'s typically {persona['writing_style']} style? **Specifically, ensure it avoids overly enthusiastic or promotional language, such as "game-changer," "revolutionary," or "groundbreaking."**
+* **Grammar and Mechanics:** Is the draft completely free of grammatical errors, spelling mistakes, and punctuation issues? Ensure that sentences are well-structured, words are spelled correctly, and punctuation is used appropriately.
+* **Questions:** Does the draft contain no more than **one** question? Is the question placed at the end of the status update?  Does the question effectively encourage thoughtful responses related to the topic?
+* **Content Relevance:** Does the draft accurately reflect the core themes and narrative of the initial draft? Does it avoid introducing significant new information or arguments that were not present in the initial draft?
+
+**Positive Feedback:**
+
+* **What are the strengths of this draft? What aspects did the writer do well? Please be specific and provide examples.**
+
+**Feedback Instructions:**
+
+* **Constructive Criticism:** Instead of bullet points or lists, please provide your feedback in a conversational style, using complete sentences and paragraphs. Imagine you are speaking directly to the writer and offering suggestions in a friendly and helpful manner.  
+* **Focus on Solutions:** Offer specific solutions or alternative approaches to address any weaknesses.
+* **Balance Strengths and Weaknesses:** Highlight both the strengths and weaknesses of the draft to provide a balanced perspective.
+* **Professional and Respectful Tone:** Deliver your feedback in a professional and respectful tone, encouraging the writer's growth and development.
+* **Avoid Suggesting Hashtags:** Do not suggest adding hashtags.
+* **Focus on Feedback, Not Rewriting:** Your role is to analyze and provide feedback, not to write or suggest specific revisions.
+
+**Example (Conversational Feedback Style):**
+
+"Overall, this draft is pretty good! The hook is engaging and the main content is informative. However, the call to action could be a bit more compelling. Maybe try asking a question that directly relates to the reader's experience with AI, something like 'Have you noticed the impact of AI in your daily life?' This might encourage more interaction."
+
+**Ensure the status update is tailored to {persona['name']}'s persona, preferences, and target audience. Consider their interests in {', '.join(persona['topics_of_interest']['tech'])} and their {persona['writing_style']}.**
+
+**IMPORTANT:** Please provide your response in JSON format with the following structure:
+
+```json
+{{
+  "feedback": "Your feedback here",
+  "overall_score": your_numerical_score
+}}
+```
+
+"""
+
+
+# Content type of a draft that neither the local classifier nor the LLM could classify.
+DEFAULT_CONTENT_TYPE = "industry_news"
+
+
+def fallback_classification(classifier, draft):
+    """Classifies a draft the LLM failed to, so the session moves on to the writer.
+
+    Asking again would send the same temperature 0 prompt, so the local classifier's best
+    guess is used however unsure it is, or DEFAULT_CONTENT_TYPE when it isn't trained.
+    """
+    content_type, confidence = classifier.predict(draft, threshold=0.0)
+    metrics.inc("threads_classifier_decisions_total", source="fallback")
+    if content_type is None:
+        content_type = DEFAULT_CONTENT_TYPE
+        print(f"Could not classify the draft. Writing it as {content_type}.\n")
+    else:
+        print(f"Content classified locally as: {content_type} (confidence {confidence:.2f}, below the threshold)\n")
+    return {"status": "ready_for_writer", "content_type": content_type}
 
+
+async def content_classifier(state: StatusUpdateState) -> StatusUpdateState:
+    """Classifies the content as industry/general news or personal.
+
+    The local classifier answers when it is confident enough; otherwise the LLM is asked, and
+    its answer becomes a new training label for the local classifier.
+    """
     initial_draft = state["draft"]
+    classifier = get_content_classifier()
+    if classifier.needs_training():
+        # The first session after start-up trains on the stored labels, off the event loop.
+        await asyncio.to_thread(classifier.train)
+    content_type, confidence = classifier.predict(initial_draft)
+    if content_type is not None:
+        metrics.inc("threads_classifier_decisions_total", source="local")
+        print(f"Content classified locally as: {content_type} (confidence {confidence:.2f})\n")
+        return {"status": "ready_for_writer", "content_type": content_type}
+
+    print("The Content Classifier is analyzing the draft using a LLM...\n")
 
     prompt = f"""
     You are a content classifier tasked with determining whether a given text is more likely to be "industry_news" or "personal" in nature.
@@ -178,48 +852,38 @@ def content_classifier(state: StatusUpdateState) -> StatusUpdateState:
     """
 
     try:
-        response = make_api_call(prompt)
-        content_type_data = json.loads(response)
-        content_type = content_type_data["content_type"]
-    except RateLimitException:
-        print("Rate limit exceeded. Waiting...")
-        time.sleep(60)
-        response = make_api_call(prompt)
-        content_type_data = json.loads(response)
-        content_type = content_type_data["content_type"]
-    except json.JSONDecodeError as e:
-        print(f"Error decoding JSON response: {e}")
-        print("Returning to user for draft resubmission.")
-        return {"status": "initial", "editor_feedback": "Error decoding JSON response. Please resubmit your draft."}
-
-    state["content_type"] = content_type
+        content_type = (await make_api_call(prompt, schema=SCHEMAS["content_classifier"]))["content_type"]
+    except ResponseError as e:
+        print(f"Error reading the classifier's response: {e}")
+        metrics.emit("json_parse_failure", error=f"{type(e).__name__}: {e}")
+        return fallback_classification(classifier, initial_draft)
+    except CallFailed as e:
+        print(f"{e}\n")
+        return fallback_classification(classifier, initial_draft)
+    except DeadlineExceeded as e:
+        print(f"{e}\n")
+        return {}
+
+    metrics.inc("threads_classifier_decisions_total", source="llm")
+    if classifier.enabled and classifier.learn(initial_draft, content_type):
+        await asyncio.to_thread(classifier.train)
     print(f"Content classified as: {content_type}\n")
 
-    return {"status": "ready_for_writer"}
+    return {"status": "ready_for_writer", "content_type": content_type}
 
 
-def writer(state: StatusUpdateState) -> StatusUpdateState:
-    """Generates a draft of the status update using Google Gemini."""
-    state.update(increment_and_check_iterations(state))
-    print("The Writer is now assembling the status update...\n")
-    editor_feedback = state.get('editor_feedback', 'No editor feedback yet')
+def writer_prompt(state: StatusUpdateState, editor_feedback, writer_feedback):
+    """Builds the writer's (prefix, prompt) for revising state["draft"]."""
+    persona_key, persona = session_persona(state)
+    if writer_feedback:
+        writer_feedback = f"**Problems With Your Last Candidates:**\n{writer_feedback}"
 
-    # Build version history string, including character count rejections
-    version_history_str = ""
-    for i, version in enumerate(state["versions"]):
-        if i == 0:  # Skip the initial empty draft
-            continue
-        rejection_reason = ""
-        if i == len(state["versions"]) - 1:
-            rejection_reason = state["editor_feedback"]
-        elif len(version) > 500:  # Check if rejected due to character count
-            rejection_reason = f"Exceeded character limit ({len(version)} characters)."
-        else:
-            rejection_reason = state["editor_history"][i - 1]
-        version_history_str += f"## Version {i}:\n{version}\n**Reason for Rejection:** {rejection_reason}\n\n"
+    # Rejected versions are rendered incrementally and kept within a token budget (see history.py)
+    version_history_str = render_history(state.get("version_history") or empty_history())
 
     # Choose prompt based on content type
     if state["content_type"] == "personal":
+        prefix = ""
         prompt = f"""
         Edit the following into a Threads.net status update: 
 
@@ -227,181 +891,223 @@ def writer(state: StatusUpdateState) -> StatusUpdateState:
 
         Please avoid using overly enthusiastic or promotional language.
         Ensure the update is between 450 and 500 characters.
+        {writer_feedback}
+        Write {WRITER_CANDIDATES} different versions and provide your response in JSON format with the following structure:
+
+        ```json
+        {{
+          "drafts": ["first version", "second version", "third version"]
+        }}
+        ```
         """
     else:  # industry_news
+        prefix = cached_prompt_prefix(writer_prompt_prefix, persona, persona_key)
         prompt = f"""
-        You are a professional writer crafting a text-only status update for Threads.net, specifically for **{USER_PERSONA['name']}**, whose persona is described below.
-
-        **Your Goal:** Craft a compelling and engaging Threads status update that will resonate with {USER_PERSONA['typical_audience']} and spark discussion about the initial draft provided. **Your primary objective is to refine and enhance the existing draft while preserving its original story, context, and key points.** Avoid introducing new information or significantly altering the narrative. 
-
-        **Concise User Persona Summary:**
-        * **Name:** {USER_PERSONA['name']}
-        * **Writing Style:** {USER_PERSONA['writing_style']}
-        * **Topics of Interest:** {', '.join(USER_PERSONA['topics_of_interest']['tech'])}
-        * **Content Preferences:** Posts about {', '.join(USER_PERSONA['content_preferences']['posts_about'])}
-
         **Original Draft:** {state['draft']}
         **Carefully analyze the original draft to identify its core themes, narrative, and intended message. Use this understanding to guide your revisions, ensuring that you remain faithful to the user's original ideas and intent.**
 
         **Editor's Feedback:** {editor_feedback}
         **The Editor has reviewed the most recent version of the status update and provided feedback on its strengths and weaknesses. Consider the Editor's suggestions, but prioritize preserving the original story and context.**
+        {writer_feedback}
 
         **Previous Versions and Rejection Reasons:**
         {version_history_str}
         **This section contains previous versions of the status update that you attempted to write, along with the reasons why each version was rejected by the Editor or due to exceeding the character limit. Analyze each version and its rejection reason to understand the mistakes that were made and avoid repeating them in your current draft.**
 
-        **Instructions:**
-
-        1. **Identify Core Themes and Narrative:** Before making any changes, carefully read the original draft to identify its central themes, narrative flow, and key arguments.
-        2. **Incorporate Editor Feedback:** Consider the Editor's feedback, but prioritize maintaining the original story, context, and user intent. 
-        3. **Avoid Past Mistakes:** Review previous versions and rejection reasons to avoid repeating the same errors.
-        4. **Content Adherence Check:** Before submitting your draft, compare it to the initial draft. Ensure your draft closely aligns with the original topic and key points, and you have not deviated significantly from the original content.
-
-        **Guidelines for the Perfect Status Update Structure (Tailored for {USER_PERSONA['name']}):
-
-        1. Hook (10% of content, aim for 5-10 words):
-            * **Purpose:** Capture the reader's attention immediately. Consider using a surprising statistic, a bold statement, or vivid imagery.
-            * **Example:** Instead of saying "AI is changing the world," try "AI is rewriting the rules of business. Are you ready?"
-            * **Remember {USER_PERSONA['name']}'s interests:** Align the hook with {USER_PERSONA['name']}'s interest in {', '.join(USER_PERSONA['topics_of_interest']['tech'])}.
-
-        2. Introduction (15% of content, aim for 8-15 words):
-            * **Purpose:** Briefly set the stage for the main topic. Concisely summarize the core idea or event.
-            * **Example:** If the topic is AI in healthcare, you might say, "AI is revolutionizing healthcare. Here's how."
-            * **Maintain {USER_PERSONA['name']}'s writing style:** Keep the introduction professional yet casual, reflecting {USER_PERSONA['name']}'s preferred style.
-
-        3. Main Content (50% of content, aim for 25-40 words):
-            * **Purpose:** Dive deeper, providing details, insights, and analysis. Expand on the key point from the introduction.
-            * **Example:** You could provide a specific example of AI in healthcare, like "AI-powered diagnostics are improving accuracy and speed."
-            * **Showcase Expertise:** Present a unique angle or viewpoint that reflects {USER_PERSONA['name']}'s knowledge of {', '.join(USER_PERSONA['topics_of_interest']['tech'])}.
-
-        4. Value Proposition (20% of content, aim for 10-20 words):
-            * **Purpose:** Demonstrate why this topic matters to the reader. Connect it to their interests or concerns.
-            * **Example:** Highlight the potential impact of AI in healthcare: "Faster diagnoses mean quicker treatment and better outcomes."
-            * **Target the Audience:** Consider what resonates with {USER_PERSONA['typical_audience']}.
+        Write the candidates now, following all of the instructions and guidelines above.
+        """
+    return prefix, prompt
 
-        5. Call to Action (5% of content, aim for 8 words or less):
-            * **Purpose:** Encourage interaction and discussion. Use a question or a statement that prompts a response.
-            * **Example:** "What are your thoughts on AI in healthcare? Share your opinions below!"
-            * **Engage the Audience:** Use {USER_PERSONA['writing_style']} to create a casual and engaging call to action.
 
-        **IMPORTANT RULE:** The status update can contain a maximum of **one** question. The question should be placed at the end of the status update and should aim to generate conversation by prompting the reader to think about the content discussed in the status update. 
+# Speculative revisions in flight, by session id (see start_speculation).
+_speculations = {}
 
-        **Additional Guidelines:**
+# Stands in for the editor's feedback while the draft a speculative revision starts from is still being reviewed.
+SPECULATIVE_FEEDBACK = ("The Editor is still reviewing this draft. Revise it anyway: sharpen the hook, tighten the main "
+                        "point and make the closing question more engaging, while keeping the original story.")
 
-        * **Character Limit:** Ensure the update is between 450 and 500 characters.
-        * **Content Type:** Text-only; no images or extraneous elements.
-        * **No External References:** Do NOT include hashtags, links, or URLs.
-        * **Conciseness:** Use abbreviations where appropriate and avoid jargon.
-        * **Opinionated Stance:** Be opinionated and take a clear stance on the topic, reflecting {USER_PERSONA['name']}'s typical style.
-        * **Structure:** Write in a single paragraph without subheadings or titles.
-        * **Avoid Promotional Language:** Focus on being informative, engaging, and providing value to the reader. **Specifically, avoid overly enthusiastic or promotional language, such as "game-changer," "revolutionary," or "groundbreaking."**
-        * **Grammar and Mechanics:** Ensure the draft is completely free of grammatical errors, spelling mistakes, and punctuation issues.
-        * **Avoid Puns:** Please refrain from using puns in the status update. 
 
-        **IMPORTANT:** Please provide your response in JSON format with the following structure:
+def start_speculation(state: StatusUpdateState, draft):
+    """Starts writing the next revision of a draft that is about to be reviewed.
 
-        ```json
-        {{
-          "draft": "your generated status update here"
-        }}
-        ```
-        """
-
-    try:
-        response = make_api_call(prompt)
-        new_draft_data = json.loads(response)
-        new_draft = new_draft_data["draft"]
-    except RateLimitException:
-        print("Rate limit exceeded. Waiting...")
-        time.sleep(60)
-        response = make_api_call(prompt)
-        new_draft_data = json.loads(response)
-        new_draft = new_draft_data["draft"]
-    except json.JSONDecodeError as e:
-        print(f"Error decoding JSON response: {e}")
-        print("Returning to writer for revision.")
-        return {"status": "needs_revision", "editor_feedback": "Error decoding JSON response. Please try again."}
+    The revision runs alongside the relevance assessor and the editor, guided by the local
+    relevance score instead of the editor's feedback. review() cancels it if the draft is
+    approved; if the draft is rejected, the writer uses its candidates instead of calling the
+    model again. It only starts when there is spare quota (see GeminiClient.generate), so it
+    never waits in the limiter's queue ahead of other calls. The tokens it reserves can still
+    make a call that comes later wait for the buckets to refill.
+    """
+    session = metrics.current_session.get()
+    discard_speculation(session)
+    feedback = SPECULATIVE_FEEDBACK
+    relevance_score, _, _ = get_relevance_engine().assess(state["versions"][0], draft)
+    if relevance_score < MIN_RELEVANCE_SCORE:
+        feedback += " The draft has drifted from the initial draft; bring it back to its topic and key points."
+    prefix, prompt = writer_prompt(dict(state, draft=draft), feedback, "")
+    entry = {"draft": draft, "node": metrics.current_node.get(), "usage": add_usage({}, {}), "in_flight": 0}
+
+    async def revise():
+        _node_usage.set(entry["usage"])  # Charged to the session when the revision is used or discarded
+        entry["in_flight"] = estimate_tokens(prefix + prompt)  # Until make_api_call has charged the call
+        try:
+            return (await make_api_call(prompt, use_cache=False, prefix=prefix, schema=SCHEMAS["writer"],
+                                        speculative=True))["drafts"]
+        except model_client.QuotaUnavailable:
+            metrics.inc("threads_speculations_total", outcome="skipped")
+        except Exception as e:  # The writer makes its own call instead
+            metrics.inc("threads_speculations_total", outcome="failed")
+            metrics.emit("speculation_failed", error=f"{type(e).__name__}: {e}")
+        finally:
+            entry["in_flight"] = 0
+        return None
+
+    metrics.inc("threads_speculations_total", outcome="started")
+    entry["task"] = asyncio.ensure_future(revise())
+    _speculations[session] = entry
+
+
+def _charge_speculation(entry):
+    """Adds what a speculative revision spent to the usage of the node running now."""
+    usage = _node_usage.get()
+    if usage is None:
+        return
+    spent = entry["usage"]
+    for key in ("calls", "tokens", "prompt_tokens", "response_tokens"):
+        usage[key] += spent[key]
+    for node, counts in spent["nodes"].items():
+        node_usage = usage["nodes"].setdefault(node, dict.fromkeys(NODE_USAGE_KEYS, 0))
+        for key in ("calls", "prompt_tokens", "response_tokens"):
+            node_usage[key] += counts[key]
+
+
+def discard_speculation(session):
+    """Cancels a session's speculative revision, if it has one.
+
+    A call cancelled in flight is charged as one call with its estimated prompt tokens, since
+    the request was already sent.
+    """
+    entry = _speculations.pop(session, None)
+    if entry is None:
+        return
+    task = entry["task"]
+    if not task.done() or task.result() is not None:  # Skipped and failed revisions are already counted
+        metrics.inc("threads_speculations_total", outcome="discarded")
+    if entry["in_flight"]:
+        spent = entry["usage"]
+        node_usage = spent["nodes"].setdefault(entry["node"], dict.fromkeys(NODE_USAGE_KEYS, 0))
+        for counts in (spent, node_usage):
+            counts["calls"] += 1
+            counts["prompt_tokens"] += entry["in_flight"]
+        spent["tokens"] += entry["in_flight"]
+        entry["in_flight"] = 0
+    task.cancel()
+    _charge_speculation(entry)
+
+
+async def speculative_candidates(state: StatusUpdateState):
+    """Returns the candidates speculatively written from the draft the editor just rejected, or None."""
+    session = metrics.current_session.get()
+    entry = _speculations.get(session)
+    if entry is None:
+        return None
+    if state["status"] != "needs_revision" or entry["draft"] != state["draft"]:
+        discard_speculation(session)
+        return None
+    del _speculations[session]
+    candidates = await entry["task"]
+    _charge_speculation(entry)
+    if candidates:
+        metrics.inc("threads_speculations_total", outcome="used")
+    return candidates
+
+
+async def writer(state: StatusUpdateState) -> StatusUpdateState:
+    """Generates a draft of the status update using Google Gemini."""
+    print("The Writer is now assembling the status update...\n")
+    candidates = await speculative_candidates(state)
+    if candidates:
+        print("Using the revision the Writer started while the draft was being reviewed.")
+    else:
+        prefix, prompt = writer_prompt(state, state.get('editor_feedback', 'No editor feedback yet'),
+                                       state.get("writer_feedback", ""))
+        try:
+            # Each retry should sample new drafts. The first candidate is shown while it streams in.
+            candidates = (await make_api_call(prompt, use_cache=False, prefix=prefix, schema=SCHEMAS["writer"],
+                                              on_text=events.TextPreview("drafts", "draft_preview")))["drafts"]
+        except ResponseError as e:
+            print(f"Error reading the writer's response: {e}")
+            metrics.emit("json_parse_failure", error=f"{type(e).__name__}: {e}")
+            print("Returning to writer for revision.")
+            # The editor's feedback is kept for the next attempt.
+            return {"status": "editing",
+                    "writer_feedback": "Your last response was not valid JSON in the requested structure. Please try again."}
+        except CallFailed as e:
+            print(f"{e}\nReturning to writer for revision.\n")
+            return {"status": "editing"}
+        except DeadlineExceeded as e:
+            print(f"{e}\n")
+            return {}
 
     # --- Post-processing to remove double spaces after full stops ---
-    new_draft = new_draft.replace(".  ", ". ")
-    new_draft = new_draft.replace(",  ", ", ")
-    new_draft = new_draft.replace("?  ", "? ")
+    candidates = [
+        candidate.replace(".  ", ". ").replace(",  ", ", ").replace("?  ", "? ")
+        for candidate in candidates if isinstance(candidate, str) and candidate.strip()
+    ]
+    if not candidates:
+        print("The Writer returned no usable drafts. Trying again.\n")
+        return {"status": "editing", "writer_feedback": "Your last response contained no drafts. Please try again."}
+
+    new_draft, violations = select_candidate(candidates, state["versions"][0])
+    valid_count = 0
+    for candidate in candidates:
+        candidate_violations = lint(candidate)
+        valid_count += not candidate_violations
+        for rule, _ in candidate_violations:
+            metrics.inc("threads_writer_rejections_total", reason=rule)
+    print(f"The Writer produced {len(candidates)} candidate(s), {valid_count} within the constraints.")
 
-    # Conditional check for question marks (with error handling)
-    try:
-        question_mark_count = new_draft.count('?')
-        if question_mark_count > 1:  # Changed limit to 1
-            print(f"The Writer is making further revisions. The draft contains {question_mark_count} question marks, exceeding the limit of 1.\n")
-
-            # Extract and highlight questions
-            sentences = re.split(r'[.?!]', new_draft)
-            question_sentences = [sentence.strip() for sentence in sentences if "?" in sentence]
-            highlighted_questions = "\n".join([f"- **{sentence}**" for sentence in question_sentences])
-
-            excess_questions = question_mark_count - 1  # Adjusted excess calculation
-            state["editor_feedback"] += f"""
-            The draft contains too many question marks ({question_mark_count}). You have exceeded the limit of 1 questions by {excess_questions} question(s).
-
-            The following sentences contain questions:
+    char_count = len(new_draft)
+    print(f"Writer's Draft: {new_draft}")
 
-            {highlighted_questions}
+    if violations:
+        metrics.emit("writer_rejection", reasons=[rule for rule, _ in violations], character_count=char_count)
+        rules = ", ".join(rule for rule, _ in violations)
+        print(f"The Writer is making further revisions. The best candidate breaks these rules: {rules}.\n")
+        return {"status": "editing", "current_draft": new_draft,
+                "writer_feedback": lint_feedback(new_draft, violations),
+                "rejections": {"writer_lint": {rule: 1 for rule, _ in violations}}}
 
-            Remember, a Threads status update should ideally have a maximum of one questions. 
-            To help you revise: Consider removing or combining these questions, or rephrasing some as statements.
-            """
-            return {"status": "editing", "current_draft": new_draft}
+    print("The Writer has finished and is sending the draft to the Relevance Assessor and the Editor.\n")
+    if model_client.speculation_enabled():
+        start_speculation(state, new_draft)
+    return {"draft": new_draft, "current_draft": new_draft, "character_count": char_count,
+            "versions": [new_draft], "draft_count": 1, "status": "ready_for_review", "writer_feedback": ""}
 
-    except AttributeError as e:
-        print(f"Error: An AttributeError occurred during the question mark check: {e}")
-        print("This might indicate an issue with the generated draft. Returning to editing.")
-        state["editor_feedback"] += "\nAn error occurred during processing. Please try generating the draft again."
-        return {"status": "editing", "current_draft": new_draft}
 
-    char_count = len(new_draft)
-    print(f"Writer's Draft: {new_draft}")
 
-    # Character count check
-    if 450 <= char_count <= 500:
-        state["versions"].append(new_draft)
-        print("The Writer has finished and is sending the draft to the Editor.\n")
-        return {"draft": new_draft, "current_draft": new_draft, "character_count": char_count, "status": "ready_for_editor"}
+async def relevance_assessor(state: StatusUpdateState) -> StatusUpdateState:
+    """Assesses the relevance of the current draft to the initial draft.
 
-    else:
-        if char_count < 450:
-            missing_chars = 450 - char_count
-            print(f"The Writer is making further revisions to meet the character limit. The draft is {missing_chars} characters too short.\n")
-            state["editor_feedback"] += f"""
-            The draft is {missing_chars} characters too short. The current character count is {char_count}. Aim for a length between 450 and 500 characters.
-
-            To help you revise: Consider elaborating on these areas:
-            - Provide more context or background information about the topic.
-            - Add details or examples to support your main points.
-            - Expand the call to action to make it more engaging. 
-            """
-        else:  # char_count > 500
-            excess_chars = char_count - 500
-            print(f"The Writer is making further revisions to meet the character limit. The draft is {excess_chars} characters too long.\n")
-            state["editor_feedback"] += f"""
-            The draft is {excess_chars} characters too long. The current character count is {char_count}. Aim for a length between 450 and 500 characters.
-
-            To help you revise: Consider condensing these areas:
-            - Shorten phrases or use abbreviations where appropriate.
-            - Remove unnecessary words or redundant information. 
-            - Focus on the most critical points and streamline the message. 
-            """
-
-        return {"status": "editing", "current_draft": new_draft}
-
-
-
-def relevance_assessor(state: StatusUpdateState) -> StatusUpdateState:
-    """Assesses the relevance of the current draft to the initial draft using Google Gemini."""
-    state.update(increment_and_check_iterations(state))
+    The local relevance engine scores the draft first; Google Gemini is only asked when the
+    local similarity falls in the ambiguous range.
+    """
     print("The Relevance Assessor is evaluating the draft's relevance to the initial draft...\n")
 
     initial_draft = state["versions"][0]
     current_draft = state["draft"]
 
+    relevance_score, similarity, ambiguous = get_relevance_engine().assess(initial_draft, current_draft)
+    print(f"Local relevance similarity: {similarity:.2f} (score {relevance_score})")
+    if not ambiguous:
+        relevance_feedback = ""
+        if relevance_score < 4:
+            relevance_feedback = ("The revised draft shares little wording with the initial draft. "
+                                  "Bring it back to the original topic and key points.")
+        print(f"Relevance Score: {relevance_score}")
+        print("The Relevance Assessor has finished.\n")
+        return {"relevance_score": relevance_score, "relevance_feedback": relevance_feedback}
+    print("The local score is ambiguous. Asking the LLM for a relevance assessment.")
+
     prompt = f"""
     You are a relevance assessor tasked with evaluating how well a revised text aligns with the core themes and narrative of an initial text.
 
@@ -437,52 +1143,34 @@ def relevance_assessor(state: StatusUpdateState) -> StatusUpdateState:
     """
 
     try:
-        response = make_api_call(prompt)
-        relevance_data = json.loads(response)
-        relevance_score = int(relevance_data["relevance_score"])  # Convert score to integer
-        relevance_feedback = relevance_data.get("relevance_feedback", "")
-    except RateLimitException:
-        print("Rate limit exceeded. Waiting...")
-        time.sleep(60)
-        response = make_api_call(prompt)
-        relevance_data = json.loads(response)
-        relevance_score = int(relevance_data["relevance_score"])
+        relevance_data = await make_api_call(prompt, schema=SCHEMAS["relevance_assessor"])
+        relevance_score = relevance_data["relevance_score"]
         relevance_feedback = relevance_data.get("relevance_feedback", "")
-    except json.JSONDecodeError as e:
-        print(f"Error decoding JSON response: {e}")
-        print("Returning to writer for revision.")
-        return {"status": "needs_revision",
-                "editor_feedback": "Error decoding JSON response from Relevance Assessor. Please try again."}
-
-    state["relevance_score"] = relevance_score
-    state["relevance_feedback"] = relevance_feedback
+    except ResponseError as e:
+        print(f"Error reading the relevance assessor's response: {e}")
+        metrics.emit("json_parse_failure", error=f"{type(e).__name__}: {e}")
+        print("Continuing without a relevance score.")
+        return {"relevance_score": 0, "relevance_feedback": ""}
+    except (CallFailed, DeadlineExceeded) as e:
+        print(f"{e} Continuing without a relevance score.\n")
+        return {"relevance_score": 0, "relevance_feedback": ""}
 
     print(f"Relevance Score: {relevance_score}")
     print(f"Relevance Feedback: {relevance_feedback}")
 
-    print("The Relevance Assessor has finished. Sending the draft to the Editor.\n")
-    return {"status": "ready_for_editor"}
+    print("The Relevance Assessor has finished.\n")
+    return {"relevance_score": relevance_score, "relevance_feedback": relevance_feedback}
 
 
-def editor(state: StatusUpdateState) -> StatusUpdateState:
+async def editor(state: StatusUpdateState) -> StatusUpdateState:
     """Reviews the draft and provides feedback using Google Gemini."""
-    state.update(increment_and_check_iterations(state))
     print("The Editor is reviewing the draft...\n")
 
+    persona_key, persona = session_persona(state)
     key_points = extract_key_points(state['versions'][0])  # Extract key points dynamically
 
+    prefix = cached_prompt_prefix(editor_prompt_prefix, persona, persona_key)
     prompt = f"""
-You are a professional editor reviewing a text-only status update for Threads.net, specifically for **{USER_PERSONA['name']}**, whose persona is described below.
-
-**Your Goal:** Collaborate with the writer to improve the draft and ensure it aligns with {USER_PERSONA['name']}'s persona, preferences, and target audience, **while preserving the original story, context, and key points of the initial draft.** Your feedback should focus on refining and enhancing the existing narrative rather than suggesting major rewrites or changes in direction.
-
-**Concise User Persona Summary:**
-* **Name:** {USER_PERSONA['name']}
-* **Writing Style:** {USER_PERSONA['writing_style']}
-* **Topics of Interest:** {', '.join(USER_PERSONA['topics_of_interest']['tech'])}
-* **Content Preferences:** Posts about {', '.join(USER_PERSONA['content_preferences']['posts_about'])}
-* **Target Audience:** {USER_PERSONA['typical_audience']}
-
 **Draft:** {state['draft']}
 
 **Initial Draft:** {state['versions'][0]} 
@@ -492,117 +1180,186 @@ You are a professional editor reviewing a text-only status update for Threads.ne
 {key_points}
 **Ensure that the current draft accurately reflects these key points and does not introduce significant new information or arguments that were not present in the initial draft.**
 
-**Review the draft based on the following criteria and provide a score from 1 to 5, where 1 indicates "Needs Significant Improvement" and 5 indicates "Excellent."**
+Review this draft now, following all of the criteria and instructions above.
+"""
 
-**Scoring Guide:**
+    try:
+        feedback_data = await make_api_call(prompt, prefix=prefix, schema=SCHEMAS["editor"],
+                                            on_text=events.TextPreview("feedback", "feedback_preview"))
+        feedback = feedback_data["feedback"]
+        score = feedback_data["overall_score"]
+    except ResponseError as e:
+        print(f"Error reading the editor's response: {e}")
+        metrics.emit("json_parse_failure", error=f"{type(e).__name__}: {e}")
+        print("Returning to writer for revision.")
+        return {"editor_score": 0, "editor_feedback": "Error decoding JSON response. Please try again."}
+    except CallFailed as e:
+        print(f"{e}\nReturning to writer for revision.\n")
+        return {"editor_score": 0}
+    except DeadlineExceeded as e:
+        print(f"{e}\n")
+        return {"editor_score": 0}
 
-* **1 - Needs Significant Improvement:** The draft has major issues that need to be addressed before it can be considered for posting.
-* **2 - Needs Improvement:** The draft has several areas that need improvement, but it shows potential.
-* **3 - Good with Room for Improvement:** The draft is generally good, but there are still some areas that could be improved.
-* **4 - Very Good:** The draft is well-written and engaging, with only minor areas for improvement.
-* **5 - Excellent:** The draft is outstanding and meets all the criteria exceptionally well.
+    print(f"Editor Feedback: {feedback}")
+    print(f"Editor Score: {score}")
 
-**Review Criteria:**
+    print("The Editor has finished.\n")
+    return {"editor_score": score, "editor_feedback": feedback, "editor_history": [feedback],
+            "editor_scores": [score]}
 
-* **Hook:** Does it capture attention with a compelling fact, statistic, or thought-provoking question? Is it relevant to {USER_PERSONA['name']}'s interests?
-* **Introduction:** Does it briefly summarize the key point of the topic? Is it in line with {USER_PERSONA['name']}'s preferred writing style?
-* **Main Content:** Does it expand on the introduction with details, insights, or analysis? Does it reflect {USER_PERSONA['name']}'s knowledge and opinions on the topic?
-* **Value Proposition:** Does it highlight the significance or impact of the topic? Does it resonate with {USER_PERSONA['name']}'s target audience?
-* **Call to Action:** Does it effectively encourage discussion and engagement? Does it avoid sounding promotional or salesy? Does it align with {USER_PERSONA['name']}'s casual and engaging writing style?
-* **Tone:** Is the tone neutral, informative, and engaging? Does it avoid being overly promotional, salesy, or PR-like? Is it consistent with {USER_PERSONA['name']}'s typically {USER_PERSONA['writing_style']} style? **Specifically, ensure it avoids overly enthusiastic or promotional language, such as "game-changer," "revolutionary," or "groundbreaking."**
-* **Grammar and Mechanics:** Is the draft completely free of grammatical errors, spelling mistakes, and punctuation issues? Ensure that sentences are well-structured, words are spelled correctly, and punctuation is used appropriately.
-* **Questions:** Does the draft contain no more than **one** question? Is the question placed at the end of the status update?  Does the question effectively encourage thoughtful responses related to the topic?
-* **Content Relevance:** Does the draft accurately reflect the core themes and narrative of the initial draft? Does it avoid introducing significant new information or arguments that were not present in the initial draft?
 
-**Positive Feedback:**
+# Default per-session limits. A session that reaches any of them stops with its best-scoring draft.
+DEFAULT_BUDGET = {
+    "max_iterations": 30,  # Node runs
+    "max_calls": 30,  # Model calls, not counting response cache hits
+    "max_tokens": 100_000,  # Prompt and response tokens, not counting prefixes served from the context cache
+    "max_seconds": 300,  # Time spent in the workflow's nodes, not counting the user's or the rate limiter's
+}
 
-* **What are the strengths of this draft? What aspects did the writer do well? Please be specific and provide examples.**
 
-**Feedback Instructions:**
+def validate_budget(budget):
+    """Raises ValueError unless budget is a dict of DEFAULT_BUDGET limits, each a positive number."""
+    if not isinstance(budget, dict):
+        raise ValueError(f"A budget must be an object, not {type(budget).__name__}")
+    for key, value in budget.items():
+        if key not in DEFAULT_BUDGET:
+            raise ValueError(f"Unknown budget limit '{key}'. Use any of: {', '.join(DEFAULT_BUDGET)}")
+        if isinstance(value, bool) or not isinstance(value, (int, float)) or not value > 0:
+            raise ValueError(f"Budget limit '{key}' must be a positive number, not {value!r}")
 
-* **Constructive Criticism:** Instead of bullet points or lists, please provide your feedback in a conversational style, using complete sentences and paragraphs. Imagine you are speaking directly to the writer and offering suggestions in a friendly and helpful manner.  
-* **Focus on Solutions:** Offer specific solutions or alternative approaches to address any weaknesses.
-* **Balance Strengths and Weaknesses:** Highlight both the strengths and weaknesses of the draft to provide a balanced perspective.
-* **Professional and Respectful Tone:** Deliver your feedback in a professional and respectful tone, encouraging the writer's growth and development.
-* **Avoid Suggesting Hashtags:** Do not suggest adding hashtags.
-* **Focus on Feedback, Not Rewriting:** Your role is to analyze and provide feedback, not to write or suggest specific revisions.
 
-**Example (Conversational Feedback Style):**
+def seconds_left(state: StatusUpdateState):
+    """Returns how many seconds of its time budget the session has left."""
+    budget = dict(DEFAULT_BUDGET, **(state.get("budget") or {}))
+    return budget["max_seconds"] - (state.get("usage") or {}).get("seconds", 0)
 
-"Overall, this draft is pretty good! The hook is engaging and the main content is informative. However, the call to action could be a bit more compelling. Maybe try asking a question that directly relates to the reader's experience with AI, something like 'Have you noticed the impact of AI in your daily life?' This might encourage more interaction."
 
-**Ensure the status update is tailored to {USER_PERSONA['name']}'s persona, preferences, and target audience. Consider their interests in {', '.join(USER_PERSONA['topics_of_interest']['tech'])} and their {USER_PERSONA['writing_style']}.**
+# Graph steps a session may still take once it used up max_iterations: the review join, the user and finalize.
+RECURSION_MARGIN = 5
 
-**IMPORTANT:** Please provide your response in JSON format with the following structure:
 
-```json
-{{
-  "feedback": "Your feedback here",
-  "overall_score": your_numerical_score
-}}
-```
-  """
+def session_recursion_limit(state: StatusUpdateState):
+    """Returns the graph recursion limit for running a session on from state.
 
-    try:
-        response = make_api_call(prompt)
-        feedback_data = json.loads(response)
-        feedback = feedback_data["feedback"]
-        score = int(feedback_data["overall_score"])  # Convert score to int
-    except RateLimitException:
-        print("Rate limit exceeded. Waiting...")
-        time.sleep(60)  # Wait for 1 minute before retrying
-        response = make_api_call(prompt)  # Retry the API call
-        feedback_data = json.loads(response)
-        feedback = feedback_data["feedback"]
-        score = int(feedback_data["overall_score"])
-    except json.JSONDecodeError as e:
-        print(f"Error decoding JSON response: {e}")
-        print("Returning to writer for revision.")
-        return {"status": "needs_revision", "editor_feedback": "Error decoding JSON response. Please try again."}
+    Each graph step runs at least one node and every node run counts against max_iterations,
+    so a session stops through finalize with "iteration_limit" before it reaches this limit,
+    however large its budget.
+    """
+    budget = dict(DEFAULT_BUDGET, **(state.get("budget") or {}))
+    return max(int(budget["max_iterations"]) - state.get("iteration_count", 0), 0) + RECURSION_MARGIN
+
+APPROVAL_SCORE = 4  # Lowest editor score that sends a draft to the user for approval
+MIN_RELEVANCE_SCORE = 3  # Drafts the relevance assessor scores lower go back to the writer
+CONVERGENCE_WINDOW = 3  # Stop when this many editor reviews in a row don't beat the best earlier score
+SIMILAR_DRAFT_THRESHOLD = 0.9  # Or when a revision this similar to the previous draft doesn't score higher
 
-    print(f"Editor Feedback: {feedback}")
-    print(f"Editor Score: {score}")
 
-    # Append feedback to editor_history
-    state["editor_history"].append(feedback)
+def review(state: StatusUpdateState) -> StatusUpdateState:
+    """Joins the relevance assessment and the editor's review of a draft into one decision.
 
-    if score >= 4:
+    A relevance score of 0 means the assessment failed; the editor's review then decides alone.
+    """
+    score = state["editor_score"]
+    if not score:
+        print("The Editor's review failed. Sending the draft back to the Writer.\n")
+        return {"status": "needs_revision"}
+
+    update = {}
+    if score > state.get("best_score", 0):
+        update.update(best_draft=state["draft"], best_score=score)
+    relevance_score = state["relevance_score"]
+    relevant = not relevance_score or relevance_score >= MIN_RELEVANCE_SCORE
+
+    if score >= APPROVAL_SCORE and relevant:
         end_time = datetime.now()
         print(f"Editor approval time: {end_time.strftime('%H:%M:%S')}")
 
         # Convert start_time to datetime object if it's a float
-        if isinstance(state["start_time"], float):
-            state["start_time"] = datetime.fromtimestamp(state["start_time"])
+        start_time = state["start_time"]
+        if isinstance(start_time, float):
+            start_time = datetime.fromtimestamp(start_time)
 
         # Calculate duration using datetime
-        duration = end_time - state["start_time"]
+        duration = end_time - start_time
         duration_minutes = int(duration.total_seconds() // 60)
         remaining_seconds = duration.total_seconds() % 60
 
         print(f"Time from initial draft to editor approval: {duration_minutes} minutes and {remaining_seconds:.2f} seconds")
 
         print("The Editor has approved the draft. Sending it to the User for final approval.\n")
-        return {"status": "user_approval", "editor_feedback": feedback}
-    else:
-        print("The Editor has requested revisions. Sending the draft back to the Writer.\n")
-        return {"status": "needs_revision", "editor_feedback": feedback}
-
-
-def should_continue(state: StatusUpdateState) -> str:
+        discard_speculation(metrics.current_session.get())
+        return {"status": "user_approval", **update}
+
+    feedback = state["editor_feedback"]
+    source = "editor" if score < APPROVAL_SCORE else ""
+    categories = [f"editor_score_{score}"] if source else []
+    if not relevant:
+        source = f"{source}_relevance" if source else "relevance"
+        categories.append(f"relevance_score_{relevance_score}")
+        print(f"The draft strayed from the initial draft (relevance score {relevance_score}).")
+        feedback += f"\n\n**Relevance (score {relevance_score}):** " + (
+            state["relevance_feedback"] or "The draft strays from the initial draft's topic and key points.")
+    print("Revisions requested. Sending the draft back to the Writer.\n")
+    return {"status": "needs_revision", "editor_feedback": feedback,
+            **record_rejection(state, feedback, source, "+".join(categories)), **update}
+
+
+def stop_reason(state: StatusUpdateState):
+    """Returns why the session should stop revising, or "" if it should keep going."""
+    budget = dict(DEFAULT_BUDGET, **(state.get("budget") or {}))
+    usage = state.get("usage") or {}
+    if state["iteration_count"] >= budget["max_iterations"]:
+        return "iteration_limit"
+    if usage.get("calls", 0) >= budget["max_calls"]:
+        return "call_budget"
+    if usage.get("tokens", 0) >= budget["max_tokens"]:
+        return "token_budget"
+    if seconds_left(state) <= 0:
+        return "time_budget"
+
+    # Only check for convergence after the editor asked for another revision, not the user.
+    scores = state.get("editor_scores") or []
+    if state["status"] != "needs_revision" or not scores or scores[-1] >= APPROVAL_SCORE:
+        return ""
+    if len(scores) > CONVERGENCE_WINDOW and max(scores[-CONVERGENCE_WINDOW:]) <= max(scores[:-CONVERGENCE_WINDOW]):
+        return "score_plateau"
+    versions = state["versions"]
+    if (len(scores) > 1 and scores[-1] <= scores[-2] and len(versions) > 2
+            and draft_similarity(versions[-1], versions[-2]) >= SIMILAR_DRAFT_THRESHOLD):
+        return "drafts_converged"
+    return ""
+
+
+def finalize(state: StatusUpdateState) -> StatusUpdateState:
+    """Stops a session that ran out of budget or stopped improving, keeping its best-scoring draft."""
+    reason = stop_reason(state)
+    discard_speculation(metrics.current_session.get())
+    draft = state.get("best_draft") or state["draft"]
+    status = "converged" if reason in ("score_plateau", "drafts_converged") else "budget_exhausted"
+    usage = state.get("usage") or {}
+    print(f"Stopping revisions ({reason}) after {state['iteration_count']} steps, {usage.get('calls', 0)} model calls "
+          f"and about {usage.get('tokens', 0)} tokens.")
+    print(f"Keeping the best draft so far (editor score {state.get('best_score', 0)}).\n")
+    return {"draft": draft, "character_count": len(draft), "status": status, "exit_reason": reason}
+
+
+def should_continue(state: StatusUpdateState):
     """Determines the next step in the workflow based on the current state."""
+    from langgraph.constants import END
+
     print(f"Deciding next step. Current status: {state['status']}")
-    if state["iteration_count"] > 30:
-        return END
-    if state["status"] == "approved":
+    if state["status"] in ("approved", "converged", "budget_exhausted"):
         return END
+    if state["status"] != "user_approval" and stop_reason(state):
+        return "finalize"
     elif state["status"] == "draft_submitted":
         return "content_classifier" #  New flow
     elif state["status"] == "ready_for_writer":
         return "writer"
     elif state["status"] == "needs_revision":
         return "writer"
-    elif state["status"] == "ready_for_editor":
-        return "editor"
+    elif state["status"] in ("ready_for_review", "ready_for_relevance", "ready_for_editor"):
+        return ["relevance_assessor", "editor"]  # Reviewed in parallel, then joined in review
     elif state["status"] == "user_approval":
         return "user"
     elif state["status"] == "editing":
@@ -612,53 +1369,170 @@ def should_continue(state: StatusUpdateState) -> str:
         return END
 
 
-# Create the graph
-workflow = StateGraph(StatusUpdateState)
+_workflow = None
 
-# Add nodes
-workflow.add_node("user", user)
-workflow.add_node("content_classifier", content_classifier) # New node
-workflow.add_node("writer", writer)
-workflow.add_node("relevance_assessor", relevance_assessor)
-workflow.add_node("editor", editor)
 
-# Set up the flow
-workflow.set_entry_point("user")
-workflow.add_conditional_edges("user", should_continue)
-workflow.add_conditional_edges("content_classifier", should_continue) # New edge
-workflow.add_conditional_edges("writer", should_continue)
-workflow.add_conditional_edges("relevance_assessor", should_continue)
-workflow.add_conditional_edges("editor", should_continue)
+def get_workflow():
+    """Builds the state graph on first use."""
+    global _workflow
+    if _workflow is None:
+        from langgraph.graph import StateGraph
 
-# Compile the graph
-app = workflow.compile()
+        # Create the graph
+        workflow = StateGraph(StatusUpdateState)
 
+        # Add nodes
+        workflow.add_node("user", metrics.timed_node("user", tracked_node(user, count_time=False)))
+        workflow.add_node("content_classifier", metrics.timed_node("content_classifier", tracked_node(content_classifier))) # New node
+        workflow.add_node("writer", metrics.timed_node("writer", tracked_node(writer)))
+        workflow.add_node("relevance_assessor", metrics.timed_node("relevance_assessor", tracked_node(relevance_assessor, parallel=True)))
+        workflow.add_node("editor", metrics.timed_node("editor", tracked_node(editor, parallel=True)))
+        workflow.add_node("review", metrics.timed_node("review", tracked_node(review, join=True)))
+        workflow.add_node("finalize", metrics.timed_node("finalize", tracked_node(finalize)))
+
+        # Set up the flow
+        workflow.set_entry_point("user")
+        workflow.add_conditional_edges("user", should_continue)
+        workflow.add_conditional_edges("content_classifier", should_continue) # New edge
+        workflow.add_conditional_edges("writer", should_continue)
+        # The relevance assessor and the editor review each draft in parallel; review waits for both.
+        workflow.add_edge(["relevance_assessor", "editor"], "review")
+        workflow.add_conditional_edges("review", should_continue)
+        workflow.add_conditional_edges("finalize", should_continue)
+        _workflow = workflow
+    return _workflow
+
+
+_system_message = None
 
-def main():
-    # Initialize the state with an empty initial draft.
-    # The user will be prompted for the draft within the 'user' node function.
-    initial_draft = ""
 
-    # Initialize the state
-    initial_state = {
-        "messages": [SystemMessage(content="You are helping create a threads.net status update.")],
-        "draft": initial_draft,
+def system_message():
+    """Returns the system message every session starts with, one instance shared by all of them."""
+    global _system_message
+    if _system_message is None:
+        from langchain_core.messages import SystemMessage
+        _system_message = SystemMessage(content="You are helping create a threads.net status update.")
+    return _system_message
+
+
+def build_initial_state(draft="", persona=None, approval_policy="interactive", budget=None, persona_id=None):
+    """Builds the initial state for a new status update session.
+
+    The session writes as the registered persona persona_id (DEFAULT_PERSONA_ID if neither is
+    given), or as `persona` when a persona dict is passed. budget overrides any of the
+    DEFAULT_BUDGET limits for this session.
+
+    Raises KeyError for an unknown persona id and ValueError for an incomplete persona or an
+    invalid budget, so bad input fails before the session starts.
+    """
+    from personas import intern_persona, validate_persona
+
+    if persona is None:
+        persona_id = persona_id or DEFAULT_PERSONA_ID
+        get_persona_registry().get(persona_id)
+    else:
+        validate_persona(persona, "persona")
+        persona = intern_persona(persona)
+    validate_budget(budget or {})
+
+    return {
+        "messages": [system_message()],
+        "draft": draft,
         "current_draft": "",
-        "character_count": len(initial_draft),
+        "character_count": len(draft),
         "status": "initial",
-        "versions": [initial_draft],
+        "versions": [draft],
+        "draft_count": 0,
         "editor_feedback": "",
         "iteration_count": 0,
         "editor_history": [],
         "start_time": 0.0,
         "relevance_score": 0,
+        "editor_score": 0,
         "relevance_feedback": "",
-        "content_type": "" # Initialize content type
+        "content_type": "",  # Initialize content type
+        "persona_id": "" if persona is not None else persona_id,
+        "persona": persona or {},
+        "approval_policy": approval_policy,
+        "writer_feedback": "",
+        "version_history": empty_history(),
+        "rejections": {},
+        "usage": add_usage({}, {}),
+        "budget": dict(budget or {}),  # Only the overrides; stop_reason() fills in DEFAULT_BUDGET
+        "editor_scores": [],
+        "best_draft": "",
+        "best_score": 0,
+        "exit_reason": "",
     }
 
-    # Run the graph with increased recursion limit
-    app_with_config = app.with_config({"recursion_limit": 500})
-    result = app_with_config.invoke(initial_state)
+
+def add_budget_arguments(parser):
+    """Adds the per-session budget options to an argument parser."""
+    parser.add_argument("--max-iterations", type=int, help=f"Node runs per session (default: {DEFAULT_BUDGET['max_iterations']})")
+    parser.add_argument("--max-calls", type=int, help=f"Model calls per session (default: {DEFAULT_BUDGET['max_calls']})")
+    parser.add_argument("--max-tokens", type=int, help=f"Prompt and response tokens per session (default: {DEFAULT_BUDGET['max_tokens']})")
+    parser.add_argument("--max-seconds", type=float,
+                        help=f"Seconds spent in the workflow per session (default: {DEFAULT_BUDGET['max_seconds']})")
+
+
+def budget_from_args(args):
+    """Returns the budget limits given on the command line."""
+    return {key: getattr(args, key) for key in DEFAULT_BUDGET if getattr(args, key, None) is not None}
+
+
+def use_cassette(args):
+    """Routes model calls through the cassette requested with --record or --replay, if any.
+
+    Returns the cassette client, which the caller closes when the run is over.
+    """
+    import cassette
+
+    client = cassette.client_from_args(args, get_client)
+    if client is not None:
+        set_client(client)
+        # A fresh in-memory response cache, no local classification and no speculative
+        # revisions make recording and replay see exactly the same calls.
+        set_response_cache(ResponseCache(":memory:"))
+        get_content_classifier().enabled = False
+        model_client.set_speculation(False)
+    return client
+
+
+async def run_session(initial_state, session_id, on_event=None):
+    """Runs (or resumes) one session with checkpoints saved after every node.
+
+    on_event is called with each event of the session as it happens (see events.py).
+    """
+    from checkpoints import checkpointed_app, run_or_resume
+
+    async with checkpointed_app(get_workflow()) as checkpointed:
+        try:
+            return await run_or_resume(checkpointed, initial_state, session_id, on_event=on_event,
+                                       history=get_run_history())
+        finally:
+            discard_speculation(session_id)  # A session that failed mid-review may have left one running
+
+
+def run_interactive(session_id=None, budget=None, on_event=None, persona_id=None):
+    """Creates a status update interactively, or continues an interrupted session."""
+    from checkpoints import new_session_id
+
+    # Initialize the state with an empty initial draft.
+    # The user will be prompted for the draft within the 'user' node function.
+    try:
+        initial_state = None if session_id else build_initial_state(budget=budget, persona_id=persona_id)
+    except (KeyError, ValueError) as e:
+        print(f"Error: {e.args[0]}")
+        return
+    session_id = session_id or new_session_id()
+    print(f"Session ID: {session_id} (if interrupted, continue with: python main.py resume {session_id})")
+
+    # Run the graph with a recursion limit sized to its iteration budget, checkpointing after every node
+    try:
+        result = asyncio.run(run_session(initial_state, session_id, on_event))
+    except KeyError as e:
+        print(f"Error: {e.args[0]}")
+        return
 
     # Print the final result
     print("\nFinal State:")
@@ -666,15 +1540,96 @@ def main():
     print(f"Character Count: {result['character_count']}")
     print(f"Final Status: {result['status']}")
     print(f"Total Iterations: {result['iteration_count']}")
+    if result.get("exit_reason"):
+        print(f"Stopped Early: {result['exit_reason']} (best editor score {result.get('best_score', 0)})")
+    usage = result.get("usage") or {}
+    print(f"Model Usage: {usage.get('calls', 0)} calls, about {usage.get('tokens', 0)} tokens, "
+          f"{usage.get('seconds', 0):.1f}s in the workflow")
+    for node, counts in (usage.get("nodes") or {}).items():
+        if not counts.get("calls"):
+            continue
+        print(f"  {node}: {counts['calls']} calls, about {counts['prompt_tokens']} prompt and "
+              f"{counts['response_tokens']} response tokens ({NODE_MODELS.get(node, {}).get('model', MODEL_NAME)})")
     print("\nVersion History:")
-    for i, version in enumerate(result['versions'], 1):
+    versions = result['versions']
+    # Only the initial draft and the latest drafts are kept (MAX_KEPT_VERSIONS)
+    first_kept = draft_count(result) + 3 - len(versions)
+    numbers = [1] + list(range(first_kept, first_kept + len(versions) - 1))
+    if len(versions) > 1 and first_kept > 2:
+        print(f"({first_kept - 2} earlier version(s) not kept)")
+    for i, version in zip(numbers, versions):
         print(f"Version {i}: {version[:50]}...")  # Print first 50 characters of each version
     print("\nFinal Editor Feedback:")
     print(result.get('editor_feedback', 'No editor feedback available'))
     print("\nMessages:")
     for message in result['messages']:
         print(f"- {message.content}")
+    print(f"\nResponse Cache: {response_cache.stats()}")
 
 
-if __name__ == "__main__":
-    main()
+# Subcommands run by other modules: name -> (module, help). A module is only imported when its
+# subcommand is chosen, so the others' dependencies are never loaded.
+SUBCOMMANDS = {
+    "batch": ("batch", "run many drafts unattended"),
+    "bench": ("bench", "measure throughput and iterations offline with a fake model"),
+    "serve": ("service", "accept draft jobs over HTTP"),
+    "report": ("run_history", "summarize the sessions in the run history"),
+}
+
+
+def main(argv=None):
+    import importlib
+    import sys
+
+    import cassette
+
+    argv = sys.argv[1:] if argv is None else argv
+    command = next((arg for arg in argv if not arg.startswith("-")), None)
+    parser = argparse.ArgumentParser(description="Create Threads.net status updates with Google Gemini.")
+    subparsers = parser.add_subparsers(dest="command", metavar="command")
+    run_parser = subparsers.add_parser("run", help="create a status update interactively (the default)")
+    metrics.add_arguments(run_parser)
+    model_client.add_arguments(run_parser)
+    cassette.add_arguments(run_parser)
+    events.add_arguments(run_parser)
+    run_parser.add_argument("--persona", metavar="ID", help="write as this persona (see the 'personas' command)")
+    add_budget_arguments(run_parser)
+    resume_parser = subparsers.add_parser("resume", help="continue an interrupted session from its last completed node")
+    resume_parser.add_argument("session_id", help="the session ID printed when the session started")
+    metrics.add_arguments(resume_parser)
+    model_client.add_arguments(resume_parser)
+    cassette.add_arguments(resume_parser)
+    events.add_arguments(resume_parser)
+    subcommand = None
+    for name, (module_name, help_text) in SUBCOMMANDS.items():
+        subparser = subparsers.add_parser(name, help=help_text)
+        if name == command:
+            subcommand = importlib.import_module(module_name)
+            subcommand.add_arguments(subparser)
+    subparsers.add_parser("personas", help="list the personas sessions can write as")
+    args = parser.parse_args(argv)
+
+    if subcommand is not None:
+        subcommand.run(args)
+        return
+    if args.command == "personas":
+        registry = get_persona_registry()
+        for persona_id in registry.ids():
+            print(f"{persona_id}: {registry.get(persona_id)['name']} ({registry.sources[persona_id]})")
+        return
+    metrics.configure(args)
+    model_client.configure(args)
+    recorder = use_cassette(args)
+    # Drafts and feedback are shown as they stream in; --events also writes every event to a file.
+    events.console.set(events.ConsoleRenderer())
+    sink = events.JsonlSink(args.events) if getattr(args, "events", None) else None
+    try:
+        run_interactive(getattr(args, "session_id", None), budget_from_args(args), sink, getattr(args, "persona", None))
+    finally:
+        metrics.finish(args)
+        get_run_history().close()
+        if recorder is not None:
+            recorder.close()
+        if sink is not None:
+            sink.close()
+
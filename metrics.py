@@ -0,0 +1,221 @@
+import asyncio
+import contextvars
+import json
+import threading
+import time
+
+# The session and node being run, so model calls made deep inside a node can be attributed to it.
+current_session = contextvars.ContextVar("current_session", default="")
+current_node = contextvars.ContextVar("current_node", default="")
+
+DURATION_BUCKETS = (0.005, 0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+COUNT_BUCKETS = (1, 2, 5, 10, 20, 50, 100, 200, 500)
+
+_counters = {}  # (name, labels) -> value
+_histograms = {}  # (name, labels) -> {"buckets": tuple, "counts": list, "sum": float, "count": int}
+_session_node_runs = {}  # session id -> nodes run so far in this process
+_log = None
+_lock = threading.Lock()
+
+
+def _key(name, labels):
+    return name, tuple(sorted((key, str(value)) for key, value in labels.items()))
+
+
+def inc(name, amount=1, **labels):
+    """Adds to a counter."""
+    key = _key(name, labels)
+    with _lock:
+        _counters[key] = _counters.get(key, 0) + amount
+
+
+def observe(name, value, buckets=DURATION_BUCKETS, **labels):
+    """Records a value in a histogram."""
+    key = _key(name, labels)
+    with _lock:
+        histogram = _histograms.get(key)
+        if histogram is None:
+            histogram = _histograms[key] = {"buckets": buckets, "counts": [0] * len(buckets), "sum": 0.0, "count": 0}
+        for i, bound in enumerate(histogram["buckets"]):
+            if value <= bound:
+                histogram["counts"][i] += 1
+        histogram["sum"] += value
+        histogram["count"] += 1
+
+
+def emit(kind, **fields):
+    """Counts an event and, when a metrics log is open, writes it as a JSON line."""
+    node = current_node.get()
+    inc("threads_events_total", kind=kind, node=node)
+    if _log is not None:
+        record = {"ts": round(time.time(), 6), "kind": kind, "session": current_session.get(), "node": node}
+        record.update(fields)
+        line = json.dumps(record, default=str)
+        with _lock:
+            _log.write(line + "\n")
+            _log.flush()
+
+
+def record_api_call(queue_wait, latency, prompt_tokens, response_tokens, attempts, model=""):
+    """Records one completed model call, and the model it was routed to if known."""
+    node = current_node.get()
+    observe("threads_api_queue_wait_seconds", queue_wait, node=node)
+    observe("threads_api_latency_seconds", latency, node=node)
+    inc("threads_api_calls_total", node=node, outcome="ok", model=model)
+    inc("threads_api_tokens_total", prompt_tokens, node=node, kind="prompt", model=model)
+    inc("threads_api_tokens_total", response_tokens, node=node, kind="response", model=model)
+    if attempts > 1:
+        inc("threads_api_retries_total", attempts - 1, node=node)
+    emit("api_call", queue_wait=round(queue_wait, 6), latency=round(latency, 6), prompt_tokens=prompt_tokens,
+         response_tokens=response_tokens, attempts=attempts, model=model)
+
+
+def timed_node(name, node):
+    """Wraps a graph node so every invocation is timed and attributed to the node."""
+    def start():
+        session = current_session.get()
+        with _lock:
+            _session_node_runs[session] = _session_node_runs.get(session, 0) + 1
+        return current_node.set(name), time.perf_counter()
+
+    def finish(token, started, update):
+        elapsed = time.perf_counter() - started
+        observe("threads_node_duration_seconds", elapsed, node=name)
+        emit("node", duration=round(elapsed, 6), status=(update or {}).get("status"))
+        current_node.reset(token)
+
+    if asyncio.iscoroutinefunction(node):
+        async def timed(state):
+            token, started = start()
+            update = None
+            try:
+                update = await node(state)
+                return update
+            finally:
+                finish(token, started, update)
+    else:
+        def timed(state):
+            token, started = start()
+            update = None
+            try:
+                update = node(state)
+                return update
+            finally:
+                finish(token, started, update)
+    return timed
+
+
+def exit_reason(state):
+    """Names the reason a session stopped."""
+    if state.get("exit_reason"):
+        return state["exit_reason"]
+    if state.get("status") == "approved":
+        return "approved"
+    return f"stopped_at_{state.get('status') or 'unknown'}"
+
+
+def record_session(session_id, state, elapsed, reason=None):
+    """Records a finished session: its exit reason, duration and how many nodes it ran."""
+    reason = reason or exit_reason(state or {})
+    with _lock:
+        node_runs = _session_node_runs.pop(session_id, 0)
+    inc("threads_sessions_total", exit_reason=reason)
+    observe("threads_session_duration_seconds", elapsed, exit_reason=reason)
+    observe("threads_session_node_runs", node_runs, buckets=COUNT_BUCKETS, exit_reason=reason)
+    drafts = (state or {}).get("draft_count") or len((state or {}).get("versions", [""])) - 1
+    observe("threads_session_drafts", drafts, buckets=COUNT_BUCKETS, exit_reason=reason)
+    token = current_session.set(session_id)
+    emit("session", exit_reason=reason, duration=round(elapsed, 6), node_runs=node_runs, drafts=drafts)
+    current_session.reset(token)
+
+
+def histogram_totals(name):
+    """Returns the sum and count of a histogram for every label set, keyed by a dict of the labels."""
+    with _lock:
+        return [(dict(labels), histogram["sum"], histogram["count"])
+                for (metric, labels), histogram in sorted(_histograms.items(), key=lambda item: item[0])
+                if metric == name]
+
+
+def counter_total(name, **labels):
+    """Adds up a counter over every label set that includes the given labels."""
+    wanted = {key: str(value) for key, value in labels.items()}
+    with _lock:
+        return sum(value for (metric, pairs), value in _counters.items()
+                   if metric == name and wanted.items() <= dict(pairs).items())
+
+
+def counter_totals(name, label):
+    """Adds up a counter per value of one label, e.g. per error class."""
+    totals = {}
+    with _lock:
+        for (metric, pairs), value in _counters.items():
+            labels = dict(pairs)
+            if metric == name and label in labels:
+                totals[labels[label]] = totals.get(labels[label], 0) + value
+    return totals
+
+
+def reset():
+    """Clears every counter and histogram, e.g. between benchmark runs."""
+    with _lock:
+        _counters.clear()
+        _histograms.clear()
+        _session_node_runs.clear()
+
+
+def _format_labels(labels, extra=()):
+    pairs = list(labels) + list(extra)
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{key}="{value}"' for key, value in pairs) + "}"
+
+
+def prometheus_text():
+    """Returns all counters and histograms in the Prometheus text exposition format."""
+    lines = []
+    with _lock:
+        counters = sorted(_counters.items())
+        histograms = sorted(_histograms.items(), key=lambda item: item[0])
+        seen = set()
+        for (name, labels), value in counters:
+            if name not in seen:
+                lines.append(f"# TYPE {name} counter")
+                seen.add(name)
+            lines.append(f"{name}{_format_labels(labels)} {value}")
+        for (name, labels), histogram in histograms:
+            if name not in seen:
+                lines.append(f"# TYPE {name} histogram")
+                seen.add(name)
+            for bound, count in zip(histogram["buckets"], histogram["counts"]):
+                lines.append(f"{name}_bucket{_format_labels(labels, [('le', bound)])} {count}")
+            lines.append(f"{name}_bucket{_format_labels(labels, [('le', '+Inf')])} {histogram['count']}")
+            lines.append(f"{name}_sum{_format_labels(labels)} {histogram['sum']:.6f}")
+            lines.append(f"{name}_count{_format_labels(labels)} {histogram['count']}")
+    return "\n".join(lines) + "\n"
+
+
+def add_arguments(parser):
+    """Adds the metrics export options to an argument parser."""
+    parser.add_argument("--metrics-log", metavar="PATH",
+                        help="write every node run, model call and session as a JSON line to PATH")
+    parser.add_argument("--metrics-snapshot", metavar="PATH",
+                        help="write a Prometheus-style text snapshot of all metrics to PATH on exit")
+
+
+def configure(args):
+    """Opens the metrics log requested on the command line, if any."""
+    global _log
+    if getattr(args, "metrics_log", None):
+        _log = open(args.metrics_log, "a", encoding="utf-8")
+
+
+def finish(args):
+    """Writes the requested metrics snapshot and closes the metrics log."""
+    global _log
+    if getattr(args, "metrics_snapshot", None):
+        with open(args.metrics_snapshot, "w", encoding="utf-8") as snapshot:
+            snapshot.write(prometheus_text())
+    if _log is not None:
+        _log.close()
+        _log = None
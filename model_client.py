@@ -0,0 +1,624 @@
+import asyncio
+import contextvars
+import datetime
+import hashlib
+import random
+import time
+from collections import deque
+
+import metrics
+
+# The Gemini SDK is imported where it is used, so importing this module stays cheap.
+
+# Gemini only caches contexts of at least this many tokens; shorter prefixes are sent inline.
+# The built-in persona's writer and editor prefixes are about 1,300 tokens, so only much longer personas are cached.
+MIN_CACHED_TOKENS = 32_768
+
+# How each class of failed call is retried: (first backoff in seconds, longest backoff, attempts).
+RETRY_POLICIES = {
+    "rate_limit": (2.0, 60.0, 5),  # The quota was used up, possibly outside this process
+    "server": (1.0, 20.0, 4),  # 5xx errors: the backend is overloaded or failing
+    "timeout": (1.0, 10.0, 3),  # No answer within the attempt timeout
+    "transport": (0.5, 10.0, 4),  # The connection failed before an answer arrived
+}
+
+# Seconds one attempt may take before it is abandoned and retried, unless the call's settings say otherwise.
+ATTEMPT_TIMEOUT = 60.0
+
+# Defaults for new clients, set from the command line by configure(). An attempt_timeout
+# given there overrides the timeout in every call's settings.
+_settings = {"attempt_timeout": None, "hedge_percentile": None, "speculate": False}
+
+
+def estimate_tokens(text):
+    """Roughly estimates the number of tokens in a text (about 4 characters per token)."""
+    return len(text) // 4 + 1
+
+
+class TokenBucket:
+    """A token bucket that never lets more than `limit_per_minute` through in any 60 second window.
+
+    The bucket holds at most `burst` tokens and refills at (limit_per_minute - burst) per minute,
+    so a full burst plus a minute of refill still stays within the limit.
+    """
+
+    def __init__(self, limit_per_minute, burst=1):
+        burst = max(1, min(burst, limit_per_minute))
+        self.capacity = burst
+        self.rate = max(limit_per_minute - burst, 1) / 60.0  # tokens per second
+        self.tokens = float(burst)
+        self.updated = time.monotonic()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self, amount):
+        """Returns how many seconds to wait until `amount` tokens are available."""
+        self._refill()
+        amount = min(amount, self.capacity)  # Oversized requests wait for a full bucket
+        return max(0.0, (amount - self.tokens) / self.rate)
+
+    def consume(self, amount):
+        self._refill()
+        self.tokens -= amount
+
+    def refund(self, amount):
+        """Returns (or with a negative amount, charges) tokens after the real cost is known."""
+        self._refill()
+        self.tokens = min(self.capacity, self.tokens + amount)
+
+    def drain(self):
+        self._refill()
+        self.tokens = min(self.tokens, 0.0)
+
+
+class RateLimiter:
+    """Process-wide request and token limits shared by every session and node.
+
+    Callers queue in arrival order instead of failing when the quota is used up.
+    """
+
+    def __init__(self, requests_per_minute, tokens_per_minute, request_burst=1, token_burst=None):
+        self.requests = TokenBucket(requests_per_minute, request_burst)
+        self.tokens = TokenBucket(tokens_per_minute, token_burst or tokens_per_minute // 4)
+        self._lock = None
+
+    async def acquire(self, tokens):
+        """Waits until one request and `tokens` tokens fit in the quota, then reserves them."""
+        if self._lock is None:
+            self._lock = asyncio.Lock()
+        # asyncio.Lock wakes waiters in FIFO order, which keeps the queue fair.
+        async with self._lock:
+            while True:
+                delay = max(self.requests.wait_time(1), self.tokens.wait_time(tokens))
+                if delay <= 0:
+                    break
+                await asyncio.sleep(delay)
+            self.requests.consume(1)
+            self.tokens.consume(tokens)
+
+    def try_acquire(self, tokens):
+        """Reserves one request and `tokens` tokens if they fit right now, without queueing. Returns whether they did."""
+        if self._lock is not None and self._lock.locked():
+            return False  # Others are already waiting for quota
+        if self.requests.wait_time(1) > 0 or self.tokens.wait_time(tokens) > 0:
+            return False
+        self.requests.consume(1)
+        self.tokens.consume(tokens)
+        return True
+
+    def settle(self, reserved_tokens, used_tokens):
+        """Corrects the token bucket once the real token usage of a call is known."""
+        self.tokens.refund(reserved_tokens - used_tokens)
+
+    def backoff(self):
+        """Empties the request bucket after the backend reports a rate limit."""
+        self.requests.drain()
+
+
+def error_class(error):
+    """Returns the RETRY_POLICIES class of a failed call, or None if retrying can't help."""
+    from google.api_core import exceptions as google_exceptions
+
+    if isinstance(error, google_exceptions.TooManyRequests):
+        return "rate_limit"
+    if isinstance(error, (asyncio.TimeoutError, google_exceptions.DeadlineExceeded)):
+        return "timeout"
+    if isinstance(error, google_exceptions.ServerError):
+        return "server"
+    if isinstance(error, OSError):
+        return "transport"
+    return None
+
+
+def backoff_delay(first, longest, failures):
+    """Returns the seconds to wait after a call's nth failure: exponential, with the upper half jittered."""
+    ceiling = min(longest, first * 2 ** (failures - 1))
+    return ceiling / 2 + random.uniform(0, ceiling / 2)
+
+
+class DeadlineExceeded(Exception):
+    """The session's time budget ran out before a model call could finish."""
+
+
+class Deadline:
+    """The time by which the model calls of a node have to finish."""
+
+    def __init__(self, seconds):
+        self.seconds = seconds
+        self.at = time.monotonic() + seconds
+        self.expired = False
+
+    def remaining(self):
+        return self.at - time.monotonic()
+
+    def expire(self):
+        """Marks the deadline as reached and returns the error to raise."""
+        self.expired = True
+        return DeadlineExceeded(f"The session's time budget ran out during a model call "
+                                f"({self.seconds:.1f}s were left when the node started).")
+
+
+# The deadline of the node being run, set by main.tracked_node from the session's time budget.
+call_deadline = contextvars.ContextVar("call_deadline", default=None)
+
+
+async def _within(awaitable, deadline, timeout=None):
+    """Awaits with an optional timeout, cut short by a deadline. Raises DeadlineExceeded if it is."""
+    limit = timeout
+    if deadline is not None:
+        left = deadline.remaining()
+        if left <= 0:
+            awaitable.close()
+            raise deadline.expire()
+        limit = left if timeout is None else min(timeout, left)
+    if limit is None:
+        return await awaitable
+    try:
+        return await asyncio.wait_for(awaitable, limit)
+    except asyncio.TimeoutError:
+        if deadline is not None and limit < (timeout or float("inf")):
+            raise deadline.expire()
+        raise
+
+
+class QuotaUnavailable(RuntimeError):
+    """A speculative call found no spare quota, so it wasn't sent."""
+
+
+class CallFailed(RuntimeError):
+    """A model call failed for good: its retry policy was used up. The last error is its __cause__."""
+
+
+class CircuitOpenError(CallFailed):
+    """The backend has been failing, so calls are refused for a while instead of piling up."""
+
+    def __init__(self, retry_after):
+        super().__init__(f"The model backend is failing; calls are paused for another {retry_after:.0f}s.")
+        self.retry_after = retry_after
+
+
+class CircuitBreaker:
+    """Stops calling a degraded backend for a while, shared by every session of the client.
+
+    After `threshold` failed attempts in a row (server errors, timeouts and connection
+    failures; rate limits don't count), the circuit opens and calls fail fast with
+    CircuitOpenError for `cooldown` seconds. Then one trial call goes through: if it succeeds
+    the circuit closes, if it fails the circuit opens again.
+    """
+
+    def __init__(self, threshold=5, cooldown=30.0):
+        self.threshold = threshold
+        self.cooldown = cooldown
+        self.failures = 0
+        self.opened = None  # When the circuit opened, or None while it is closed
+        self.trial = None  # When the trial call started, while it is in flight
+
+    def check(self):
+        """Raises CircuitOpenError unless a call may go ahead now."""
+        if self.opened is None:
+            return
+        now = time.monotonic()
+        since = max(self.opened, self.trial or 0.0)
+        if now - since < self.cooldown:
+            metrics.inc("threads_api_failures_total", node=metrics.current_node.get(), error="circuit_open")
+            raise CircuitOpenError(self.cooldown - (now - since))
+        self.trial = now  # A trial that never reported back is replaced after another cooldown
+
+    def success(self):
+        if self.opened is not None:
+            print("The model backend is answering again. Closing the circuit.")
+            metrics.emit("circuit_closed")
+        self.failures = 0
+        self.opened = None
+        self.trial = None
+
+    def failure(self):
+        self.failures += 1
+        if self.trial is not None or (self.opened is None and self.failures >= self.threshold):
+            print(f"The model backend failed {self.failures} times in a row. "
+                  f"Pausing calls for {self.cooldown:.0f}s.")
+            metrics.inc("threads_circuit_opened_total")
+            metrics.emit("circuit_opened", failures=self.failures, cooldown=self.cooldown)
+            self.opened = time.monotonic()
+            self.trial = None
+
+
+class LatencyTracker:
+    """Recent call latencies per key, for deciding when an attempt is slower than usual."""
+
+    def __init__(self, window=200, min_samples=20):
+        self.window = window
+        self.min_samples = min_samples
+        self.samples = {}  # key -> deque of seconds
+
+    def add(self, key, seconds):
+        if key not in self.samples:
+            self.samples[key] = deque(maxlen=self.window)
+        self.samples[key].append(seconds)
+
+    def percentile(self, key, fraction):
+        """Returns the nearest-rank percentile of the key's recent latencies, or None with too few samples."""
+        samples = self.samples.get(key)
+        if samples is None or len(samples) < self.min_samples:
+            return None
+        ordered = sorted(samples)
+        return ordered[min(len(ordered) - 1, max(0, round(fraction * len(ordered) + 0.5) - 1))]
+
+
+class ContextCache:
+    """Keeps one Gemini cached content per prompt prefix and hands out models bound to it.
+
+    Prefixes the backend can't cache (too short, or an unsupported model) are remembered,
+    so the caller falls back to sending them inline without asking again.
+    """
+
+    def __init__(self, model_name, generation_config, ttl_seconds=3600, min_tokens=MIN_CACHED_TOKENS):
+        self.model_name = model_name
+        self.generation_config = generation_config
+        self.ttl_seconds = ttl_seconds
+        self.min_tokens = min_tokens
+        self._entries = {}  # (model name, prefix hash) -> task resolving to (model or None, expiry time)
+
+    async def model_for(self, prefix, model_name=None):
+        """Returns a model with the prefix cached on the backend, or None if it can't be cached.
+
+        Cached content belongs to one model, so each model named gets its own copy of the prefix.
+        """
+        if estimate_tokens(prefix) < self.min_tokens:
+            return None
+        model_name = model_name or self.model_name
+        key = (model_name, hashlib.sha256(prefix.encode("utf-8")).hexdigest())
+        task = self._entries.get(key)
+        if task is not None and task.done() and task.result()[1] <= time.monotonic():
+            task = None  # The cached content has expired on the backend
+        if task is None:
+            # Concurrent sessions share a single creation request for the same prefix.
+            task = asyncio.ensure_future(self._create(prefix, model_name))
+            self._entries[key] = task
+        return (await task)[0]
+
+    async def _create(self, prefix, model_name):
+        import google.generativeai as genai
+        from google.api_core import exceptions as google_exceptions
+
+        expires = time.monotonic() + self.ttl_seconds * 0.9
+        try:
+            cached = await asyncio.to_thread(
+                genai.caching.CachedContent.create,
+                model=f"models/{model_name}",
+                contents=[prefix],
+                ttl=datetime.timedelta(seconds=self.ttl_seconds),
+            )
+        except google_exceptions.GoogleAPIError as e:
+            print(f"Context caching is not available for this prompt prefix ({e}). Sending it inline.")
+            return None, float("inf")
+        model = genai.GenerativeModel.from_cached_content(cached, generation_config=self.generation_config)
+        return model, expires
+
+
+def response_usage(response, prompt, text):
+    """Returns (prompt tokens, response tokens, total tokens) of a response.
+
+    Token counts the backend leaves out are estimated from the prompt and text; the total is 0
+    when it isn't reported. Prefix tokens served from the context cache aren't prompt tokens.
+    """
+    usage = getattr(response, "usage_metadata", None)
+    prompt_tokens = getattr(usage, "prompt_token_count", 0) or estimate_tokens(prompt)
+    prompt_tokens = max(0, prompt_tokens - (getattr(usage, "cached_content_token_count", 0) or 0))
+    response_tokens = getattr(usage, "candidates_token_count", 0) or estimate_tokens(text)
+    return prompt_tokens, response_tokens, getattr(usage, "total_token_count", 0) or 0
+
+
+class GeminiClient:
+    """Async wrapper around a Gemini model that goes through a shared RateLimiter.
+
+    Failed calls are retried with jittered exponential backoff according to RETRY_POLICIES,
+    behind a CircuitBreaker shared by every session. Each attempt is cut short by the attempt
+    timeout and by the deadline of the node making the call (see call_deadline). With a
+    hedge_percentile, an attempt still waiting after that percentile of its node's recent
+    latencies gets a duplicate request, and whichever answers first is used.
+
+    Calls can be routed to other models by name; model_factory builds each one the first time
+    it is named. Without a factory, every call goes to `model`.
+    """
+
+    def __init__(self, model, limiter, context_cache=None, expected_output_tokens=512, retry_policies=None,
+                 breaker=None, attempt_timeout=None, hedge_percentile=None, model_factory=None):
+        self.model = model
+        self.model_factory = model_factory
+        self.models = {}  # model name -> model built by model_factory
+        self.limiter = limiter
+        self.context_cache = context_cache
+        self.expected_output_tokens = expected_output_tokens
+        self.retry_policies = retry_policies or RETRY_POLICIES
+        self.breaker = breaker or CircuitBreaker()
+        self.attempt_timeout = attempt_timeout or _settings["attempt_timeout"]
+        self.hedge_percentile = hedge_percentile or _settings["hedge_percentile"]
+        self.latencies = LatencyTracker()
+
+    def _model(self, name):
+        if name is None or self.model_factory is None:
+            return self.model
+        if name not in self.models:
+            self.models[name] = self.model_factory(name)
+        return self.models[name]
+
+    async def generate(self, prompt, prefix="", on_text=None, schema=None, settings=None, speculative=False):
+        """Sends a prompt. Returns (response text, usage).
+
+        usage holds the call's prompt_tokens and response_tokens as reported by the backend
+        (estimated only if it reports none), and the number of requests it took (calls), which
+        is 2 when a hedged duplicate was sent; the duplicate's tokens are included. Prefix tokens
+        served from the context cache are not counted as prompt tokens, since they weren't sent.
+        queue_seconds is how long the call waited for the rate limiter.
+
+        A static prefix (persona and instructions) is served from the context cache when the
+        backend can cache it; otherwise it is sent in front of the prompt. When on_text is
+        given, the response is streamed and on_text is called with each chunk as it arrives.
+        A schema (see responses.py) asks the model for JSON that matches it. Settings choose
+        the model, temperature, max_output_tokens and attempt timeout for this call; any left
+        out keep the client's defaults. A speculative call only uses quota that is free right
+        now, like a hedged request, and is not retried; without spare quota it raises
+        QuotaUnavailable.
+
+        While the circuit is open, the call waits for it to half-open again. Raises
+        DeadlineExceeded when the calling node's deadline passes first, CircuitOpenError when
+        the circuit stays open past the deadline, CallFailed once a retry policy is used up, and
+        errors that retrying can't help as they are.
+        """
+        settings = settings or {}
+        model = self._model(settings.get("model"))
+        cached_model = None
+        if prefix and self.context_cache is not None:
+            cached_model = await self.context_cache.model_for(prefix, settings.get("model"))
+        if cached_model is not None:
+            model = cached_model
+        else:
+            prompt = prefix + prompt
+        config = {key: settings[key] for key in ("temperature", "max_output_tokens") if key in settings}
+        if schema:
+            config["response_schema"] = schema
+        config = config or None
+        attempt_timeout = self.attempt_timeout or settings.get("timeout") or ATTEMPT_TIMEOUT
+        expected_output_tokens = min(self.expected_output_tokens,
+                                     settings.get("max_output_tokens", self.expected_output_tokens))
+        reserved = estimate_tokens(prompt) + expected_output_tokens
+        deadline = call_deadline.get()
+        node = metrics.current_node.get()
+        queue_wait = 0.0
+        failures = {}  # error class -> failed attempts so far
+        attempt = 0
+        while True:
+            try:
+                self.breaker.check()
+            except CircuitOpenError as e:
+                if speculative or (deadline is not None and e.retry_after >= deadline.remaining()):
+                    raise
+                print(f"{e} Waiting for it to recover...")
+                await asyncio.sleep(e.retry_after)
+                continue
+            attempt += 1
+            if speculative:
+                if not self.limiter.try_acquire(reserved):
+                    raise QuotaUnavailable("No spare quota for a speculative call")
+            else:
+                wait_started = time.perf_counter()
+                await _within(self.limiter.acquire(reserved), deadline)
+                queue_wait += time.perf_counter() - wait_started
+            call_started = time.perf_counter()
+            try:
+                response, text, duplicate = await _within(self._attempt(model, prompt, config, on_text, reserved),
+                                                          deadline, attempt_timeout)
+            except DeadlineExceeded:
+                self.limiter.settle(reserved, 0)
+                metrics.inc("threads_api_failures_total", node=node, error="deadline")
+                raise
+            except Exception as e:
+                self.limiter.settle(reserved, 0)
+                kind = error_class(e)
+                latency = round(time.perf_counter() - call_started, 6)
+                metrics.inc("threads_api_failures_total", node=node, error=kind or "fatal")
+                if kind == "rate_limit":
+                    # The quota was used up outside this process; wait for the next request slot too.
+                    self.limiter.backoff()
+                    self.breaker.success()  # The backend answered, so it isn't down
+                    metrics.emit("api_rate_limited", attempt=attempt, latency=latency)
+                else:
+                    metrics.emit("api_error", attempt=attempt, error=f"{type(e).__name__}: {e}", error_class=kind)
+                    if kind is None:
+                        self.breaker.success()
+                        raise
+                    self.breaker.failure()
+                if speculative:
+                    raise
+                failures[kind] = failures.get(kind, 0) + 1
+                first, longest, attempts = self.retry_policies[kind]
+                if failures[kind] >= attempts:
+                    raise CallFailed(f"The API call failed {attempt} times; the last error was "
+                                     f"{type(e).__name__}: {e}") from e
+                delay = backoff_delay(first, longest, failures[kind])
+                if deadline is not None and delay >= deadline.remaining():
+                    metrics.inc("threads_api_failures_total", node=node, error="deadline")
+                    raise deadline.expire() from e
+                print(f"The API call failed ({kind}: {type(e).__name__}). Retrying in {delay:.1f}s "
+                      f"(attempt {attempt + 1})...")
+                if on_text is not None and hasattr(on_text, "restart"):
+                    on_text.restart()  # Drop any text streamed by the failed attempt
+                await asyncio.sleep(delay)
+                continue
+            self.breaker.success()
+            latency = time.perf_counter() - call_started
+            prompt_tokens, response_tokens, used = response_usage(response, prompt, text)
+            self.limiter.settle(reserved, used or reserved)
+            calls = 1
+            if duplicate is not None:
+                calls += duplicate["calls"]
+                prompt_tokens += duplicate["prompt_tokens"]
+                response_tokens += duplicate["response_tokens"]
+            metrics.record_api_call(queue_wait, latency, prompt_tokens, response_tokens, attempt,
+                                    model=settings.get("model", ""))
+            return text, {"calls": calls, "prompt_tokens": prompt_tokens, "response_tokens": response_tokens,
+                          "queue_seconds": queue_wait}
+
+    async def _call(self, model, prompt, config, on_text):
+        """Sends one request. Returns (response, text)."""
+        started = time.perf_counter()
+        if on_text is None:
+            response = await model.generate_content_async(prompt, generation_config=config)
+            text = response.text
+            self.latencies.add((metrics.current_node.get(), False), time.perf_counter() - started)
+            return response, text
+        response = await model.generate_content_async(prompt, stream=True, generation_config=config)
+        chunks = []
+        async for chunk in response:
+            if not chunks:
+                first_chunk = time.perf_counter() - started
+                metrics.observe("threads_api_first_chunk_seconds", first_chunk, node=metrics.current_node.get())
+                self.latencies.add((metrics.current_node.get(), True), first_chunk)
+            chunks.append(chunk.text)
+            on_text(chunk.text)
+        return response, "".join(chunks)
+
+    def _settle_duplicate(self, task, prompt, reserved):
+        """Settles the quota reserved for the request of a hedged attempt that wasn't used.
+
+        Returns the request's usage, or None if it failed. A request still running is cancelled;
+        its prompt was already sent, so its prompt tokens are charged.
+        """
+        if not task.done():
+            task.cancel()
+            prompt_tokens = estimate_tokens(prompt)
+            self.limiter.settle(reserved, prompt_tokens)
+            return {"calls": 1, "prompt_tokens": prompt_tokens, "response_tokens": 0}
+        if task.cancelled() or task.exception() is not None:
+            self.limiter.settle(reserved, 0)
+            return None
+        response, text = task.result()
+        prompt_tokens, response_tokens, used = response_usage(response, prompt, text)
+        self.limiter.settle(reserved, used or reserved)
+        return {"calls": 1, "prompt_tokens": prompt_tokens, "response_tokens": response_tokens}
+
+    async def _attempt(self, model, prompt, config, on_text, reserved):
+        """Makes one attempt, hedged with a duplicate request when it is slower than usual.
+
+        Returns (response, text, usage of the other request), where the usage is None unless a
+        duplicate was sent and not used. A streamed attempt is only hedged until its first chunk
+        arrives, and the duplicate isn't streamed; if it wins, its whole text is passed to
+        on_text at once. Duplicates only use quota that is free right now, so hedging never
+        makes other calls queue. The caller settles the quota of the request returned, and the
+        other request's is settled here.
+        """
+        node = metrics.current_node.get()
+        hedge_after = None
+        if self.hedge_percentile:
+            hedge_after = self.latencies.percentile((node, on_text is not None), self.hedge_percentile / 100)
+        if hedge_after is None:
+            return (*await self._call(model, prompt, config, on_text), None)
+
+        streaming = asyncio.Event()  # Set once the first attempt's first chunk arrives
+
+        def forward(chunk):
+            streaming.set()
+            on_text(chunk)
+
+        primary = asyncio.ensure_future(self._call(model, prompt, config, forward if on_text else None))
+        first_chunk = asyncio.ensure_future(streaming.wait())
+        hedge = None
+        settled = False
+        try:
+            await asyncio.wait({primary, first_chunk}, timeout=hedge_after, return_when=asyncio.FIRST_COMPLETED)
+            if primary.done() or first_chunk.done():
+                return (*await primary, None)
+            if not self.limiter.try_acquire(reserved):
+                metrics.inc("threads_api_hedges_total", node=node, outcome="skipped")
+                return (*await primary, None)
+            metrics.emit("api_hedged", after=round(hedge_after, 6))
+            hedge = asyncio.ensure_future(self._call(model, prompt, config, None))
+            pending = {primary, hedge, first_chunk}
+            while True:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                if first_chunk in done or (primary in done and not primary.exception()):
+                    metrics.inc("threads_api_hedges_total", node=node, outcome="lost")
+                    settled = True
+                    duplicate = self._settle_duplicate(hedge, prompt, reserved)
+                    return (*await primary, duplicate)
+                if hedge in done and not hedge.exception():
+                    metrics.inc("threads_api_hedges_total", node=node, outcome="won")
+                    settled = True
+                    duplicate = self._settle_duplicate(primary, prompt, reserved)
+                    response, text = hedge.result()
+                    if on_text is not None:
+                        on_text(text)
+                    return response, text, duplicate
+                if primary.done() and hedge.done():
+                    settled = True
+                    self._settle_duplicate(hedge, prompt, reserved)
+                    return (*await primary, None)  # Both failed; retry on the first one's error
+        finally:
+            if hedge is not None and not settled:
+                self._settle_duplicate(hedge, prompt, reserved)  # The attempt was cut short
+            for task in (primary, first_chunk, hedge):
+                if task is None:
+                    continue
+                if not task.done():
+                    task.cancel()
+                elif not task.cancelled():
+                    task.exception()  # The losing request's error, if any, is expected
+
+
+def add_arguments(parser):
+    """Adds the model call options to an argument parser."""
+    parser.add_argument("--call-timeout", type=float,
+                        help="Seconds any model call attempt may take before it is retried "
+                             "(default: each node's timeout, see NODE_MODELS in main.py)")
+    parser.add_argument("--hedge-percentile", type=float, metavar="P",
+                        help="send a duplicate request when a call is slower than the Pth percentile of its "
+                             "node's recent calls, e.g. 95 (default: off)")
+    parser.add_argument("--speculate", action="store_true",
+                        help="start the writer's next revision while a draft is being reviewed, using only spare "
+                             "quota, and keep it if the draft is rejected")
+
+
+def configure(args):
+    """Applies the model call options given on the command line to clients built from now on."""
+    if getattr(args, "call_timeout", None):
+        _settings["attempt_timeout"] = args.call_timeout
+    if getattr(args, "hedge_percentile", None):
+        if not 0 < args.hedge_percentile < 100:
+            raise ValueError("--hedge-percentile must be between 0 and 100")
+        _settings["hedge_percentile"] = args.hedge_percentile
+    if getattr(args, "speculate", False):
+        _settings["speculate"] = True
+
+
+def set_speculation(enabled):
+    """Turns speculative writer revisions on or off for sessions run from now on."""
+    _settings["speculate"] = enabled
+
+
+def speculation_enabled():
+    """Returns whether the writer starts its next revision while a draft is being reviewed."""
+    return _settings["speculate"]
@@ -0,0 +1,101 @@
+import hashlib
+import json
+import os
+from collections import OrderedDict
+
+# Personas are loaded from this directory, one JSON or YAML file per persona, named <id>.json/.yaml.
+PERSONA_DIR = os.environ.get("THREADS_PERSONA_DIR", "personas")
+
+# Fields the writer and editor prompts read from every persona.
+REQUIRED_FIELDS = ("name", "writing_style", "typical_audience", "topics_of_interest", "content_preferences")
+
+
+def persona_fingerprint(persona):
+    """Returns a short hash identifying a persona's content."""
+    return hashlib.sha256(json.dumps(persona, sort_keys=True).encode("utf-8")).hexdigest()[:16]
+
+
+# Inline personas by fingerprint, so sessions given equal persona dicts share one copy. Only
+# the most recently used MAX_INTERNED are kept; an evicted persona is simply no longer shared.
+MAX_INTERNED = 256
+_interned = OrderedDict()
+
+
+def intern_persona(persona):
+    """Returns the shared copy of a persona dict equal to this one."""
+    fingerprint = persona_fingerprint(persona)
+    persona = _interned.setdefault(fingerprint, persona)
+    _interned.move_to_end(fingerprint)
+    while len(_interned) > MAX_INTERNED:
+        _interned.popitem(last=False)
+    return persona
+
+
+def validate_persona(persona, source):
+    """Raises ValueError if a persona is missing a field the prompts need."""
+    if not isinstance(persona, dict):
+        raise ValueError(f"{source}: a persona must be a mapping, not {type(persona).__name__}")
+    missing = [field for field in REQUIRED_FIELDS if field not in persona]
+    if not missing:
+        for field, key in (("topics_of_interest", "tech"), ("content_preferences", "posts_about")):
+            section = persona[field]
+            items = section.get(key) if isinstance(section, dict) else None
+            if not isinstance(items, list) or not all(isinstance(item, str) for item in items):
+                missing.append(f"{field}.{key} (a list of strings)")
+    if missing:
+        raise ValueError(f"{source}: persona is missing {', '.join(missing)}")
+
+
+def read_persona_file(path):
+    """Reads one persona from a JSON or YAML file."""
+    with open(path, encoding="utf-8") as handle:
+        if path.endswith(".json"):
+            return json.load(handle)
+        try:
+            import yaml
+        except ImportError:
+            raise RuntimeError(f"Install PyYAML to load YAML personas such as {path} (pip install pyyaml).")
+        return yaml.safe_load(handle)
+
+
+class PersonaRegistry:
+    """Personas available to sessions, by id.
+
+    Sessions store only the persona id; prompt prefixes are rendered once per persona and
+    fingerprint (see main.cached_prompt_prefix), so many accounts can share one process.
+    """
+
+    def __init__(self):
+        self.personas = {}  # id -> persona
+        self.fingerprints = {}  # id -> persona_fingerprint()
+        self.sources = {}  # id -> file it was loaded from, or "built-in"
+
+    def add(self, persona_id, persona, source="built-in"):
+        validate_persona(persona, source)
+        self.personas[persona_id] = persona
+        self.fingerprints[persona_id] = persona_fingerprint(persona)
+        self.sources[persona_id] = source
+
+    def load_directory(self, directory):
+        """Adds every .json, .yaml and .yml persona file in a directory, keyed by file name."""
+        for filename in sorted(os.listdir(directory)):
+            persona_id, extension = os.path.splitext(filename)
+            if extension not in (".json", ".yaml", ".yml"):
+                continue
+            path = os.path.join(directory, filename)
+            if persona_id in self.personas and self.sources[persona_id] != "built-in":
+                raise ValueError(f"{path}: persona '{persona_id}' is already defined in {self.sources[persona_id]}")
+            self.add(persona_id, read_persona_file(path), path)
+        return self
+
+    def get(self, persona_id):
+        if persona_id not in self.personas:
+            raise KeyError(f"Unknown persona '{persona_id}'. Available personas: {', '.join(sorted(self.personas))}")
+        return self.personas[persona_id]
+
+    def fingerprint(self, persona_id):
+        self.get(persona_id)
+        return self.fingerprints[persona_id]
+
+    def ids(self):
+        return sorted(self.personas)
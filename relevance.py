@@ -0,0 +1,51 @@
+import numpy as np
+from sklearn.feature_extraction.text import HashingVectorizer, TfidfTransformer
+from sklearn.metrics.pairwise import cosine_similarity
+
+# Cosine similarity cut-offs for relevance scores 2, 3, 4 and 5. Anything lower scores 1.
+SCORE_THRESHOLDS = (0.05, 0.12, 0.20, 0.30)
+
+# Similarities in this range are too close to call locally and are sent to the LLM assessor.
+AMBIGUOUS_RANGE = (0.10, 0.20)
+
+
+class RelevanceEngine:
+    """Scores how closely a revised draft follows the original draft using TF-IDF cosine similarity.
+
+    The hashing vectorizer is stateless, so one engine is built once and shared by every session.
+    Until fit() is called, terms are weighted by (sublinear) term frequency only; fit() learns
+    IDF weights from a corpus of drafts, e.g. all the drafts of a batch run.
+    """
+
+    def __init__(self, thresholds=SCORE_THRESHOLDS, ambiguous_range=AMBIGUOUS_RANGE):
+        self.vectorizer = HashingVectorizer(ngram_range=(1, 2), stop_words="english",
+                                            alternate_sign=False, norm=None)
+        self.idf = None
+        self.thresholds = thresholds
+        self.ambiguous_range = ambiguous_range
+
+    def fit(self, documents):
+        """Learns IDF weights from a corpus of drafts."""
+        documents = [document for document in documents if document]
+        if documents:
+            self.idf = TfidfTransformer(sublinear_tf=True).fit(self.vectorizer.transform(documents))
+        return self
+
+    def similarity(self, original, revised):
+        """Returns the cosine similarity between two texts, from 0 to 1."""
+        matrix = self.vectorizer.transform([original, revised])
+        if self.idf is not None:
+            matrix = self.idf.transform(matrix)
+        else:
+            matrix.data = 1 + np.log(matrix.data)
+        return float(cosine_similarity(matrix[0], matrix[1])[0, 0])
+
+    def score(self, similarity):
+        """Maps a similarity onto the 1-5 relevance scale used by the relevance assessor."""
+        return 1 + sum(similarity >= threshold for threshold in self.thresholds)
+
+    def assess(self, original, revised):
+        """Returns (relevance_score, similarity, is_ambiguous) for a revised draft."""
+        similarity = self.similarity(original, revised)
+        low, high = self.ambiguous_range
+        return self.score(similarity), similarity, low <= similarity < high
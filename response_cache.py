@@ -0,0 +1,117 @@
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+from model_client import estimate_tokens
+
+
+def cache_key(model_name, generation_config, prompt):
+    """Builds a content-addressed key from everything that determines a response."""
+    payload = json.dumps({"model": model_name, "config": generation_config, "prompt": prompt}, sort_keys=True)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class ResponseCache:
+    """Prompt to response cache with an in-memory LRU in front of an SQLite store.
+
+    Entries older than `ttl_seconds` are ignored and pruned, and the store keeps at most
+    `max_entries` rows, dropping the least recently used ones first.
+    """
+
+    def __init__(self, path, max_entries=100_000, ttl_seconds=7 * 24 * 3600, memory_entries=1024, prune_every=500):
+        self.path = path
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.memory_entries = memory_entries
+        self.prune_every = prune_every
+        self.memory = OrderedDict()  # key -> (response, created)
+        self.hits = 0
+        self.memory_hits = 0
+        self.misses = 0
+        self.tokens_saved = 0
+        self._writes = 0
+        self._lock = threading.Lock()
+        self._db = None
+
+    def _connect(self):
+        if self._db is None:
+            self._db = sqlite3.connect(self.path, check_same_thread=False)
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS responses ("
+                "key TEXT PRIMARY KEY, response TEXT NOT NULL, created REAL NOT NULL, last_used REAL NOT NULL)"
+            )
+            self._db.execute("CREATE INDEX IF NOT EXISTS responses_last_used ON responses (last_used)")
+        return self._db
+
+    def _remember(self, key, response, created):
+        self.memory[key] = (response, created)
+        self.memory.move_to_end(key)
+        while len(self.memory) > self.memory_entries:
+            self.memory.popitem(last=False)
+
+    def get(self, key, prompt=""):
+        """Returns the cached response for a key, or None on a miss."""
+        now = time.time()
+        with self._lock:
+            entry = self.memory.get(key)
+            if entry is not None and now - entry[1] <= self.ttl_seconds:
+                self.memory.move_to_end(key)
+                self.memory_hits += 1
+                return self._hit(prompt, entry[0])
+
+            db = self._connect()
+            row = db.execute("SELECT response, created FROM responses WHERE key = ?", (key,)).fetchone()
+            if row is None or now - row[1] > self.ttl_seconds:
+                self.memory.pop(key, None)
+                self.misses += 1
+                return None
+            db.execute("UPDATE responses SET last_used = ? WHERE key = ?", (now, key))
+            db.commit()
+            self._remember(key, row[0], row[1])
+            return self._hit(prompt, row[0])
+
+    def _hit(self, prompt, response):
+        self.hits += 1
+        self.tokens_saved += estimate_tokens(prompt) + estimate_tokens(response)
+        return response
+
+    def put(self, key, response):
+        now = time.time()
+        with self._lock:
+            self._remember(key, response, now)
+            db = self._connect()
+            db.execute("INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?)", (key, response, now, now))
+            db.commit()
+            self._writes += 1
+            if self._writes % self.prune_every == 0:
+                self._prune(db, now)
+
+    def _prune(self, db, now):
+        db.execute("DELETE FROM responses WHERE created < ?", (now - self.ttl_seconds,))
+        db.execute(
+            "DELETE FROM responses WHERE key IN ("
+            "SELECT key FROM responses ORDER BY last_used DESC LIMIT -1 OFFSET ?)",
+            (self.max_entries,),
+        )
+        db.commit()
+
+    def stats(self):
+        """Returns hit/miss counters and an estimate of the tokens the cache has saved."""
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "memory_hits": self.memory_hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 3) if lookups else 0.0,
+            "tokens_saved": self.tokens_saved,
+        }
+
+    def close(self):
+        with self._lock:
+            if self._db is not None:
+                self._db.close()
+                self._db = None
@@ -0,0 +1,173 @@
+import json
+import math
+import re
+
+# JSON schemas of the responses each node asks the model for, in the form Gemini's
+# response_schema takes. parse_response() checks and repairs responses against the same schemas.
+SCHEMAS = {
+    "content_classifier": {
+        "type": "object",
+        "properties": {
+            "content_type": {"type": "string", "format": "enum", "enum": ["industry_news", "personal"]},
+        },
+        "required": ["content_type"],
+    },
+    "writer": {
+        "type": "object",
+        "properties": {
+            "drafts": {"type": "array", "items": {"type": "string"}},
+        },
+        "required": ["drafts"],
+    },
+    "relevance_assessor": {
+        "type": "object",
+        "properties": {
+            "relevance_score": {"type": "integer"},
+            "relevance_feedback": {"type": "string"},
+        },
+        "required": ["relevance_score"],
+    },
+    "editor": {
+        "type": "object",
+        "properties": {
+            "feedback": {"type": "string"},
+            "overall_score": {"type": "integer"},
+        },
+        "required": ["feedback", "overall_score"],
+    },
+}
+
+# Keys models sometimes use in place of a required list, e.g. a single "draft" instead of "drafts".
+SINGULAR_KEYS = {"drafts": "draft"}
+
+_FENCE = re.compile(r"^```[A-Za-z]*[ \t]*\n?(.*?)(?:\n?```)?\s*$", re.DOTALL)
+_NUMBER = re.compile(r"^\s*(-?\d+(?:\.\d+)?)\s*(?:/\s*\d+(?:\.\d+)?)?\s*$")
+
+
+class ResponseError(ValueError):
+    """A model response that doesn't fit its schema, even after local repair."""
+
+
+def close_truncated(text):
+    """Returns ways to complete JSON that was cut off, most complete first.
+
+    The first keeps everything and closes the open brackets; the second drops the element that
+    was cut off (e.g. a half-written draft) and keeps only the elements before it.
+    """
+    stack = []
+    in_string = escaped = False
+    cut, cut_stack = None, None  # Last point up to which every element is complete
+    for i, char in enumerate(text):
+        if in_string:
+            if escaped:
+                escaped = False
+            elif char == "\\":
+                escaped = True
+            elif char == '"':
+                in_string = False
+        elif char == '"':
+            in_string = True
+        elif char in "{[":
+            stack.append("}" if char == "{" else "]")
+            cut, cut_stack = i + 1, list(stack)
+        elif char in "}]" and stack:
+            stack.pop()
+            cut, cut_stack = i + 1, list(stack)
+        elif char == ",":
+            cut, cut_stack = i, list(stack)
+    candidates = []
+    if not in_string:
+        candidates.append(text.rstrip().rstrip(",") + "".join(reversed(stack)))
+    if cut is not None:
+        candidates.append(text[:cut] + "".join(reversed(cut_stack)))
+    return candidates
+
+
+def _decode(text, repairs):
+    """Finds the JSON object in a response, repairing fences, surrounding text and truncation."""
+    text = text.strip()
+    fenced = _FENCE.match(text)
+    if fenced:
+        text = fenced.group(1).strip()
+        repairs.append("code_fence")
+    try:
+        return json.loads(text)
+    except json.JSONDecodeError as e:
+        error = e
+    start = text.find("{")
+    if start == -1:
+        raise ResponseError(f"The response contains no JSON object: {error}")
+    try:
+        data, _ = json.JSONDecoder().raw_decode(text, start)
+        repairs.append("surrounding_text")
+        return data
+    except json.JSONDecodeError:
+        pass
+    for candidate in close_truncated(text[start:]):
+        try:
+            data = json.loads(candidate)
+        except json.JSONDecodeError:
+            continue
+        repairs.append("truncated")
+        return data
+    raise ResponseError(f"The response is not valid JSON: {error}")
+
+
+def _coerce(key, value, schema, repairs):
+    """Converts a value to the type its schema asks for, when the intent is clear."""
+    kind = schema.get("type")
+    if kind == "integer" and not (isinstance(value, int) and not isinstance(value, bool)):
+        if isinstance(value, float):
+            number = value
+        else:
+            match = _NUMBER.match(str(value))
+            if not match:
+                raise ResponseError(f"'{key}' should be a whole number, not {value!r}")
+            number = float(match.group(1))
+        repairs.append("number_type")
+        return math.floor(number + 0.5)
+    if kind == "string" and not isinstance(value, str):
+        repairs.append("string_type")
+        if isinstance(value, list):
+            return "\n".join(str(item) for item in value)
+        return "" if value is None else str(value)
+    if kind == "array" and not isinstance(value, list):
+        repairs.append("array_type")
+        value = [value]
+    if kind == "array" and "items" in schema:
+        value = [_coerce(key, item, schema["items"], repairs) for item in value]
+    if "enum" in schema and value not in schema["enum"]:
+        normalized = re.sub(r"[\s-]+", "_", str(value).strip().lower())
+        if normalized not in schema["enum"]:
+            raise ResponseError(f"'{key}' should be one of {', '.join(schema['enum'])}, not {value!r}")
+        repairs.append("enum_value")
+        value = normalized
+    return value
+
+
+def parse_response(text, schema):
+    """Parses a JSON response and makes it fit a schema, repairing common defects locally.
+
+    Handles code fences, text around the JSON, responses cut off part way, numbers sent as
+    strings (including "4/5"), and a single value where a list is expected. Returns
+    (data, repairs), where repairs names each fix applied. Raises ResponseError when the
+    response can't be repaired, e.g. when a required field is missing.
+    """
+    repairs = []
+    data = _decode(text, repairs)
+    if isinstance(data, list) and len(data) == 1 and isinstance(data[0], dict):
+        data = data[0]
+        repairs.append("wrapped_in_list")
+    if not isinstance(data, dict):
+        raise ResponseError(f"The response should be a JSON object, not {type(data).__name__}")
+    for key, singular in SINGULAR_KEYS.items():
+        if key in schema["properties"] and key not in data and singular in data:
+            data[key] = data.pop(singular)
+            repairs.append("singular_key")
+    missing = [key for key in schema.get("required", []) if key not in data]
+    if missing:
+        raise ResponseError(f"The response is missing {', '.join(missing)}")
+    for key, property_schema in schema["properties"].items():
+        if key in data:
+            data[key] = _coerce(key, data[key], property_schema, repairs)
+    return data, repairs
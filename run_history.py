@@ -0,0 +1,248 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+
+# Every finished session is appended here, keyed by its session id.
+HISTORY_PATH = os.environ.get("THREADS_HISTORY_PATH", "run_history.sqlite3")
+
+SCHEMA = (
+    "CREATE TABLE IF NOT EXISTS runs ("
+    "session_id TEXT PRIMARY KEY, finished REAL NOT NULL, status TEXT NOT NULL, exit_reason TEXT NOT NULL, "
+    "content_type TEXT NOT NULL, persona_id TEXT NOT NULL, iterations INTEGER NOT NULL, drafts INTEGER NOT NULL, "
+    "editor_score INTEGER NOT NULL, best_score INTEGER NOT NULL, relevance_score INTEGER NOT NULL, "
+    "calls INTEGER NOT NULL, prompt_tokens INTEGER NOT NULL, response_tokens INTEGER NOT NULL, "
+    "seconds REAL NOT NULL, elapsed REAL NOT NULL, draft TEXT NOT NULL, final_draft TEXT NOT NULL, "
+    "details TEXT NOT NULL)",
+    # Without --days, medians are read off these two indexes in order, without sorting; with it,
+    # only the rows that finished in time are sorted.
+    "CREATE INDEX IF NOT EXISTS runs_by_type ON runs (content_type, status, drafts)",
+    "CREATE INDEX IF NOT EXISTS runs_by_type_iterations ON runs (content_type, status, iterations)",
+    "CREATE INDEX IF NOT EXISTS runs_by_exit ON runs (exit_reason)",
+    "CREATE INDEX IF NOT EXISTS runs_by_time ON runs (finished)",
+    "CREATE TABLE IF NOT EXISTS node_runs ("
+    "session_id TEXT NOT NULL, node TEXT NOT NULL, runs INTEGER NOT NULL, calls INTEGER NOT NULL, "
+    "prompt_tokens INTEGER NOT NULL, response_tokens INTEGER NOT NULL, seconds REAL NOT NULL, "
+    "PRIMARY KEY (session_id, node))",
+    "CREATE INDEX IF NOT EXISTS node_runs_by_node ON node_runs (node)",
+    # Rejections per session, by who rejected the draft and a fixed category of why (see main.record_rejection).
+    "CREATE TABLE IF NOT EXISTS rejection_counts ("
+    "session_id TEXT NOT NULL, source TEXT NOT NULL, category TEXT NOT NULL, rejections INTEGER NOT NULL, "
+    "PRIMARY KEY (session_id, source, category))",
+    "CREATE INDEX IF NOT EXISTS rejection_counts_by_category ON rejection_counts (source, category, session_id)",
+)
+
+
+def run_record(session_id, state, elapsed, finished=None):
+    """Flattens a finished session state into rows for the runs, node_runs and rejections tables."""
+    usage = state.get("usage") or {}
+    versions = state.get("versions") or [""]
+    run = (
+        session_id, finished or time.time(), state.get("status") or "", state.get("exit_reason") or "",
+        state.get("content_type") or "", state.get("persona_id") or "", state.get("iteration_count", 0),
+        state.get("draft_count") or len(versions) - 1, state.get("editor_score", 0), state.get("best_score", 0),
+        state.get("relevance_score", 0), usage.get("calls", 0), usage.get("prompt_tokens", 0),
+        usage.get("response_tokens", 0), usage.get("seconds", 0.0), elapsed, versions[0], state.get("draft") or "",
+        json.dumps({"versions": versions, "editor_history": state.get("editor_history") or [],
+                    "editor_scores": state.get("editor_scores") or [], "usage": usage}),
+    )
+    nodes = [(session_id, node, counts.get("runs", 0), counts.get("calls", 0), counts.get("prompt_tokens", 0),
+              counts.get("response_tokens", 0), counts.get("seconds", 0.0))
+             for node, counts in (usage.get("nodes") or {}).items()]
+    rejected = [(session_id, source, category, count)
+                for source, categories in (state.get("rejections") or {}).items()
+                for category, count in categories.items()]
+    return run, nodes, rejected
+
+
+class RunHistory:
+    """Indexed SQLite store of finished sessions, for analytics over large numbers of runs.
+
+    Sessions are buffered and written in one transaction per `batch_size` sessions, so
+    recording stays cheap when many sessions finish at once. A timer writes a smaller buffer
+    `flush_seconds` after its first session arrived. Call close() (or flush()) on shutdown to
+    write what is still buffered.
+    """
+
+    def __init__(self, path=HISTORY_PATH, batch_size=100, flush_seconds=5.0):
+        self.path = path
+        self.batch_size = batch_size
+        self.flush_seconds = flush_seconds
+        self.pending = []  # run_record() tuples not yet written
+        self._timer = None  # Flushes the buffer once it has waited flush_seconds
+        self._lock = threading.Lock()
+        self._db = None
+
+    def _connect(self):
+        if self._db is None:
+            self._db = sqlite3.connect(self.path, check_same_thread=False)
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute("PRAGMA synchronous=NORMAL")
+            for statement in SCHEMA:
+                self._db.execute(statement)
+        return self._db
+
+    def add(self, session_id, state, elapsed):
+        """Buffers a finished session, writing the buffer out when it is full."""
+        record = run_record(session_id, state, elapsed)
+        with self._lock:
+            self.pending.append(record)
+            if len(self.pending) >= self.batch_size:
+                self._flush()
+            elif self._timer is None:
+                self._timer = threading.Timer(self.flush_seconds, self.flush)
+                self._timer.daemon = True
+                self._timer.start()
+
+    def flush(self):
+        with self._lock:
+            self._flush()
+
+    def _flush(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        if not self.pending:
+            return
+        records, self.pending = self.pending, []
+        db = self._connect()
+        with db:
+            # A resumed session that finishes again replaces its earlier record.
+            db.executemany("DELETE FROM node_runs WHERE session_id = ?", [(run[0],) for run, _, _ in records])
+            db.executemany("DELETE FROM rejection_counts WHERE session_id = ?", [(run[0],) for run, _, _ in records])
+            db.executemany(f"INSERT OR REPLACE INTO runs VALUES ({', '.join('?' * 19)})",
+                           [run for run, _, _ in records])
+            db.executemany("INSERT INTO node_runs VALUES (?, ?, ?, ?, ?, ?, ?)",
+                           [row for _, nodes, _ in records for row in nodes])
+            db.executemany("INSERT INTO rejection_counts VALUES (?, ?, ?, ?)",
+                           [row for _, _, rejected in records for row in rejected])
+
+    def _median(self, db, column, content_type, status, since=None):
+        """Returns the median of a runs column: one count, then the middle row(s) by offset."""
+        where, params = "content_type = ? AND status = ?", (content_type, status)
+        if since:
+            where, params = where + " AND finished >= ?", params + (since,)
+        count = db.execute(f"SELECT COUNT(*) FROM runs WHERE {where}", params).fetchone()[0]
+        if not count:
+            return 0.0
+        middle = db.execute(f"SELECT {column} FROM runs WHERE {where} ORDER BY {column} LIMIT ? OFFSET ?",
+                            params + (2 - count % 2, (count - 1) // 2)).fetchall()
+        return sum(value for value, in middle) / len(middle)
+
+    def report(self, since=None, top=10):
+        """Aggregates the stored sessions (those finished after `since`, if given) into a report dict."""
+        self.flush()
+        with self._lock:
+            db = self._connect()
+            where, params = ("WHERE finished >= ?", (since,)) if since else ("", ())
+            total = db.execute(f"SELECT COUNT(*), SUM(calls), SUM(prompt_tokens), SUM(response_tokens) "
+                               f"FROM runs {where}", params).fetchone()
+            report = {
+                "sessions": total[0],
+                "model_calls": total[1] or 0,
+                "prompt_tokens": total[2] or 0,
+                "response_tokens": total[3] or 0,
+                "outcomes": dict(db.execute(f"SELECT status, COUNT(*) FROM runs {where} GROUP BY status "
+                                            "ORDER BY COUNT(*) DESC", params).fetchall()),
+                "exit_reasons": dict(db.execute(f"SELECT exit_reason, COUNT(*) FROM runs {where} GROUP BY exit_reason "
+                                                "ORDER BY COUNT(*) DESC", params).fetchall()),
+            }
+
+            report["content_types"] = {}
+            for content_type, sessions, approved, mean_drafts, mean_iterations, mean_score in db.execute(
+                    f"SELECT content_type, COUNT(*), SUM(status = 'approved'), AVG(drafts), AVG(iterations), "
+                    f"AVG(best_score) FROM runs {where} GROUP BY content_type ORDER BY COUNT(*) DESC", params):
+                report["content_types"][content_type] = {
+                    "sessions": sessions, "approved": approved, "mean_drafts": round(mean_drafts, 3),
+                    "mean_iterations": round(mean_iterations, 3), "mean_best_score": round(mean_score, 3),
+                    "median_drafts_to_approval": self._median(db, "drafts", content_type, "approved", since),
+                    "median_iterations_to_approval": self._median(db, "iterations", content_type, "approved", since),
+                }
+
+            # Rejections are grouped per session first, so each session counts once per source or reason.
+            join = f"JOIN runs USING (session_id) {where.replace('finished', 'runs.finished')}"
+            report["rejection_sources"] = [
+                {"source": source, "rejections": rejected, "sessions": sessions, "mean_drafts": round(drafts, 3),
+                 "mean_iterations": round(iterations, 3)}
+                for source, rejected, sessions, drafts, iterations in db.execute(
+                    "SELECT source, SUM(n), COUNT(*), AVG(drafts), AVG(iterations) FROM ("
+                    "SELECT source, session_id, SUM(rejections) AS n FROM rejection_counts GROUP BY source, session_id) "
+                    f"{join} GROUP BY source ORDER BY SUM(n) DESC", params)
+            ]
+            report["rejection_reasons"] = [
+                {"source": source, "category": category, "rejections": rejected, "sessions": sessions,
+                 "mean_drafts": round(drafts, 3)}
+                for source, category, rejected, sessions, drafts in db.execute(
+                    "SELECT source, category, SUM(rejections), COUNT(*), AVG(drafts) FROM rejection_counts "
+                    f"{join} GROUP BY source, category ORDER BY SUM(rejections) DESC LIMIT ?", params + (top,))
+            ]
+            report["nodes"] = {
+                node: {"runs": runs, "calls": calls, "prompt_tokens": prompt_tokens, "response_tokens": response_tokens,
+                       "seconds": round(seconds, 3), "ms_per_run": round(1000 * seconds / runs, 1) if runs else 0.0}
+                for node, runs, calls, prompt_tokens, response_tokens, seconds in db.execute(
+                    "SELECT node, SUM(node_runs.runs), SUM(node_runs.calls), SUM(node_runs.prompt_tokens), "
+                    "SUM(node_runs.response_tokens), SUM(node_runs.seconds) FROM node_runs "
+                    f"{join} GROUP BY node ORDER BY SUM(node_runs.seconds) DESC", params)
+            }
+        return report
+
+    def close(self):
+        with self._lock:
+            self._flush()
+            if self._db is not None:
+                self._db.close()
+                self._db = None
+
+
+def format_report(report):
+    """Formats a report() dict for the terminal."""
+    lines = [
+        f"{report['sessions']} sessions, {report['model_calls']} model calls, about {report['prompt_tokens']} prompt "
+        f"and {report['response_tokens']} response tokens",
+        "  outcomes: " + (", ".join(f"{status}={count}" for status, count in report["outcomes"].items()) or "none"),
+        "  exit reasons: " + (", ".join(f"{reason or 'none'}={count}"
+                                        for reason, count in report["exit_reasons"].items()) or "none"),
+        "Content types:",
+    ]
+    for content_type, entry in report["content_types"].items():
+        lines.append(f"  {content_type or 'unclassified':<14} {entry['sessions']} sessions, {entry['approved']} approved, "
+                     f"mean {entry['mean_drafts']:.2f} drafts and {entry['mean_iterations']:.1f} steps, median to "
+                     f"approval {entry['median_drafts_to_approval']:g} drafts and "
+                     f"{entry['median_iterations_to_approval']:g} steps")
+    lines.append("Rejections by source (sessions with one, and their mean drafts and steps):")
+    for entry in report["rejection_sources"]:
+        lines.append(f"  {entry['source'] or 'unknown':<20} {entry['rejections']} rejections in {entry['sessions']} "
+                     f"sessions, mean {entry['mean_drafts']:.2f} drafts and {entry['mean_iterations']:.1f} steps")
+    lines.append("Most common rejection reasons:")
+    for entry in report["rejection_reasons"]:
+        lines.append(f"  {entry['rejections']:>6}x in {entry['sessions']} sessions (mean {entry['mean_drafts']:.2f} "
+                     f"drafts): {entry['source'] or 'unknown'} {entry['category'] or 'unknown'}")
+    lines.append("Nodes:")
+    for node, entry in report["nodes"].items():
+        lines.append(f"  {node:<20} {entry['runs']} runs, {entry['ms_per_run']:.1f}ms each, {entry['calls']} calls, "
+                     f"{entry['prompt_tokens']} prompt + {entry['response_tokens']} response tokens")
+    return "\n".join(lines)
+
+
+def add_arguments(parser):
+    """Adds the report command's options to an argument parser."""
+    parser.add_argument("--history", metavar="PATH", default=HISTORY_PATH,
+                        help=f"run history store to read (default: {HISTORY_PATH})")
+    parser.add_argument("--days", type=float, help="only include sessions that finished in the last DAYS days")
+    parser.add_argument("--top", type=int, default=10, help="number of rejection reasons to list (default: 10)")
+    parser.add_argument("--json", action="store_true", help="print the report as JSON")
+
+
+def run(args):
+    """Prints a report over the run history from parsed command line arguments."""
+    if not os.path.exists(args.history):
+        print(f"No run history at {args.history} yet.")
+        return
+    store = RunHistory(args.history)
+    try:
+        since = time.time() - args.days * 86400 if args.days else None
+        report = store.report(since=since, top=args.top)
+    finally:
+        store.close()
+    print(json.dumps(report, indent=2) if args.json else format_report(report))
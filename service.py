@@ -0,0 +1,473 @@
+import argparse
+import asyncio
+import json
+import math
+import re
+import signal
+import sys
+import time
+import urllib.parse
+import urllib.request
+from collections import deque
+
+import cassette
+import events
+import metrics
+import model_client
+from main import (get_workflow, get_relevance_engine, get_run_history, set_client, set_response_cache, use_cassette,
+                  discard_speculation, add_budget_arguments, budget_from_args, APPROVAL_POLICIES, EXTERNAL_APPROVAL)
+from batch import job_initial_state, summarize_result
+from response_cache import ResponseCache
+
+# Requests with a larger body are refused with 413.
+MAX_BODY_BYTES = 1_000_000
+
+# Seconds a worker is assumed to spend on a job until the service has timed some, for retry hints.
+DEFAULT_JOB_SECONDS = 30.0
+
+# Seconds a finished or failed job stays available to GET /jobs/<id> and /result before it is dropped.
+FINISHED_JOB_TTL = 3600.0
+
+# Job ids chosen by the client must match this, since they end up in URLs and session ids.
+JOB_ID_PATTERN = re.compile(r"[A-Za-z0-9_.-]{1,64}")
+
+STATUS_TEXT = {200: "OK", 202: "Accepted", 400: "Bad Request", 404: "Not Found", 405: "Method Not Allowed",
+               409: "Conflict", 413: "Payload Too Large", 429: "Too Many Requests", 500: "Internal Server Error"}
+
+
+class QueueFull(Exception):
+    """The job queue has no room left; the client should retry after `retry_after` seconds."""
+
+    def __init__(self, retry_after):
+        super().__init__(f"The job queue is full. Retry in {retry_after}s.")
+        self.retry_after = retry_after
+
+
+class JobStateError(Exception):
+    """The job isn't in a state where the request makes sense, e.g. approving a running job."""
+
+
+class HTTPError(Exception):
+    def __init__(self, status, message, headers=None):
+        super().__init__(message)
+        self.status = status
+        self.headers = headers or {}
+
+
+class Job:
+    """A submitted draft job and how far its session has got."""
+
+    def __init__(self, spec, initial_state):
+        self.spec = spec  # The job as submitted, plus its id and session_id
+        self.initial_state = initial_state
+        self.status = "queued"  # queued, running, awaiting_approval, finished or error
+        self.node = None  # The last node that finished
+        self.approval = None  # What the session is waiting to have approved, while awaiting_approval
+        self.resume = None  # The approval decision the session continues with on its next run
+        self.summary = None  # summarize_result() of the session's latest state
+        self.error = None
+        self.submitted = time.time()
+        self.updated = self.submitted
+        self.elapsed = 0.0  # Seconds spent running, not counting the wait for approval
+
+    @property
+    def id(self):
+        return self.spec["id"]
+
+    def describe(self):
+        """Returns the job's status record, as served by GET /jobs/<id>."""
+        record = {
+            "id": self.id,
+            "session_id": self.spec["session_id"],
+            "status": self.status,
+            "node": self.node,
+            "submitted": round(self.submitted, 3),
+            "updated": round(self.updated, 3),
+            "elapsed_seconds": round(self.elapsed, 3),
+        }
+        if self.approval is not None:
+            record["approval"] = self.approval
+        if self.summary is not None:
+            record["session"] = self.summary
+        if self.error is not None:
+            record["error"] = self.error
+        return record
+
+    def result(self):
+        """Returns the job's final record, in the same form as a batch result line."""
+        if self.status == "error":
+            return {"id": self.id, "session_id": self.spec["session_id"], "status": "error",
+                    "error": self.error, "elapsed_seconds": round(self.elapsed, 3)}
+        return self.summary
+
+
+class JobService:
+    """Runs submitted draft jobs on a fixed pool of workers fed by a bounded queue.
+
+    When the queue is full, submissions are refused with an estimate of when to retry instead
+    of piling up. A session with the external approval policy gives up its worker while it
+    waits for a decision, and is queued again once the decision arrives.
+    """
+
+    def __init__(self, app, workers=4, queue_size=64, default_policy=EXTERNAL_APPROVAL, default_budget=None,
+                 default_persona=None, on_event=None, finished_job_ttl=FINISHED_JOB_TTL):
+        self.app = app
+        self.workers = workers
+        self.queue = asyncio.Queue(queue_size)
+        self.default_policy = default_policy
+        self.default_budget = default_budget
+        self.default_persona = default_persona
+        self.on_event = on_event
+        self.jobs = {}  # id -> Job
+        self.finished_job_ttl = finished_job_ttl
+        self.busy = 0
+        self.turn_seconds = deque(maxlen=100)  # Durations of recent worker turns, for retry hints
+        self._tasks = []
+        self._notifications = set()
+
+    def start(self):
+        self._tasks = [asyncio.create_task(self._work()) for _ in range(self.workers)]
+
+    async def stop(self):
+        """Stops the workers. Sessions they were running resume from their checkpoints next time."""
+        for task in self._tasks + list(self._notifications):
+            task.cancel()
+        await asyncio.gather(*self._tasks, *self._notifications, return_exceptions=True)
+
+    def retry_after(self):
+        """Estimates how many seconds until a worker takes the next job off the queue."""
+        turns = self.turn_seconds
+        mean = sum(turns) / len(turns) if turns else DEFAULT_JOB_SECONDS
+        return max(1, math.ceil(mean / self.workers))
+
+    def expire_jobs(self, now=None):
+        """Drops finished and failed jobs last updated more than finished_job_ttl seconds ago."""
+        cutoff = (now or time.time()) - self.finished_job_ttl
+        expired = [job_id for job_id, job in self.jobs.items()
+                   if job.status in ("finished", "error") and job.updated < cutoff]
+        for job_id in expired:
+            del self.jobs[job_id]
+        return len(expired)
+
+    def get(self, job_id):
+        self.expire_jobs()
+        if job_id not in self.jobs:
+            raise KeyError(f"No job '{job_id}'")
+        return self.jobs[job_id]
+
+    def submit(self, spec):
+        """Validates a job and queues it. Returns (job, created).
+
+        Submitting a job with the id of an existing job returns that job, so clients can retry
+        a submission safely, until the job expires (see expire_jobs). Raises ValueError or
+        KeyError for an invalid job and QueueFull when there is no room for it.
+        """
+        from checkpoints import draft_session_id, new_session_id
+
+        self.expire_jobs()
+        if not isinstance(spec, dict) or not isinstance(spec.get("draft"), str) or not spec["draft"].strip():
+            raise ValueError("A job needs a non-empty 'draft' string")
+        policy = spec.get("approval_policy", self.default_policy)
+        if policy not in APPROVAL_POLICIES and policy != EXTERNAL_APPROVAL:
+            raise ValueError(f"Unknown approval_policy '{policy}'. Use one of: "
+                             f"{', '.join(sorted(APPROVAL_POLICIES) + [EXTERNAL_APPROVAL])}")
+        webhook = spec.get("webhook")
+        if webhook is not None and urllib.parse.urlparse(str(webhook)).scheme not in ("http", "https"):
+            raise ValueError("'webhook' must be an http or https URL")
+        job_id = str(spec.get("id") or new_session_id())
+        if not JOB_ID_PATTERN.fullmatch(job_id):
+            raise ValueError("A job id may only contain letters, digits, '_', '.' and '-' (at most 64)")
+        if job_id in self.jobs:
+            return self.jobs[job_id], False
+        spec = dict(spec, id=job_id, session_id=draft_session_id(f"api-{job_id}-", spec["draft"], policy))
+        initial_state = job_initial_state(spec, self.default_policy, self.default_budget, self.default_persona)
+        if self.queue.full():
+            metrics.inc("threads_service_rejections_total", reason="queue_full")
+            raise QueueFull(self.retry_after())
+
+        job = Job(spec, initial_state)
+        self.jobs[job_id] = job
+        self.queue.put_nowait(job)
+        metrics.inc("threads_service_jobs_total")
+        return job, True
+
+    def approve(self, job_id, decision):
+        """Sends the approval decision to a job waiting for one and queues it to continue."""
+        job = self.get(job_id)
+        if job.status != "awaiting_approval":
+            raise JobStateError(f"Job '{job_id}' is {job.status}, not awaiting_approval")
+        if not isinstance(decision, dict) or not isinstance(decision.get("approved"), bool):
+            raise ValueError("An approval needs 'approved' (true or false) and, to request a revision, 'feedback'")
+        if self.queue.full():
+            metrics.inc("threads_service_rejections_total", reason="queue_full")
+            raise QueueFull(self.retry_after())
+        job.resume = {"approved": decision["approved"], "feedback": str(decision.get("feedback") or "")}
+        job.approval = None
+        job.status = "queued"
+        job.updated = time.time()
+        self.queue.put_nowait(job)
+        return job
+
+    async def _work(self):
+        while True:
+            job = await self.queue.get()
+            try:
+                await self._run(job)
+            finally:
+                self.queue.task_done()
+
+    async def _run(self, job):
+        """Runs a job's session until it finishes, fails or pauses for approval."""
+        from checkpoints import run_or_resume
+
+        def on_event(event):
+            if event["event"] == "node_finished":
+                job.node = event["node"]
+            elif event["event"] == "approval_requested":
+                job.approval = event["request"]
+            if self.on_event is not None:
+                self.on_event(event)
+
+        job.status = "running"
+        job.updated = time.time()
+        resume, job.resume = job.resume, None
+        self.busy += 1
+        started = time.perf_counter()
+        try:
+            state = await run_or_resume(self.app, job.initial_state, job.spec["session_id"], on_event=on_event,
+                                        resume=resume, history=get_run_history())
+        except Exception as e:
+            job.status = "error"
+            job.error = f"{type(e).__name__}: {e}"
+        else:
+            job.status = "awaiting_approval" if job.approval is not None else "finished"
+        finally:
+            discard_speculation(job.spec["session_id"])  # A session that failed mid-review may have left one running
+            turn = time.perf_counter() - started
+            self.busy -= 1
+            self.turn_seconds.append(turn)
+            job.elapsed += turn
+            job.updated = time.time()
+        if job.status != "error":
+            job.summary = summarize_result(job.spec, state, job.elapsed)
+        if job.status != "awaiting_approval":
+            metrics.inc("threads_service_jobs_finished_total", status=job.status)
+        if job.spec.get("webhook"):
+            task = asyncio.create_task(self._notify(job))
+            self._notifications.add(task)
+            task.add_done_callback(self._notifications.discard)
+
+    async def _notify(self, job):
+        """Posts the job's status record to its webhook.
+
+        A JSON reply with an "approved" field is taken as the decision for a job awaiting
+        approval, so a webhook can approve drafts without polling.
+        """
+        try:
+            reply = await asyncio.to_thread(post_json, job.spec["webhook"], job.describe())
+        except Exception as e:
+            print(f"Webhook for job {job.id} failed: {type(e).__name__}: {e}", file=sys.stderr)
+            metrics.inc("threads_service_webhook_failures_total")
+            return
+        if job.status == "awaiting_approval" and isinstance(reply, dict) and "approved" in reply:
+            try:
+                self.approve(job.id, reply)
+            except (ValueError, QueueFull, JobStateError) as e:
+                print(f"Ignoring the webhook's decision for job {job.id}: {e}", file=sys.stderr)
+
+    def health(self):
+        counts = {}
+        for job in self.jobs.values():
+            counts[job.status] = counts.get(job.status, 0) + 1
+        return {"workers": self.workers, "busy": self.busy, "queued": self.queue.qsize(),
+                "queue_size": self.queue.maxsize, "jobs": counts}
+
+
+def post_json(url, payload, timeout=10):
+    """POSTs a JSON payload and returns the decoded JSON reply, or None if the reply isn't JSON."""
+    request = urllib.request.Request(url, data=json.dumps(payload).encode("utf-8"), method="POST",
+                                     headers={"Content-Type": "application/json"})
+    with urllib.request.urlopen(request, timeout=timeout) as response:
+        body = response.read()
+    try:
+        return json.loads(body) if body else None
+    except ValueError:
+        return None
+
+
+def handle_request(service, method, path, body):
+    """Routes one request to the service. Returns (status, JSON payload, extra headers)."""
+    path = urllib.parse.urlparse(path).path.rstrip("/")
+    parts = path.split("/")[1:]
+
+    def parse_body():
+        try:
+            return json.loads(body or b"null")
+        except ValueError:
+            raise HTTPError(400, "The request body is not valid JSON")
+
+    def allow(*methods):
+        if method not in methods:
+            raise HTTPError(405, f"Use {' or '.join(methods)} for {path}", {"Allow": ", ".join(methods)})
+
+    try:
+        if parts == ["health"]:
+            allow("GET")
+            return 200, service.health(), {}
+        if parts == ["jobs"]:
+            allow("POST")
+            job, created = service.submit(parse_body())
+            return (202 if created else 200), job.describe(), {"Location": f"/jobs/{job.id}"}
+        if len(parts) == 2 and parts[0] == "jobs":
+            allow("GET")
+            return 200, service.get(parts[1]).describe(), {}
+        if len(parts) == 3 and parts[0] == "jobs" and parts[2] == "result":
+            allow("GET")
+            job = service.get(parts[1])
+            if job.status in ("finished", "error"):
+                return 200, job.result(), {}
+            return 202, job.describe(), {"Retry-After": str(service.retry_after())}
+        if len(parts) == 3 and parts[0] == "jobs" and parts[2] == "approval":
+            allow("POST")
+            return 202, service.approve(parts[1], parse_body()).describe(), {}
+        raise HTTPError(404, f"Nothing at {path or '/'}")
+    except QueueFull as e:
+        return 429, {"error": str(e), "retry_after": e.retry_after}, {"Retry-After": str(e.retry_after)}
+    except HTTPError as e:
+        return e.status, {"error": str(e)}, e.headers
+    except KeyError as e:
+        return (404 if parts[:1] == ["jobs"] and len(parts) > 1 else 400), {"error": e.args[0]}, {}
+    except JobStateError as e:
+        return 409, {"error": str(e)}, {}
+    except ValueError as e:
+        return 400, {"error": str(e)}, {}
+
+
+async def read_request(reader):
+    """Reads one HTTP/1.1 request. Returns (method, path, body)."""
+    request_line = (await reader.readline()).decode("latin-1").strip()
+    try:
+        method, path, _ = request_line.split(" ", 2)
+    except ValueError:
+        raise HTTPError(400, "Malformed request line")
+    headers = {}
+    while True:
+        line = await reader.readline()
+        if line in (b"\r\n", b"\n", b""):
+            break
+        name, _, value = line.decode("latin-1").partition(":")
+        headers[name.strip().lower()] = value.strip()
+    try:
+        length = int(headers.get("content-length", 0))
+    except ValueError:
+        raise HTTPError(400, "Invalid Content-Length")
+    if length > MAX_BODY_BYTES:
+        raise HTTPError(413, f"Request bodies are limited to {MAX_BODY_BYTES} bytes")
+    body = await reader.readexactly(length) if length > 0 else b""
+    return method.upper(), path, body
+
+
+async def handle_connection(service, reader, writer):
+    """Serves one request per connection."""
+    try:
+        try:
+            method, path, body = await asyncio.wait_for(read_request(reader), timeout=30)
+            status, payload, headers = handle_request(service, method, path, body)
+        except HTTPError as e:
+            status, payload, headers = e.status, {"error": str(e)}, e.headers
+        except (asyncio.TimeoutError, asyncio.IncompleteReadError, ConnectionError):
+            return
+        except Exception as e:
+            status, payload, headers = 500, {"error": f"{type(e).__name__}: {e}"}, {}
+        metrics.inc("threads_service_requests_total", status=str(status))
+        content = (json.dumps(payload) + "\n").encode("utf-8")
+        head = [f"HTTP/1.1 {status} {STATUS_TEXT.get(status, '')}", "Content-Type: application/json",
+                f"Content-Length: {len(content)}", "Connection: close"]
+        head += [f"{name}: {value}" for name, value in headers.items()]
+        writer.write(("\r\n".join(head) + "\r\n\r\n").encode("latin-1") + content)
+        await writer.drain()
+    finally:
+        writer.close()
+
+
+async def serve(args, on_event=None):
+    """Runs the job service until it is cancelled or the process gets SIGTERM."""
+    from checkpoints import checkpointed_app
+
+    try:
+        # SIGTERM cancels the service like Ctrl-C, so buffered run history is written on the way out.
+        asyncio.get_running_loop().add_signal_handler(signal.SIGTERM, asyncio.current_task().cancel)
+    except NotImplementedError:  # Windows event loops have no signal handlers
+        pass
+
+    async with checkpointed_app(get_workflow(), args.checkpoints) as app:
+        service = JobService(app, args.workers, args.queue_size, args.policy, budget_from_args(args), args.persona,
+                             on_event)
+        service.start()
+        server = await asyncio.start_server(lambda reader, writer: handle_connection(service, reader, writer),
+                                            args.host, args.port)
+        print(f"Serving draft jobs on http://{args.host}:{args.port} with {args.workers} workers "
+              f"and room for {args.queue_size} queued jobs", file=sys.stderr)
+        try:
+            async with server:
+                await server.serve_forever()
+        finally:
+            await service.stop()
+            get_run_history().flush()
+
+
+def add_arguments(parser):
+    """Adds the job service options to an argument parser."""
+    parser.add_argument("--host", default="127.0.0.1", help="Address to listen on (default: 127.0.0.1)")
+    parser.add_argument("--port", type=int, default=8080, help="Port to listen on (default: 8080)")
+    parser.add_argument("-w", "--workers", type=int, default=4, help="Number of sessions to run at once")
+    parser.add_argument("--queue-size", type=int, default=64,
+                        help="Jobs that may wait for a worker before submissions get 429 (default: 64)")
+    parser.add_argument("--policy", default=EXTERNAL_APPROVAL, choices=sorted(APPROVAL_POLICIES) + [EXTERNAL_APPROVAL],
+                        help="Approval policy for jobs that don't set one (default: external, "
+                             "i.e. approved through the API or a webhook)")
+    parser.add_argument("--persona", metavar="ID", help="Persona for jobs that don't name one")
+    parser.add_argument("--checkpoints", metavar="PATH", help="Checkpoint database (default: THREADS_CHECKPOINT_PATH)")
+    parser.add_argument("--fake", action="store_true",
+                        help="answer model calls with the offline fake model instead of Gemini, for local testing")
+    parser.add_argument("--fake-latency", type=float, default=0.05, help="Mean fake model latency in seconds")
+    add_budget_arguments(parser)
+    metrics.add_arguments(parser)
+    model_client.add_arguments(parser)
+    cassette.add_arguments(parser)
+    events.add_arguments(parser)
+
+
+def run(args):
+    """Runs the job service from parsed command line arguments."""
+    metrics.configure(args)
+    model_client.configure(args)
+    if args.fake:
+        from fake_backend import FakeModel, fake_client
+
+        set_client(fake_client(FakeModel(latency=args.fake_latency)))
+        set_response_cache(ResponseCache(":memory:"))
+    recorder = use_cassette(args)
+    get_relevance_engine()  # Loads scikit-learn now rather than in the first job
+    sink = events.JsonlSink(args.events) if args.events else None
+    try:
+        asyncio.run(serve(args, sink))
+    except (KeyboardInterrupt, asyncio.CancelledError):
+        pass
+    finally:
+        metrics.finish(args)
+        get_run_history().close()
+        if recorder is not None:
+            recorder.close()
+        if sink is not None:
+            sink.close()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Serve draft jobs over HTTP.")
+    add_arguments(parser)
+    run(parser.parse_args(argv))
+
+
+if __name__ == "__main__":
+    main()
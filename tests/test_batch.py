@@ -0,0 +1,89 @@
+import asyncio
+import io
+import json
+
+import pytest
+
+pytest.importorskip("langgraph")
+pytest.importorskip("sklearn")
+
+from batch import read_jobs, run_batch
+from classifier import ContentClassifier
+from fake_backend import FakeModel, fake_client
+from main import DEFAULT_CONTENT_TYPE, set_client, set_content_classifier, set_response_cache, set_run_history
+from response_cache import ResponseCache
+from run_history import RunHistory
+
+
+@pytest.fixture(autouse=True)
+def offline():
+    set_client(fake_client(FakeModel(seed=1)))
+    set_response_cache(ResponseCache(":memory:"))
+    classifier = ContentClassifier(path=None)
+    classifier.enabled = False
+    set_content_classifier(classifier)
+    set_run_history(RunHistory(":memory:"))
+
+
+def write_jobs(path, *jobs):
+    path.write_text("".join(json.dumps(job) + "\n" for job in jobs), encoding="utf-8")
+
+
+def run_file(path, checkpoint_path):
+    output = io.StringIO()
+    asyncio.run(run_batch(read_jobs(str(path)), output, checkpoint_path=str(checkpoint_path)))
+    return [json.loads(line) for line in output.getvalue().splitlines()]
+
+
+def test_rerun_of_changed_jobs_file_starts_new_sessions(tmp_path):
+    jobs, checkpoints = tmp_path / "jobs.jsonl", tmp_path / "checkpoints.sqlite3"
+    write_jobs(jobs, {"id": "a", "draft": "Shipped the new parser today."})
+    first, = run_file(jobs, checkpoints)
+    write_jobs(jobs, {"id": "a", "draft": "Fixed a memory leak in the cache."})
+    second, = run_file(jobs, checkpoints)
+
+    assert second["status"] != "error", second
+    assert second["session_id"] != first["session_id"]
+    assert second["versions"][0] == "Fixed a memory leak in the cache."
+
+
+def test_rerun_of_same_jobs_file_reuses_sessions(tmp_path):
+    jobs, checkpoints = tmp_path / "jobs.jsonl", tmp_path / "checkpoints.sqlite3"
+    write_jobs(jobs, {"id": "a", "draft": "Shipped the new parser today."})
+    first, = run_file(jobs, checkpoints)
+    second, = run_file(jobs, checkpoints)
+
+    assert second["session_id"] == first["session_id"]
+    assert second["draft"] == first["draft"]
+
+
+def test_explicit_session_of_another_draft_is_refused(tmp_path):
+    jobs, checkpoints = tmp_path / "jobs.jsonl", tmp_path / "checkpoints.sqlite3"
+    write_jobs(jobs, {"id": "a", "session_id": "mine", "draft": "Shipped the new parser today."})
+    run_file(jobs, checkpoints)
+    write_jobs(jobs, {"id": "a", "session_id": "mine", "draft": "Fixed a memory leak in the cache."})
+    record, = run_file(jobs, checkpoints)
+
+    assert record["status"] == "error"
+    assert "different draft" in record["error"]
+
+
+def test_session_stops_at_its_iteration_budget_within_the_recursion_limit(tmp_path):
+    jobs, checkpoints = tmp_path / "jobs.jsonl", tmp_path / "checkpoints.sqlite3"
+    write_jobs(jobs, {"id": "a", "draft": "Shipped the new parser today.", "budget": {"max_iterations": 3}})
+    record, = run_file(jobs, checkpoints)
+
+    assert record["status"] == "budget_exhausted", record
+    assert record["exit_reason"] == "iteration_limit"
+
+
+def test_unreadable_classification_falls_back_instead_of_asking_again(tmp_path):
+    model = FakeModel(seed=1, script={"content_classifier": ["I can't tell which category this is."]})
+    set_client(fake_client(model))
+    jobs, checkpoints = tmp_path / "jobs.jsonl", tmp_path / "checkpoints.sqlite3"
+    write_jobs(jobs, {"id": "a", "draft": "Shipped the new parser today."})
+    record, = run_file(jobs, checkpoints)
+
+    assert record["status"] != "error", record
+    assert record["content_type"] == DEFAULT_CONTENT_TYPE
+    assert sum(count for (_, node), count in model.calls.items() if node == "content_classifier") == 1
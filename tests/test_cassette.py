@@ -0,0 +1,67 @@
+import asyncio
+
+import pytest
+
+import metrics
+from cassette import RecordingClient, ReplayClient
+from model_client import CallFailed, DeadlineExceeded
+
+
+class ScriptedClient:
+    """Answers calls in order from a list, raising the entries that are exceptions."""
+
+    def __init__(self, outcomes):
+        self.outcomes = list(outcomes)
+
+    async def generate(self, prompt, prefix="", on_text=None, schema=None, settings=None, speculative=False):
+        outcome = self.outcomes.pop(0)
+        if isinstance(outcome, Exception):
+            raise outcome
+        return outcome, {"prompt_tokens": 7, "response_tokens": 3}
+
+
+async def calls(client, count):
+    """Makes `count` calls from one session and node, returning each response or exception type."""
+    metrics.current_session.set("s1")
+    metrics.current_node.set("editor")
+    results = []
+    for index in range(count):
+        try:
+            results.append(await client.generate(f"prompt {index}", prefix="prefix"))
+        except Exception as e:
+            results.append(type(e))
+    return results
+
+
+def test_failed_calls_replay_at_the_same_point(tmp_path):
+    path = str(tmp_path / "calls.cassette.jsonl")
+    recorder = RecordingClient(ScriptedClient([DeadlineExceeded("late"), CallFailed("down"), '{"ok": 1}']), path)
+    recorded = asyncio.run(calls(recorder, 3))
+    recorder.close()
+    assert recorded[:2] == [DeadlineExceeded, CallFailed]
+
+    replayed = asyncio.run(calls(ReplayClient(path), 3))
+    assert replayed == recorded
+
+
+def test_unexpected_errors_are_not_recorded(tmp_path):
+    path = str(tmp_path / "calls.cassette.jsonl")
+    recorder = RecordingClient(ScriptedClient([RuntimeError("bug")]), path)
+    assert asyncio.run(calls(recorder, 1)) == [RuntimeError]
+    recorder.close()
+    assert recorder.counts == {}
+
+
+def test_replay_without_recorded_call_fails(tmp_path):
+    path = str(tmp_path / "calls.cassette.jsonl")
+    recorder = RecordingClient(ScriptedClient(['{"ok": 1}']), path)
+    asyncio.run(calls(recorder, 1))
+    recorder.close()
+    with pytest.raises(Exception, match="no call 2"):
+        async def two():
+            metrics.current_session.set("s1")
+            metrics.current_node.set("editor")
+            client = ReplayClient(path)
+            await client.generate("prompt 0", prefix="prefix")
+            await client.generate("prompt 1", prefix="prefix")
+        asyncio.run(two())
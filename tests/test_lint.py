@@ -0,0 +1,73 @@
+import pytest
+
+from lint import MAX_CHARACTERS, MIN_CHARACTERS, lint, lint_feedback
+
+
+def padded(text):
+    """Pads a draft with plain sentences to a length the length rules accept."""
+    filler = " Plain words fill the rest of this draft."
+    while len(text) < MIN_CHARACTERS:
+        text += filler
+    return text[:MAX_CHARACTERS]
+
+
+def rules(draft):
+    return [name for name, _ in lint(draft)]
+
+
+def test_clean_draft_passes():
+    assert lint(padded("Shipping a small fix today.")) == []
+
+
+def test_length_rules():
+    assert lint("Too short.", ["too_short"]) == [("too_short", MIN_CHARACTERS - len("Too short."))]
+    assert rules("x" * (MAX_CHARACTERS + 3)) == ["too_long"]
+
+
+@pytest.mark.parametrize("text", [
+    "Read more at https://example.org/post today.",
+    "Details on www.example.org for anyone curious.",
+    "The write-up is on example.com/notes now.",
+    "Our docs moved to GitHub.com last week.",
+])
+def test_links_are_flagged(text):
+    assert "link" in rules(padded(text))
+
+
+@pytest.mark.parametrize("text", [
+    "I moved the build from Node.js/Deno to Next.js/React.",
+    "Porting ASP.NET/Blazor apps is slower than I hoped.",
+    "Version 2.0 shipped, e.g. faster builds.",
+])
+def test_product_names_are_not_links(text):
+    assert "link" not in rules(padded(text))
+
+
+@pytest.mark.parametrize("ending", ["Is it worth it?", "Is it worth it? (I think so)", "Is it worth it? 🚀🔥",
+                                    "Is it worth it? (I think so) 🚀"])
+def test_question_at_end(ending):
+    assert "question_not_at_end" not in rules(padded("Rewrote the parser.")[:MIN_CHARACTERS] + " " + ending)
+
+
+def test_question_followed_by_text():
+    draft = padded("Is it worth it? Let me know below.")
+    assert ("question_not_at_end", draft[draft.index("?") + 1:].strip()) in lint(draft)
+
+
+def test_too_many_questions_and_hashtags():
+    draft = padded("Why now? Why me? Shipping #buildinpublic &#38; issue #12.")
+    found = rules(draft)
+    assert "too_many_questions" in found
+    assert [detail for name, detail in lint(draft) if name == "hashtag"] == ["#buildinpublic"]
+
+
+def test_banned_phrases_are_reported_once():
+    draft = padded("A Game-Changer release. Truly a game-changer.")
+    assert [detail for name, detail in lint(draft) if name == "banned_phrase"] == ["game-changer"]
+
+
+def test_feedback_names_each_violation():
+    draft = padded("See https://example.org #launch")
+    feedback = lint_feedback(draft, lint(draft))
+    assert "https://example.org" in feedback
+    assert "#launch" in feedback
@@ -0,0 +1,142 @@
+import asyncio
+import time
+
+import pytest
+
+import model_client
+from model_client import (CallFailed, CircuitBreaker, CircuitOpenError, Deadline, GeminiClient, RateLimiter,
+                          call_deadline)
+
+
+class Response:
+    def __init__(self, text):
+        self.text = text
+        self.usage_metadata = None
+
+
+class Model:
+    """Answers with "ok" after raising the given errors, one per call."""
+
+    def __init__(self, errors=()):
+        self.errors = list(errors)
+        self.calls = 0
+
+    async def generate_content_async(self, prompt, stream=False, generation_config=None):
+        self.calls += 1
+        if self.errors:
+            raise self.errors.pop(0)
+        return Response("ok")
+
+
+def client(model, cooldown=30.0, threshold=5):
+    fast = {kind: (0.001, 0.001, attempts) for kind, (_, _, attempts) in model_client.RETRY_POLICIES.items()}
+    return GeminiClient(model, RateLimiter(10_000, 10_000_000, request_burst=100), retry_policies=fast,
+                        breaker=CircuitBreaker(threshold=threshold, cooldown=cooldown))
+
+
+def run(coroutine, deadline=None):
+    async def main():
+        call_deadline.set(deadline)
+        return await coroutine
+    return asyncio.run(main())
+
+
+def test_breaker_opens_after_threshold_and_closes_after_trial():
+    breaker = CircuitBreaker(threshold=2, cooldown=0.05)
+    breaker.failure()
+    breaker.check()
+    breaker.failure()
+    with pytest.raises(CircuitOpenError) as opened:
+        breaker.check()
+    assert 0 < opened.value.retry_after <= 0.05
+    time.sleep(0.06)
+    breaker.check()  # The trial call may go ahead
+    with pytest.raises(CircuitOpenError):
+        breaker.check()  # But only one at a time
+    breaker.success()
+    breaker.check()
+    assert breaker.opened is None
+
+
+def test_failed_trial_reopens_the_circuit():
+    breaker = CircuitBreaker(threshold=1, cooldown=0.05)
+    breaker.failure()
+    time.sleep(0.06)
+    breaker.check()
+    breaker.failure()
+    with pytest.raises(CircuitOpenError):
+        breaker.check()
+
+
+def test_call_waits_for_an_open_circuit_within_the_deadline():
+    gemini = client(Model(), cooldown=0.05)
+    gemini.breaker.opened = time.monotonic()
+    started = time.monotonic()
+    text, _ = run(gemini.generate("prompt"), Deadline(5.0))
+    assert text == "ok"
+    assert time.monotonic() - started >= 0.04
+
+
+def test_call_fails_when_the_circuit_outlasts_the_deadline():
+    gemini = client(Model(), cooldown=30.0)
+    gemini.breaker.opened = time.monotonic()
+    with pytest.raises(CallFailed):
+        run(gemini.generate("prompt"), Deadline(0.5))
+
+
+def test_server_errors_are_retried():
+    exceptions = pytest.importorskip("google.api_core.exceptions")
+    model = Model([exceptions.ServiceUnavailable("busy"), exceptions.InternalServerError("oops")])
+    text, usage = run(client(model).generate("prompt"))
+    assert text == "ok"
+    assert model.calls == 3
+    assert usage["response_tokens"] > 0
+
+
+def test_exhausted_retries_raise_call_failed():
+    exceptions = pytest.importorskip("google.api_core.exceptions")
+    attempts = model_client.RETRY_POLICIES["server"][2]
+    model = Model([exceptions.ServiceUnavailable("busy")] * attempts)
+    with pytest.raises(CallFailed) as failed:
+        run(client(model, threshold=100).generate("prompt"))
+    assert isinstance(failed.value.__cause__, exceptions.ServiceUnavailable)
+    assert model.calls == attempts
+
+
+def test_errors_retrying_cannot_help_are_raised_at_once():
+    exceptions = pytest.importorskip("google.api_core.exceptions")
+    model = Model([exceptions.InvalidArgument("bad request")])
+    with pytest.raises(exceptions.InvalidArgument):
+        run(client(model).generate("prompt"))
+    assert model.calls == 1
+
+
+class SlowFirstModel(Model):
+    """Answers the first call after a long delay and later calls at once."""
+
+    async def generate_content_async(self, prompt, stream=False, generation_config=None):
+        self.calls += 1
+        if self.calls == 1:
+            await asyncio.sleep(1.0)
+        return Response("ok")
+
+
+def test_hedged_duplicate_is_settled_and_charged_when_the_primary_is_slow():
+    model = SlowFirstModel()
+    limiter = RateLimiter(10_000, 100_000, request_burst=100, token_burst=100_000)  # Tokens barely refill
+    gemini = GeminiClient(model, limiter, hedge_percentile=50)
+    for _ in range(gemini.latencies.min_samples):
+        gemini.latencies.add(("", False), 0.01)
+
+    started = time.monotonic()
+    text, usage = run(gemini.generate("prompt"))
+
+    assert text == "ok"
+    assert time.monotonic() - started < 0.5  # The duplicate answered; the slow primary was cancelled
+    assert model.calls == 2
+    assert usage["calls"] == 2
+    prompt_tokens = model_client.estimate_tokens("prompt")
+    assert usage["prompt_tokens"] == 2 * prompt_tokens  # The cancelled primary's prompt was sent too
+    assert usage["response_tokens"] == model_client.estimate_tokens("ok")
+    reserved = prompt_tokens + gemini.expected_output_tokens
+    assert limiter.tokens.capacity - limiter.tokens.tokens == pytest.approx(reserved + prompt_tokens, abs=1)
@@ -0,0 +1,28 @@
+from main import user
+
+
+def reviewed_state(editor_score, relevance_score, policy="strict"):
+    draft = "Shipped the new parser today. " * 16  # Within every lint rule
+    return {"draft": draft, "versions": ["Shipped a parser.", draft], "draft_count": 1, "status": "user_approval",
+            "approval_policy": policy, "editor_score": editor_score, "editor_feedback": "Open with a stronger hook.",
+            "relevance_score": relevance_score, "relevance_feedback": ""}
+
+
+def test_strict_policy_sends_a_lint_clean_draft_back_for_a_low_editor_score():
+    update = user(reviewed_state(editor_score=4, relevance_score=5))
+    assert update["status"] == "needs_revision"
+    assert "Open with a stronger hook." in update["editor_feedback"]
+    assert update["rejections"] == {"strict_policy": {"editor_score": 1}}
+
+
+def test_strict_policy_names_every_failed_check_in_the_category():
+    update = user(reviewed_state(editor_score=4, relevance_score=3))
+    assert update["rejections"] == {"strict_policy": {"editor_score+relevance_score": 1}}
+
+
+def test_strict_policy_approves_a_top_scored_draft():
+    assert user(reviewed_state(editor_score=5, relevance_score=0))["status"] == "approved"
+
+
+def test_auto_approve_policy_approves_what_the_review_passed():
+    assert user(reviewed_state(editor_score=4, relevance_score=3, policy="auto_approve"))["status"] == "approved"
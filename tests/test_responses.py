@@ -0,0 +1,39 @@
+import pytest
+
+from responses import SCHEMAS, ResponseError, close_truncated, parse_response
+
+
+def test_valid_response_needs_no_repair():
+    assert parse_response('{"drafts": ["a", "b"]}', SCHEMAS["writer"]) == ({"drafts": ["a", "b"]}, [])
+
+
+@pytest.mark.parametrize("text, schema, data, repairs", [
+    ('```json\n{"drafts": ["a"]}\n```', "writer", {"drafts": ["a"]}, ["code_fence"]),
+    ('Here you go: {"drafts": ["a"]} Enjoy!', "writer", {"drafts": ["a"]}, ["surrounding_text"]),
+    ('{"draft": "a"}', "writer", {"drafts": ["a"]}, ["singular_key", "array_type"]),
+    ('[{"drafts": ["a"]}]', "writer", {"drafts": ["a"]}, ["wrapped_in_list"]),
+    ('{"drafts": ["a", "half a dra', "writer", {"drafts": ["a"]}, ["truncated"]),
+    ('{"feedback": "Good", "overall_score": "4/5"}', "editor", {"feedback": "Good", "overall_score": 4},
+     ["number_type"]),
+    ('{"feedback": ["Tighten", "Shorten"], "overall_score": 3.6}', "editor",
+     {"feedback": "Tighten\nShorten", "overall_score": 4}, ["string_type", "number_type"]),
+    ('{"content_type": "Industry News"}', "content_classifier", {"content_type": "industry_news"}, ["enum_value"]),
+])
+def test_common_defects_are_repaired(text, schema, data, repairs):
+    assert parse_response(text, SCHEMAS[schema]) == (data, repairs)
+
+
+@pytest.mark.parametrize("text, schema", [
+    ("No JSON here", "writer"),
+    ('{"feedback": "Good"}', "editor"),
+    ('{"feedback": "Good", "overall_score": "great"}', "editor"),
+    ('{"content_type": "recipe"}', "content_classifier"),
+    ('["a", "b"]', "writer"),
+])
+def test_unrepairable_responses_raise(text, schema):
+    with pytest.raises(ResponseError):
+        parse_response(text, SCHEMAS[schema])
+
+
+def test_close_truncated_offers_complete_and_trimmed_versions():
+    assert close_truncated('{"a": [1, 2') == ['{"a": [1, 2]}', '{"a": [1]}']
@@ -0,0 +1,84 @@
+import time
+
+import pytest
+
+from run_history import RunHistory, format_report
+
+
+def state(content_type="news", status="approved", drafts=2, iterations=8, rejections=None, nodes=None):
+    return {
+        "status": status, "exit_reason": "", "content_type": content_type, "persona_id": "default",
+        "iteration_count": iterations, "draft_count": drafts, "editor_score": 4, "best_score": 4,
+        "relevance_score": 5, "versions": ["initial", "final"], "draft": "final",
+        "usage": {"calls": 3, "prompt_tokens": 100, "response_tokens": 20, "seconds": 1.5,
+                  "nodes": nodes or {"writer": {"runs": 2, "calls": 2, "prompt_tokens": 80, "response_tokens": 15,
+                                                "seconds": 1.0}}},
+        "rejections": rejections or {},
+    }
+
+
+@pytest.fixture
+def history():
+    store = RunHistory(":memory:")
+    yield store
+    store.close()
+
+
+def test_report_aggregates_sessions(history):
+    history.add("a", state(drafts=1, iterations=5), 1.0)
+    history.add("b", state(drafts=3, iterations=9), 1.0)
+    history.add("c", state(drafts=6, iterations=7), 1.0)
+    history.add("d", state(status="budget_exhausted", drafts=9, iterations=30), 1.0)
+    report = history.report()
+    assert report["sessions"] == 4
+    assert report["outcomes"] == {"approved": 3, "budget_exhausted": 1}
+    news = report["content_types"]["news"]
+    assert news["approved"] == 3
+    assert news["median_drafts_to_approval"] == 3
+    assert news["median_iterations_to_approval"] == 7
+    assert report["nodes"]["writer"]["runs"] == 8
+    assert "news" in format_report(report)
+
+
+def test_rejections_are_grouped_by_source_and_category(history):
+    history.add("a", state(rejections={"writer_lint": {"too_long": 2, "hashtag": 1},
+                                       "editor": {"editor_score_3": 1}}), 1.0)
+    history.add("b", state(rejections={"writer_lint": {"too_long": 1}}), 1.0)
+    report = history.report()
+    assert report["rejection_sources"][0]["source"] == "writer_lint"
+    assert report["rejection_sources"][0]["rejections"] == 4
+    assert report["rejection_sources"][0]["sessions"] == 2
+    top = report["rejection_reasons"][0]
+    assert (top["source"], top["category"], top["rejections"], top["sessions"]) == ("writer_lint", "too_long", 3, 2)
+    assert "writer_lint too_long" in format_report(report)
+
+
+def test_report_since_excludes_older_sessions(history):
+    history.add("old", state(drafts=1), 1.0)
+    history.flush()
+    history._connect().execute("UPDATE runs SET finished = 0")
+    history.add("new", state(drafts=5), 1.0)
+    report = history.report(since=time.time() - 60)
+    assert report["sessions"] == 1
+    assert report["content_types"]["news"]["median_drafts_to_approval"] == 5
+
+
+def test_finishing_again_replaces_the_record(history):
+    history.add("a", state(rejections={"editor": {"editor_score_2": 1}}), 1.0)
+    history.flush()
+    history.add("a", state(rejections={"editor": {"editor_score_2": 2}}), 1.0)
+    report = history.report()
+    assert report["sessions"] == 1
+    assert report["rejection_reasons"][0]["rejections"] == 2
+
+
+def test_buffer_is_flushed_on_a_timer():
+    store = RunHistory(":memory:", batch_size=100, flush_seconds=0.05)
+    try:
+        store.add("a", state(), 1.0)
+        assert store.pending
+        time.sleep(0.3)
+        assert not store.pending
+        assert store._connect().execute("SELECT COUNT(*) FROM runs").fetchone()[0] == 1
+    finally:
+        store.close()
@@ -0,0 +1,53 @@
+import json
+
+import pytest
+
+pytest.importorskip("langgraph")
+
+from main import USER_PERSONA
+from service import JobService, handle_request
+
+
+def submit(service, job):
+    return handle_request(service, "POST", "/jobs", json.dumps(job).encode("utf-8"))
+
+
+@pytest.fixture
+def service():
+    return JobService(app=None, workers=1, queue_size=8)
+
+
+def test_valid_job_is_accepted(service):
+    status, record, _ = submit(service, {"id": "ok", "draft": "A draft", "persona": USER_PERSONA,
+                                         "budget": {"max_calls": 5}})
+    assert status == 202
+    assert record["status"] == "queued"
+
+
+@pytest.mark.parametrize("job", [
+    {"draft": "A draft", "persona": {"name": "X"}},
+    {"draft": "A draft", "persona": dict(USER_PERSONA, topics_of_interest="tech")},
+    {"draft": "A draft", "persona": 42},
+    {"draft": "A draft", "budget": {"max_calls": "lots"}},
+    {"draft": "A draft", "budget": {"max_calls": 0}},
+    {"draft": "A draft", "budget": {"max_calls": True}},
+    {"draft": "A draft", "budget": {"max_drafts": 3}},
+    {"draft": "A draft", "budget": [30]},
+    {"draft": "A draft", "budget": "lots"},
+])
+def test_invalid_job_is_refused(service, job):
+    status, record, _ = submit(service, job)
+    assert status == 400, record
+    assert record["error"]
+    assert not service.jobs
+
+
+def test_finished_jobs_expire(service):
+    submit(service, {"id": "old", "draft": "A draft"})
+    submit(service, {"id": "waiting", "draft": "A draft"})
+    service.jobs["old"].status = "finished"
+    service.jobs["waiting"].status = "awaiting_approval"
+    now = service.jobs["old"].updated + service.finished_job_ttl + 1
+    assert service.expire_jobs(now) == 1
+    assert list(service.jobs) == ["waiting"]
+    assert handle_request(service, "GET", "/jobs/old", b"")[0] == 404
@@ -0,0 +1,35 @@
+from main import (CONVERGENCE_WINDOW, EDITOR_HISTORY_SIZE, MAX_KEPT_VERSIONS, add_editor_history, add_editor_scores,
+                  add_versions)
+
+
+def reduce(reducer, updates):
+    kept = []
+    for update in updates:
+        kept = reducer(kept, update)
+    return kept
+
+
+def test_versions_keep_the_initial_draft_and_the_latest_ones():
+    versions = reduce(add_versions, [["initial"]] + [[f"draft {i}"] for i in range(10)])
+    assert len(versions) == MAX_KEPT_VERSIONS
+    assert versions[0] == "initial"
+    assert versions[-1] == "draft 9"
+
+
+def test_editor_scores_keep_the_best_earlier_score_and_the_latest_ones():
+    scores = reduce(add_editor_scores, [[score] for score in [2, 5, 3, 1, 3, 2, 3, 2]])
+    assert scores == [5] + [3, 2, 3, 2][-CONVERGENCE_WINDOW:]
+
+
+def test_short_editor_score_lists_are_kept_whole():
+    assert reduce(add_editor_scores, [[3], [2], [4]]) == [3, 2, 4]
+
+
+def test_repeated_editor_feedback_is_kept_once():
+    history = reduce(add_editor_history, [["Too long."], ["Add a hook."], ["Too long."], ["Too long."]])
+    assert history == ["Add a hook.", "Too long."]
+
+
+def test_editor_history_keeps_the_latest_reviews():
+    history = reduce(add_editor_history, [[f"Review {i}"] for i in range(10)])
+    assert history == [f"Review {i}" for i in range(10 - EDITOR_HISTORY_SIZE, 10)]
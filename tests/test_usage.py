@@ -0,0 +1,47 @@
+import asyncio
+
+import pytest
+
+pytest.importorskip("langgraph")
+
+import main
+from main import add_review_seconds, add_usage, tracked_node
+
+
+def sleeper(seconds, queued=0.0):
+    async def node(state):
+        await asyncio.sleep(seconds)
+        main._node_usage.get()["queue_seconds"] += queued  # As make_api_call adds a call's limiter wait
+        return {}
+    return node
+
+
+def apply(state, update):
+    state["usage"] = add_usage(state.get("usage"), update.get("usage"))
+    if "review_seconds" in update:
+        state["review_seconds"] = add_review_seconds(state.get("review_seconds"), update["review_seconds"])
+
+
+def test_parallel_reviews_are_charged_once_at_the_join():
+    state = {"usage": add_usage({}, {}), "budget": {}}
+
+    async def step():
+        return await asyncio.gather(tracked_node(sleeper(0.05), parallel=True)(state),
+                                    tracked_node(sleeper(0.1), parallel=True)(state))
+
+    for update in asyncio.run(step()):
+        apply(state, update)
+    assert state["usage"]["seconds"] == 0
+    apply(state, asyncio.run(tracked_node(sleeper(0.0), join=True)(state)))
+
+    assert state["usage"]["seconds"] == pytest.approx(0.1, abs=0.04)
+    assert state["review_seconds"] == 0.0
+    assert state["usage"]["nodes"][""]["runs"] == 3
+
+
+def test_time_queued_for_the_rate_limiter_is_reported_separately():
+    state = {"usage": add_usage({}, {}), "budget": {}}
+    apply(state, asyncio.run(tracked_node(sleeper(0.1, queued=0.08))(state)))
+
+    assert state["usage"]["seconds"] == pytest.approx(0.02, abs=0.03)
+    assert state["usage"]["queue_seconds"] == 0.08